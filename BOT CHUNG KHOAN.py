@@ -1,15 +1,27 @@
 import streamlit as st
-import yfinance as yf
 import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import streamlit.components.v1 as components
 import random
 import time
-from datetime import datetime, timedelta
+from fetcher import FETCHER, FetchError, FetchTimeout, load_symbol, prefetch
+from screener import parse_universe
+from engine import analyze_market, run_backtest, trades_frame, optimize_stoploss, DEFAULT_SL_LEVELS
+from charts import build_technical_figures, build_intraday_figure, build_robustness_figure, build_walkforward_figure, payload_bytes
+from robustness import robustness_test
+from walkforward import walk_forward
+from live import LiveSession, LIVE_POLL_SECONDS
+from shared_cache import DATA_CACHE
+from shared_store import SHARED_STORE
+from timeframes import TIMEFRAMES, TIMEFRAME_CACHE
+from telemetry import TELEMETRY, span, start_trace
 
 # --- CẤU HÌNH TRANG WEB ---
 st.set_page_config(layout="wide", page_title="Stock Advisor PRO", page_icon="📈")
+RUN_STARTED = time.perf_counter()   # Đo thời gian một lượt chạy lại toàn trang
+RUN_SPANS = start_trace()           # Các giai đoạn của lượt chạy này (hiện trong khung Chẩn đoán)
 
 # --- CSS TÙY CHỈNH ---
 st.markdown("""
@@ -87,6 +99,10 @@ st.markdown("""
     .bt-hold { font-size: 0.85rem; color: #FFF; background-color: rgba(255,255,255,0.1); padding: 4px 10px; border-radius: 12px; display: inline-block; margin-top: 8px; }
     .bt-divider { width: 1px; background-color: #546E7A; height: 80px; margin: 0 20px; opacity: 0.5; }
     
+    .bt-risk { display: flex; justify-content: space-around; flex-wrap: wrap; gap: 10px; background-color: #1E1E1E; border: 1px solid #444; border-radius: 10px; padding: 15px; margin-top: 10px; text-align: center; }
+    .bt-risk-item { flex: 1; min-width: 110px; }
+    .bt-risk-val { font-size: 1.4rem; font-weight: 900; color: #FFF; }
+    
     .opt-badge { background-color: #00E5FF; color: #000; padding: 2px 8px; border-radius: 4px; font-size: 0.7rem; font-weight: bold; margin-left: 5px; vertical-align: middle; box-shadow: 0 0 8px rgba(0, 229, 255, 0.4); }
 
     /* MEDIA QUERIES CHO ĐIỆN THOẠI */
@@ -100,77 +116,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- HÀM TÍNH TOÁN CHỈ BÁO ---
-def calculate_indicators(df):
-    df['SMA20'] = df['Close'].rolling(window=20).mean()
-    df['StdDev'] = df['Close'].rolling(window=20).std()
-    df['Upper'] = df['SMA20'] + (2 * df['StdDev'])
-    df['Lower'] = df['SMA20'] - (2 * df['StdDev'])
-    
-    delta = df['Close'].diff()
-    gain = (delta.where(delta > 0, 0)).fillna(0)
-    loss = (-delta.where(delta < 0, 0)).fillna(0)
-    avg_gain = gain.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    avg_loss = loss.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
-    rs = avg_gain / avg_loss
-    df['RSI'] = 100 - (100 / (1 + rs))
-    
-    df['H-L'] = df['High'] - df['Low']
-    df['H-PC'] = abs(df['High'] - df['Close'].shift(1))
-    df['L-PC'] = abs(df['Low'] - df['Close'].shift(1))
-    df['TR'] = df[['H-L', 'H-PC', 'L-PC']].max(axis=1)
-    
-    df['UpMove'] = df['High'] - df['High'].shift(1)
-    df['DownMove'] = df['Low'].shift(1) - df['Low']
-    df['+DM'] = np.where((df['UpMove'] > df['DownMove']) & (df['UpMove'] > 0), df['UpMove'], 0)
-    df['-DM'] = np.where((df['DownMove'] > df['UpMove']) & (df['DownMove'] > 0), df['DownMove'], 0)
-    
-    df['TR14'] = df['TR'].ewm(alpha=1/14, adjust=False).mean()
-    df['+DM14'] = df['+DM'].ewm(alpha=1/14, adjust=False).mean()
-    df['-DM14'] = df['-DM'].ewm(alpha=1/14, adjust=False).mean()
-    
-    df['+DI'] = 100 * (df['+DM14'] / df['TR14'])
-    df['-DI'] = 100 * (df['-DM14'] / df['TR14'])
-    df['DX'] = 100 * abs(df['+DI'] - df['-DI']) / (df['+DI'] + df['-DI'])
-    df['ADX'] = df['DX'].ewm(alpha=1/14, adjust=False).mean()
-    return df
-
-# --- HÀM TÍNH TRƯỚC TÍN HIỆU ĐỂ GIẢM TẢI CPU ---
-def precalculate_signals(df):
-    signals = np.zeros(len(df))
-    closes = df['Close'].values
-    rsis = df['RSI'].values
-    adxs = df['ADX'].values
-    lowers = df['Lower'].values
-    uppers = df['Upper'].values
-    di_plus = df['+DI'].values
-    di_minus = df['-DI'].values
-    
-    for i in range(2, len(df)):
-        price = closes[i]; rsi = rsis[i]; adx = adxs[i]
-        lower_band = lowers[i]; upper_band = uppers[i]
-        
-        buy_trigger = (price <= lower_band * 1.01) and (rsi < 30)
-        if buy_trigger:
-            if adx < 25:
-                if (di_minus[i] > di_plus[i]) and (di_minus[i] < di_minus[i-1]): signals[i] = 1 
-            elif adx > 50:
-                if (adx < adxs[i-1] < adxs[i-2]) and (di_minus[i] < di_minus[i-1] < di_minus[i-2]): signals[i] = 1
-            else: 
-                if (di_minus[i] > di_plus[i]) and (di_minus[i] < di_minus[i-1]): signals[i] = 1
-                
-        sell_trigger = (price >= upper_band * 0.99) and (rsi > 70)
-        if sell_trigger:
-            if adx < 25:
-                if (di_plus[i] > di_minus[i]) and (di_plus[i] < di_plus[i-1]): signals[i] = -1
-            elif adx > 50:
-                if (adx < adxs[i-1] < adxs[i-2]) and (di_plus[i] < di_plus[i-1] < di_plus[i-2]): signals[i] = -1
-            else:
-                if (di_plus[i] > di_minus[i]) and (di_plus[i] < di_plus[i-1]): signals[i] = -1
-                
-    df['Signal'] = signals
-    return df
-
 # --- HÀM VẼ GIAO DIỆN CHỈ SỐ ---
 def render_metric_card(label, value, delta=None, color=None):
     delta_html = ""
@@ -188,154 +133,155 @@ def render_metric_card(label, value, delta=None, color=None):
     card_html = f"<div class='metric-container'><div class='metric-label'>{label}</div><div class='metric-value-box'>{value_html}{delta_html}</div></div>"
     st.markdown(card_html, unsafe_allow_html=True)
 
-# --- LOGIC CHIẾN LƯỢC ---
-def check_signals(curr, prev, prev2):
-    price = curr['Close']; rsi = curr['RSI']; adx = curr['ADX']
-    lower_band = curr['Lower']; upper_band = curr['Upper']
-    
-    buy_trigger = (price <= lower_band * 1.01) and (rsi < 30)
-    if buy_trigger:
-        if adx < 25:
-            if (curr['-DI'] > curr['+DI']) and (curr['-DI'] < prev['-DI']): return 1 
-        elif adx > 50:
-            if (curr['ADX'] < prev['ADX'] < prev2['ADX']) and (curr['-DI'] < prev['-DI'] < prev2['-DI']): return 1
-        else: 
-            if (curr['-DI'] > curr['+DI']) and (curr['-DI'] < prev['-DI']): return 1
-            
-    sell_trigger = (price >= upper_band * 0.99) and (rsi > 70)
-    if sell_trigger:
-        if adx < 25:
-            if (curr['+DI'] > curr['-DI']) and (curr['+DI'] < prev['+DI']): return -1
-        elif adx > 50:
-            if (curr['ADX'] < prev['ADX'] < prev2['ADX']) and (curr['+DI'] < prev['+DI'] < prev2['+DI']): return -1
-        else:
-            if (curr['+DI'] > curr['-DI']) and (curr['+DI'] < prev['+DI']): return -1
-            
-    return 0
+# --- HÀM PHÂN TÍCH HIỆN TẠI (DỰNG HTML TỪ KẾT QUẢ CỦA engine.analyze_market) ---
+REC_CLASSES = {1: "bg-green", -1: "bg-red", 0: "bg-blue"}
+BAND_HTML = {
+    "inside": "trong biên độ an toàn",
+    "lower": "<span style='color:#4CAF50; font-weight:bold'>chạm dải dưới (Rẻ)</span>",
+    "upper": "<span style='color:#FF5252; font-weight:bold'>chạm dải trên (Đắt)</span>",
+}
+RSI_HTML = {
+    "neutral": "Trung tính",
+    "oversold": "<span style='color:#4CAF50; font-weight:bold'>QUÁ BÁN (Cơ hội)</span>",
+    "overbought": "<span style='color:#FF5252; font-weight:bold'>QUÁ MUA (Rủi ro)</span>",
+}
 
-# --- HÀM PHÂN TÍCH HIỆN TẠI ---
 def analyze_current_market(df):
-    if len(df) < 25: return "Không đủ dữ liệu", "NEUTRAL", "gray", "Chưa đủ dữ liệu."
-    curr = df.iloc[-1]
-    
-    signal = curr['Signal'] 
-    
-    rec, reason, color_class = "QUAN SÁT (HOLD)", "Chưa có tín hiệu giao dịch đặc biệt.", "bg-blue"
-    if signal == 1:
-        rec = "MUA NGAY"
-        reason = "Giá chạm đáy BB, RSI thấp. Các chỉ báo ADX/DI cho tín hiệu đảo chiều tăng."
-        color_class = "bg-green"
-    elif signal == -1:
-        rec = "BÁN NGAY"
-        reason = "Giá chạm đỉnh BB, RSI cao. Các chỉ báo ADX/DI cho tín hiệu đảo chiều giảm."
-        color_class = "bg-red"
-
-    trend_state = "TĂNG" if curr['+DI'] > curr['-DI'] else "GIẢM"
-    trend_strength = "YẾU (Sideway)" if curr['ADX'] < 25 else ("CỰC MẠNH" if curr['ADX'] > 50 else "TRUNG BÌNH")
-    trend_color = "#00E676" if curr['+DI'] > curr['-DI'] else "#FF5252" 
-    
-    price_pos = "trong biên độ an toàn"
-    if curr['Close'] <= curr['Lower'] * 1.01: price_pos = "<span style='color:#4CAF50; font-weight:bold'>chạm dải dưới (Rẻ)</span>"
-    elif curr['Close'] >= curr['Upper'] * 0.99: price_pos = "<span style='color:#FF5252; font-weight:bold'>chạm dải trên (Đắt)</span>"
-    
-    rsi_state = "Trung tính"
-    if curr['RSI'] < 30: rsi_state = "<span style='color:#4CAF50; font-weight:bold'>QUÁ BÁN (Cơ hội)</span>"
-    elif curr['RSI'] > 70: rsi_state = "<span style='color:#FF5252; font-weight:bold'>QUÁ MUA (Rủi ro)</span>"
+    a = analyze_market(df)
+    if not a['enough_data']: return a['recommendation'], "NEUTRAL", "gray", a['reason']
+    trend_color = "#00E676" if a['trend'] == "TĂNG" else "#FF5252"
 
     report = f"""
     <div class='report-box'>
         <div class='report-header'>📝 PHÂN TÍCH CHI TIẾT</div>
-        <div class='report-item'><span class='icon-dot'>🌊</span> <span>Xu hướng: Thị trường đang <b style='color:{trend_color}'>{trend_state}</b> với cường độ <b>{trend_strength}</b> (ADX={curr['ADX']:.1f}).</span></div>
-        <div class='report-item'><span class='icon-dot'>📍</span> <span>Vị thế giá: Giá hiện tại đang {price_pos} của Bollinger Bands.</span></div>
-        <div class='report-item'><span class='icon-dot'>🚀</span> <span>Động lượng: Chỉ số RSI đạt <b>{curr['RSI']:.1f}</b>, trạng thái {rsi_state}.</span></div>
-        <div class='report-item'><span class='icon-dot'>⚖️</span> <span>Tín hiệu ADX/DI: { "Phe Mua đang kiểm soát (+DI > -DI)" if curr['+DI'] > curr['-DI'] else "Phe Bán đang kiểm soát (-DI > +DI)" }.</span></div>
+        <div class='report-item'><span class='icon-dot'>🌊</span> <span>Xu hướng: Thị trường đang <b style='color:{trend_color}'>{a['trend']}</b> với cường độ <b>{a['trend_strength']}</b> (ADX={a['adx']:.1f}).</span></div>
+        <div class='report-item'><span class='icon-dot'>📍</span> <span>Vị thế giá: Giá hiện tại đang {BAND_HTML[a['band_position']]} của Bollinger Bands.</span></div>
+        <div class='report-item'><span class='icon-dot'>🚀</span> <span>Động lượng: Chỉ số RSI đạt <b>{a['rsi']:.1f}</b>, trạng thái {RSI_HTML[a['rsi_state']]}.</span></div>
+        <div class='report-item'><span class='icon-dot'>⚖️</span> <span>Tín hiệu ADX/DI: { "Phe Mua đang kiểm soát (+DI > -DI)" if a['plus_di'] > a['minus_di'] else "Phe Bán đang kiểm soát (-DI > +DI)" }.</span></div>
     </div>
     """
-    return rec, reason, color_class, report
-
-# --- HÀM BACKTEST THỰC THI ---
-def run_simulation(df, stop_loss_pct):
-    initial_capital = 100_000_000
-    cash = initial_capital
-    shares = 0
-    position = False
-    entry_price = 0
-    entry_date = None
-    hold_durations = [] 
-    
-    use_sl = stop_loss_pct > 0
-    if len(df) < 50: return 0, 0
-    
-    closes = df['Close'].values
-    signals = df['Signal'].values
-    dates = df.index
-    
-    for i in range(50, len(closes)):
-        price = closes[i]
-        signal = signals[i]
-        current_date = dates[i]
-        
-        if position:
-            if use_sl:
-                pct_change = (price - entry_price) / entry_price
-                if pct_change <= -(stop_loss_pct / 100.0):
-                    cash += shares * price * (1 - 0.0015)
-                    shares = 0
-                    position = False
-                    continue 
-            
-            if signal == -1: 
-                cash += shares * price * (1 - 0.0015)
-                shares = 0
-                position = False
-                days_held = (current_date - entry_date).days
-                hold_durations.append(days_held)
-                continue
-        
-        if not position and signal == 1: 
-            shares = int(cash / price)
-            if shares > 0:
-                cash -= shares * price * (1 + 0.0015)
-                entry_price = price
-                entry_date = current_date
-                position = True
-    
-    final_val = cash
-    if position: final_val += shares * closes[-1]
-    
-    total_return_pct = ((final_val - initial_capital) / initial_capital) * 100
-    days = (dates[-1] - dates[0]).days
-    years = days / 365.25 if days > 0 else 1
-    avg_annual_return = total_return_pct / years
-    avg_hold_days = sum(hold_durations) / len(hold_durations) if len(hold_durations) > 0 else 0
-    
-    return avg_annual_return, avg_hold_days
+    return a['recommendation'], a['reason'], REC_CLASSES[a['signal']], report
 
 # --- HÀM TÌM STOPLOSS TỐI ƯU ---
-def find_optimal_stoploss(df):
-    best_sl = 0.0
-    best_return = -9999.0
-    best_hold = 0.0
-    
-    progress_text = "🚀 Đang quét 21 kịch bản Stoploss (0% - 10%)..."
+def find_optimal_stoploss(df, stop_loss_levels=None):
+    levels = np.asarray(DEFAULT_SL_LEVELS if stop_loss_levels is None else stop_loss_levels, dtype=float)
+    progress_text = f"🚀 Đang quét {len(levels)} kịch bản Stoploss ({levels.min():g}% - {levels.max():g}%)..."
     my_bar = st.progress(0, text=progress_text)
-    
-    range_values = [x * 0.5 for x in range(21)]
-    total_steps = len(range_values)
-    
-    for i, sl in enumerate(range_values):
-        ret, hold = run_simulation(df, sl)
-        if ret > best_return:
-            best_return = ret
-            best_sl = sl
-            best_hold = hold
-            
-        # Hiệu ứng Progress Bar chạy mượt mà
-        my_bar.progress((i + 1) / total_steps, text=f"🔍 Đang phân tích mức Stoploss: {sl}%")
-        time.sleep(0.02) 
-        
+    result = optimize_stoploss(df, levels, progress_callback=lambda frac: my_bar.progress(min(frac, 1.0), text=progress_text))
     my_bar.empty()
-    return best_sl, best_return, best_hold
+    return result
+
+# --- KIỂM ĐỊNH ĐỘ BỀN STOPLOSS (MONTE CARLO) ---
+ROBUST_METHODS = {"block": "Bootstrap theo khối giá", "shuffle": "Xáo trộn thứ tự lệnh"}
+ROBUST_COLUMNS = {'stop_loss': "Stoploss %", 'historical': "Lịch sử %/năm", 'mean': "TB %/năm", 'p5': "P5", 'p50': "Trung vị",
+                  'p95': "P95", 'prob_loss': "Xác suất lỗ %", 'dd_median': "Sụt giảm TV %", 'dd_p5': "Sụt giảm P5 %", 'best_share': "Tốt nhất ở % đường"}
+
+def run_robustness(df, n_paths, method, block):
+    progress_text = f"🎲 Đang mô phỏng {n_paths:,} đường giá x {len(DEFAULT_SL_LEVELS)} mức Stoploss..."
+    my_bar = st.progress(0, text=progress_text)
+    result = robustness_test(df, DEFAULT_SL_LEVELS, n_paths=n_paths, method=method, block=block,
+                             progress_callback=lambda frac: my_bar.progress(min(frac, 1.0), text=progress_text))
+    my_bar.empty()
+    return result['summary']   # Chỉ giữ bảng phân phối trong phiên, bỏ mảng (đường x mức SL)
+
+def render_robustness(summary, n_paths):
+    st.plotly_chart(build_robustness_figure(summary), use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+    robust = summary.loc[summary['p50'].idxmax()]
+    st.markdown(f"Trên {n_paths:,} đường giả lập, mức có trung vị lợi nhuận cao nhất là **{robust['stop_loss']:g}%** "
+                f"({robust['p50']:+.1f}%/năm, xác suất lỗ {robust['prob_loss']:.0f}%).")
+    st.dataframe(summary[list(ROBUST_COLUMNS)].rename(columns=ROBUST_COLUMNS).round(2), use_container_width=True, hide_index=True)
+
+# --- WALK-FORWARD STOPLOSS ---
+WF_WINDOWS = {"1d": (504, 126), "1wk": (104, 26), "1mo": (24, 6)}   # (cửa sổ trong mẫu, bước) mặc định theo khung, tính bằng nến
+WF_COLUMNS = {'is_start': "Trong mẫu từ", 'oos_start': "Ngoài mẫu từ", 'oos_end': "Đến", 'stop_loss': "SL chọn %",
+              'is_return': "Trong mẫu %/năm", 'oos_return': "Ngoài mẫu %/năm", 'static_oos_return': "SL cố định %/năm"}
+
+# --- BỘ NHỚ ĐỆM KẾT QUẢ GIỮA CÁC LƯỢT CHẠY LẠI ---
+# Khóa theo (mã, phiên cuối, giá đóng cửa cuối) thay vì băm cả DataFrame (tham số _df không được băm):
+# dữ liệu mới hoặc nến phiên đang chạy đổi giá đều làm đổi khóa.
+def frame_key(df):
+    return df.index[-1], float(df['Close'].iloc[-1])
+
+def traced_cached(stage, inner_stage, fn, *args):
+    # Gọi hàm có st.cache_*: nếu span inner_stage xuất hiện trong trace thì hàm thật đã chạy (miss), không thì hit
+    start = len(RUN_SPANS)
+    with span(stage) as sp:
+        result = fn(*args)
+        sp.set(cache="miss" if any(s['stage'] == inner_stage for s in RUN_SPANS[start:]) else "hit")
+    return result
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_report(symbol, timeframe, last_bar, last_close, _df):
+    return analyze_current_market(_df)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_backtest(symbol, timeframe, last_bar, last_close, stop_loss, _df):
+    return run_backtest(_df, stop_loss)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def cached_walkforward(symbol, timeframe, last_bar, last_close, in_sample, step, _df):
+    return walk_forward(_df, DEFAULT_SL_LEVELS, in_sample, step)
+
+@st.cache_resource(max_entries=128, show_spinner=False)
+def cached_figures(symbol, last_bar, last_close, range_label, _df):
+    # Figure dùng chung (không sao chép) giữa các phiên - chỉ đọc để vẽ, không được sửa
+    figs, info = build_technical_figures(_df, range_label)
+    info['payload_kb'] = payload_bytes(figs) / 1024
+    return figs, info
+
+# --- BIỂU ĐỒ KỸ THUẬT (FRAGMENT: ĐỔI KHUNG THỜI GIAN CHỈ CHẠY LẠI PHẦN NÀY) ---
+@st.fragment
+def render_technical_charts(df, symbol, ticker):
+    t0 = time.perf_counter()
+    st.markdown(f"### 📊 Biểu đồ Kỹ Thuật ({ticker})")
+    st.caption(f"ℹ️ Điều chỉnh khung thời gian bên dưới sẽ áp dụng cho cả Biểu đồ Giá, RSI và ADX:")
+    time_tabs = st.radio("Chọn khung thời gian:", ["1 Tháng", "3 Tháng", "6 Tháng", "1 Năm", "3 Năm", "Tất cả"], horizontal=True, index=3)
+
+    # Độ phân giải tự chọn theo khung: nến tuần/tháng + đường rút gọn + WebGL cho khung dài
+    figs, chart_info = traced_cached("figures", "build_figures", cached_figures, symbol, *frame_key(df), time_tabs, df)
+    with span("render_charts", range=time_tabs):
+        st.plotly_chart(figs['price'], use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+
+        col_c1, col_c2 = st.columns(2)
+        with col_c1:
+            st.markdown("### 🚀 Chỉ số RSI")
+            st.plotly_chart(figs['rsi'], use_container_width=True, config={'scrollZoom': False})
+
+        with col_c2:
+            st.markdown("### ⚖️ Chỉ số ADX & DI")
+            st.plotly_chart(figs['adx'], use_container_width=True, config={'scrollZoom': False})
+
+    st.caption(f"🖼️ {chart_info['bars']:,} phiên → nến {chart_info['resolution'].lower()} ({chart_info['candles']:,} nến) · {chart_info['points']:,} điểm{' · WebGL' if chart_info['webgl'] else ''} · payload {chart_info['payload_kb']:,.0f} KB · dựng {chart_info['build_ms']:.0f} ms · lượt vẽ này {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+# --- CHẾ ĐỘ TRỰC TIẾP (FRAGMENT TỰ CHẠY LẠI MỖI LIVE_POLL_SECONDS GIÂY: CHỈ XIN NẾN MỚI, KHÔNG CHẠY LẠI CẢ TRANG) ---
+SIGNAL_BADGES = {1: ("MUA", "#00C853"), -1: ("BÁN", "#D50000"), 0: ("CHỜ", "#2962FF")}
+
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def render_live_intraday(df, symbol, ticker):
+    # Một phiên trực tiếp cho mã đang xem; đổi mã / dữ liệu ngày mới thì dựng lại (trạng thái chỉ báo từ khung ngày)
+    live = st.session_state.get('live')
+    if live is None or live.symbol != symbol or live.daily is not df:
+        live = st.session_state['live'] = LiveSession(symbol, df)
+    try:
+        live.tick()
+    except FetchError as e:
+        st.warning(f"📡 Lần cập nhật này lỗi, giữ dữ liệu đã có: {e.cause}")
+    bar = live.provisional()
+    if bar is None:
+        st.info("⚠️ Chưa có nến trong phiên.")
+        return
+    df_live = live.intraday()
+    st.markdown(f"### 🔴 Trực tiếp ({df_live.index[-1].strftime('%d/%m/%Y %H:%M')}) - {ticker}")
+    st.plotly_chart(build_intraday_figure(df_live, bar['prev_close']), use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+    badge, color = SIGNAL_BADGES[bar['Signal']]
+    col_l1, col_l2, col_l3, col_l4 = st.columns(4)
+    with col_l1: render_metric_card("GIÁ (TẠM TÍNH)", f"{bar['Close']:,.0f}", bar['Close'] - bar['prev_close'])
+    with col_l2: render_metric_card("RSI HÔM NAY", f"{bar['RSI']:.1f}", bar['RSI'] - live.tail['RSI'][-1])
+    with col_l3: render_metric_card("ADX HÔM NAY", f"{bar['ADX']:.1f}", bar['ADX'] - live.tail['ADX'][-1])
+    with col_l4: render_metric_card("TÍN HIỆU TẠM TÍNH", badge, color=color)
+    stats = live.stats()
+    st.caption(f"Nến ngày hôm nay gộp từ {stats['bars']} nến trong phiên, chưa đóng cửa · {stats['ticks']} lần cập nhật, "
+               f"lần này {stats['last_new']} nến mới · tổng nhận {stats['bytes_received'] / 1024:,.1f} KB")
 
 # --- GIAO DIỆN CHÍNH ---
 st.markdown("<h1 class='main-title'>STOCK ADVISOR PRO</h1>", unsafe_allow_html=True)
@@ -350,6 +296,21 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# --- DANH SÁCH THEO DÕI: TẢI NỀN VÀO BỘ NHỚ ĐỆM ---
+with st.sidebar:
+    st.markdown("### 👀 Danh sách theo dõi")
+    watchlist = parse_universe(st.text_area("Mỗi dòng một mã (tải sẵn dữ liệu ở chế độ nền):", placeholder="HPG\nVNM\nFPT", key='watchlist'))
+    jobs = st.session_state.get('prefetch_jobs', {})
+    new_symbols = [s for s in watchlist if s not in jobs]
+    if new_symbols:
+        jobs = {**jobs, **prefetch(new_symbols)}
+        st.session_state['prefetch_jobs'] = jobs
+    watched = [jobs[s] for s in watchlist if s in jobs]
+    if watched:
+        done = sum(f.done() for f in watched)
+        failed = [s for s in watchlist if s in jobs and jobs[s].done() and jobs[s].exception() is not None]
+        st.caption(f"Đã tải sẵn {done - len(failed)}/{len(watched)} mã" + (f" · lỗi: {', '.join(failed)}" if failed else ""))
+
 col1, col2, col3 = st.columns([1, 2, 1]) 
 with col2:
     with st.form(key='search_form'):
@@ -385,49 +346,44 @@ if submit_button or 'data' in st.session_state:
         try:
             if 'data' not in st.session_state or st.session_state.get('current_symbol') != symbol:
                 with st.spinner(f'Đang kết nối thị trường tải dữ liệu {ticker}...'):
-                    df_full = yf.download(symbol, period="max", interval="1d", progress=False)
+                    # Nến ngày và nến trong phiên tải song song; dữ liệu dùng chung giữa các phiên qua DATA_CACHE
+                    df_full, df_intra, intra_error = load_symbol(symbol)
                     if df_full.empty:
                         st.error(f"❌ Không tìm thấy mã **{ticker}**!")
                         st.stop()
                     
-                    if isinstance(df_full.columns, pd.MultiIndex): df_full.columns = df_full.columns.get_level_values(0)
-                    
-                    df_full = calculate_indicators(df_full)
-                    df_full = precalculate_signals(df_full) 
-                    
                     st.session_state['data'] = df_full
                     st.session_state['current_symbol'] = symbol
-                    
-                    df_intra = yf.download(symbol, period="1d", interval="5m", progress=False)
-                    if isinstance(df_intra.columns, pd.MultiIndex): df_intra.columns = df_intra.columns.get_level_values(0)
-                    if not df_intra.empty:
-                        if df_intra.index.tzinfo is None:
-                            df_intra.index = df_intra.index + timedelta(hours=7)
-                        else:
-                            df_intra.index = df_intra.index.tz_convert('Asia/Ho_Chi_Minh')
                     st.session_state['data_intra'] = df_intra
+                    st.session_state['intra_error'] = intra_error
 
             df = st.session_state['data']
             df_intra = st.session_state['data_intra']
             
+            # Khung phân tích: nến tuần / tháng lấy từ bộ nhớ đệm (cập nhật gia tăng từ nến ngày), không tải lại
+            timeframe = st.radio("Khung phân tích:", list(TIMEFRAMES), format_func=TIMEFRAMES.get, horizontal=True, key='timeframe')
+            df_tf = TIMEFRAME_CACHE.get(symbol, timeframe, df)
+
             # Tính toán khuyến nghị hiện tại
-            rec, reason, bg_class, report = analyze_current_market(df)
+            rec, reason, bg_class, report = traced_cached("report", "analyze_market", cached_report, symbol, timeframe, *frame_key(df_tf), df_tf)
             curr = df.iloc[-1]; prev = df.iloc[-2]
 
             # --- BLOCK 2: BACKTEST VÀ TỐI ƯU ---
-            user_return, user_hold = run_simulation(df, stop_loss_input)
+            bt = traced_cached("backtest", "run_backtest", cached_backtest, symbol, timeframe, *frame_key(df_tf), stop_loss_input, df_tf)
+            user_return, user_hold = bt['metrics']['annual_return'], bt['metrics']['avg_hold_days']
             
-            if 'opt_sl' not in st.session_state or st.session_state.get('opt_symbol') != symbol:
-                opt_sl, opt_return, opt_hold = find_optimal_stoploss(df)
-                st.session_state['opt_sl'] = opt_sl
-                st.session_state['opt_return'] = opt_return
-                st.session_state['opt_hold'] = opt_hold
-                st.session_state['opt_symbol'] = symbol
-            else:
-                opt_sl = st.session_state['opt_sl']
-                opt_return = st.session_state['opt_return']
-                opt_hold = st.session_state['opt_hold']
-
+            # Stoploss tối ưu nhớ theo (mã, khung, phiên cuối): đổi qua lại giữa các khung không quét lại
+            opt_results = st.session_state.setdefault('opt_results', {})
+            opt_key = (symbol, timeframe) + frame_key(df_tf)
+            if opt_key not in opt_results: opt_results[opt_key] = find_optimal_stoploss(df_tf)
+            opt_sl, opt_return, opt_hold = opt_results[opt_key]
+
+        except FetchTimeout as e:
+            st.error(f"⏱️ Máy chủ dữ liệu không phản hồi khi tải **{ticker}** (quá {FETCHER.timeout:g}s, đã thử {e.attempts} lần). Vui lòng thử lại sau.")
+            has_error = True
+        except FetchError as e:
+            st.error(f"📡 Không tải được dữ liệu **{ticker}** sau {e.attempts} lần thử: {e.cause}")
+            has_error = True
         except Exception as e:
             st.error(f"Lỗi xử lý dữ liệu: {e}")
             has_error = True
@@ -460,22 +416,75 @@ if submit_button or 'data' in st.session_state:
                 </div>
             </div>
             """
-            st.markdown(html_box, unsafe_allow_html=True)
+            m = bt['metrics']
+            risk_html = f"""
+            <div class='bt-risk'>
+                <div class='bt-risk-item'><div class='bt-label'>Sụt giảm tối đa</div><div class='bt-risk-val' style='color:#FF5252'>{m['max_drawdown']:.1f}%</div></div>
+                <div class='bt-risk-item'><div class='bt-label'>Sharpe</div><div class='bt-risk-val'>{m['sharpe']:.2f}</div></div>
+                <div class='bt-risk-item'><div class='bt-label'>Thời gian có vị thế</div><div class='bt-risk-val'>{m['exposure']:.0f}%</div></div>
+                <div class='bt-risk-item'><div class='bt-label'>Tỷ lệ thắng</div><div class='bt-risk-val'>{m['win_rate']:.0f}% <span class='bt-note'>({m['trades']} lệnh)</span></div></div>
+            </div>
+            """
+            col_bt, col_eq = st.columns([1, 1])
+            with col_bt:
+                st.markdown(html_box + risk_html, unsafe_allow_html=True)
+            with col_eq:
+                # Đường vốn và mức sụt giảm của kịch bản Stoploss người dùng chọn
+                fig_eq = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.65, 0.35], vertical_spacing=0.05)
+                fig_eq.add_trace(go.Scatter(x=df_tf.index, y=bt['equity'] / 1e6, line=dict(color='#00E5FF', width=1.5), name="Vốn (triệu VND)"), row=1, col=1)
+                fig_eq.add_trace(go.Scatter(x=df_tf.index, y=bt['drawdown'], line=dict(color='#FF5252', width=1), fill='tozeroy', fillcolor='rgba(255,82,82,0.2)', name="Sụt giảm %"), row=2, col=1)
+                fig_eq.update_layout(height=380, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=30, b=10), showlegend=False, title=dict(text=f"📈 Đường vốn & Sụt giảm (SL {sl_text_user})", font=dict(size=14)))
+                fig_eq.update_xaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+                fig_eq.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+                st.plotly_chart(fig_eq, use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+            if len(bt['trades']):
+                with st.expander(f"📒 Nhật ký lệnh ({len(bt['trades'])} lệnh)"):
+                    st.dataframe(trades_frame(df_tf, bt['trades']), use_container_width=True, hide_index=True)
+
+            # Stoploss tối ưu chỉ dựa trên MỘT đường giá lịch sử: kiểm tra lại trên các đường giá giả lập (chạy khi bấm nút)
+            with st.expander("🎲 Kiểm định độ bền Stoploss (Monte Carlo)"):
+                c_paths, c_method, c_block = st.columns(3)
+                with c_paths: n_paths = st.select_slider("Số đường giá", options=[1_000, 2_000, 5_000, 10_000], value=2_000, key='robust_paths')
+                with c_method: method = st.radio("Phương pháp", list(ROBUST_METHODS), format_func=ROBUST_METHODS.get, key='robust_method')
+                with c_block: block = st.number_input("Độ dài khối (phiên)", min_value=5, max_value=120, value=20, step=5, key='robust_block', disabled=method != "block")
+                robust_results = st.session_state.setdefault('robust_results', {})
+                robust_key = (symbol, timeframe) + frame_key(df_tf) + (n_paths, method, block)
+                if robust_key not in robust_results and st.button("▶️ Chạy kiểm định", key='robust_run'):
+                    robust_results[robust_key] = run_robustness(df_tf, n_paths, method, block)
+                if robust_key in robust_results: render_robustness(robust_results[robust_key], n_paths)
+
+            # Stoploss chọn lại trên từng cửa sổ trong mẫu, chấm điểm trên cửa sổ ngoài mẫu kế tiếp (không nhìn trước)
+            with st.expander("🔁 Walk-forward Stoploss"):
+                wf_in, wf_step = WF_WINDOWS[timeframe]
+                c_in, c_step = st.columns(2)
+                with c_in: in_sample = st.number_input("Cửa sổ trong mẫu (nến)", min_value=20, max_value=5000, value=wf_in, step=wf_step, key=f'wf_in_{timeframe}')
+                with c_step: wf_step = st.number_input("Bước / cửa sổ ngoài mẫu (nến)", min_value=5, max_value=1000, value=wf_step, step=max(1, wf_step // 2), key=f'wf_step_{timeframe}')
+                wf = traced_cached("walkforward", "walk_forward", cached_walkforward, symbol, timeframe, *frame_key(df_tf), int(in_sample), int(wf_step), df_tf)
+                if wf is None:
+                    st.info(f"⚠️ Cần hơn {int(in_sample) + 50} nến để chạy walk-forward.")
+                else:
+                    wm = wf['metrics']
+                    c1, c2, c3 = st.columns(3)
+                    c1.metric("Walk-forward (ngoài mẫu)", f"{wm['oos_annual_return']:+.1f}%/năm", f"{wm['windows']} cửa sổ, đổi SL {wm['changes']} lần", delta_color="off")
+                    c2.metric(f"SL cố định {wm['static_stoploss']:g}% (nhìn trước)", f"{wm['static_oos_annual_return']:+.1f}%/năm")
+                    c3.metric("SL đang áp dụng", f"{wm['last_stoploss']:g}%" if wm['last_stoploss'] > 0 else "OFF")
+                    st.plotly_chart(build_walkforward_figure(wf), use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+                    st.dataframe(wf['windows'].round({'is_return': 2, 'oos_return': 2, 'static_oos_return': 2}).rename(columns=WF_COLUMNS), use_container_width=True, hide_index=True)
             st.markdown(report, unsafe_allow_html=True)
             st.markdown("<br>", unsafe_allow_html=True)
             
-            # Biểu đồ Intraday
-            if not df_intra.empty:
+            # Biểu đồ Intraday: tĩnh (tải một lần khi mở mã) hoặc trực tiếp (chỉ tải nến mới theo chu kỳ)
+            live_mode = st.toggle(f"🔴 Trực tiếp (cập nhật mỗi {LIVE_POLL_SECONDS:g}s)", key='live_mode')
+            if live_mode:
+                st.divider()
+                render_live_intraday(df, symbol, ticker)
+            elif not df_intra.empty:
                 st.divider()
                 latest_date = df_intra.index[0].strftime('%d/%m/%Y')
                 st.markdown(f"### ⏱️ Diễn biến giá trong ngày ({latest_date}) - {ticker}")
-                ref_price = df['Close'].iloc[-2]
-                current_price = df_intra['Close'].iloc[-1]
-                line_color = '#00E676' if current_price >= ref_price else '#FF5252'
-                fig_intra = go.Figure()
-                fig_intra.add_trace(go.Scatter(x=df_intra.index, y=df_intra['Close'], mode='lines', line=dict(color=line_color, width=2), name='Giá Intraday'))
-                fig_intra.update_layout(height=350, xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=10), xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', tickformat="%H:%M"), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
+                fig_intra = build_intraday_figure(df_intra, df['Close'].iloc[-2])
                 st.plotly_chart(fig_intra, use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+            elif st.session_state.get('intra_error') is not None: st.info(f"⚠️ Không tải được dữ liệu Intraday: {st.session_state['intra_error'].cause}")
             else: st.info("⚠️ Chưa có dữ liệu Intraday.")
 
             # Metric Cards
@@ -491,42 +500,32 @@ if submit_button or 'data' in st.session_state:
             st.divider()
             
             # Biểu đồ Kỹ thuật
-            st.markdown(f"### 📊 Biểu đồ Kỹ Thuật ({ticker})")
-            st.caption(f"ℹ️ Điều chỉnh khung thời gian bên dưới sẽ áp dụng cho cả Biểu đồ Giá, RSI và ADX:")
-            time_tabs = st.radio("Chọn khung thời gian:", ["1 Tháng", "3 Tháng", "6 Tháng", "1 Năm", "3 Năm", "Tất cả"], horizontal=True, index=3)
-            
-            df_chart = df.copy()
-            if time_tabs == "1 Tháng": df_chart = df.iloc[-22:]
-            elif time_tabs == "3 Tháng": df_chart = df.iloc[-66:]
-            elif time_tabs == "6 Tháng": df_chart = df.iloc[-132:]
-            elif time_tabs == "1 Năm": df_chart = df.iloc[-252:]
-            elif time_tabs == "3 Năm": df_chart = df.iloc[-756:]
-
-            fig1 = go.Figure()
-            fig1.add_trace(go.Scatter(x=df_chart.index, y=df_chart['Upper'], line=dict(color='rgba(255,255,255,0.5)', width=1, dash='dash'), name="Upper Band"))
-            fig1.add_trace(go.Scatter(x=df_chart.index, y=df_chart['Lower'], line=dict(color='rgba(255,255,255,0.5)', width=1, dash='dash'), name="Lower Band"))
-            fig1.add_trace(go.Scatter(x=df_chart.index, y=df_chart['SMA20'], line=dict(color='#FF914D', width=1.5), name="SMA 20"))
-            fig1.add_trace(go.Candlestick(x=df_chart.index, open=df_chart['Open'], high=df_chart['High'], low=df_chart['Low'], close=df_chart['Close'], name="Giá"))
-            fig1.update_layout(height=500, xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.1, xanchor="center", x=0.5), xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333'), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
-            st.plotly_chart(fig1, use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
-
-            col_c1, col_c2 = st.columns(2)
-            with col_c1:
-                st.markdown("### 🚀 Chỉ số RSI")
-                fig2 = go.Figure()
-                fig2.add_trace(go.Scatter(x=df_chart.index, y=df_chart['RSI'], line=dict(color='#E040FB', width=2), name="RSI"))
-                fig2.add_hline(y=70, line_dash="dot", line_color="#FF5252")
-                fig2.add_hline(y=30, line_dash="dot", line_color="#00E676")
-                fig2.update_layout(height=350, xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5), xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333'), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
-                st.plotly_chart(fig2, use_container_width=True, config={'scrollZoom': False})
-
-            with col_c2:
-                st.markdown("### ⚖️ Chỉ số ADX & DI")
-                fig3 = go.Figure()
-                fig3.add_trace(go.Scatter(x=df_chart.index, y=df_chart['ADX'], line=dict(color='white', width=2), name="ADX"))
-                fig3.add_trace(go.Scatter(x=df_chart.index, y=df_chart['+DI'], line=dict(color='#00E676', width=1.5), name="+DI"))
-                fig3.add_trace(go.Scatter(x=df_chart.index, y=df_chart['-DI'], line=dict(color='#FF5252', width=1.5), name="-DI"))
-                fig3.add_hline(y=25, line_dash="dot", line_color="gray")
-                fig3.update_layout(height=350, xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5), xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333'), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
-                st.plotly_chart(fig3, use_container_width=True, config={'scrollZoom': False})
+            render_technical_charts(df, symbol, ticker)
+
+            # Báo cáo bộ nhớ của khung dữ liệu gọn
+            mem = df.attrs.get('memory')
+            if mem:
+                with st.expander("💾 Bộ nhớ dữ liệu"):
+                    st.markdown(f"**{ticker}**: {mem['rows']:,} phiên · {mem['full_columns']} cột float64 = **{mem['full_bytes'] / 1024:,.0f} KB** → {mem['compact_columns']} cột float32/int8 = **{mem['compact_bytes'] / 1024:,.0f} KB** (tiết kiệm {mem['saving_pct']:.0f}%)")
 
+            st.caption(f"⏱️ Lượt chạy lại toàn trang: {(time.perf_counter() - RUN_STARTED) * 1000:.0f} ms")
+
+# --- CHẨN ĐOÁN: THỜI GIAN TỪNG GIAI ĐOẠN ---
+TELEMETRY.record("page_run", time.perf_counter() - RUN_STARTED, {})
+with st.expander("🩺 Chẩn đoán"):
+    if not TELEMETRY.enabled:
+        st.info("Đo thời gian đang tắt (STOCK_TELEMETRY=0).")
+    else:
+        st.markdown("**Lượt chạy này**")
+        st.dataframe(pd.DataFrame(RUN_SPANS), use_container_width=True, hide_index=True)
+        st.markdown("**Toàn tiến trình (mọi phiên, p50/p95 trên các mẫu gần nhất)**")
+        st.dataframe(pd.DataFrame(TELEMETRY.summary()), use_container_width=True, hide_index=True)
+        st.caption(f"Cache dữ liệu: {DATA_CACHE.stats()} · Tải: {FETCHER.stats()}"
+                   + (f" · Kho dùng chung: {SHARED_STORE.stats()}" if SHARED_STORE is not None else ""))
+        c_json, c_prom = st.columns(2)
+        with c_json: st.download_button("⬇️ metrics.json", TELEMETRY.to_json(), file_name="metrics.json", mime="application/json")
+        with c_prom: st.download_button("⬇️ metrics.prom (Prometheus)", TELEMETRY.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        try:
+            TELEMETRY.write()
+        except OSError as e:
+            st.caption(f"Không ghi được file chỉ số: {e}")
@@ -0,0 +1,74 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from engine import analyze_symbol
+from screener import fetch_histories, load_universe, normalize_symbol
+
+# --- CHẠY PHÂN TÍCH KHÔNG CẦN GIAO DIỆN (CRON / WORKER) ---
+# Cùng chuỗi xử lý với trang Streamlit: chỉ báo -> tín hiệu -> khuyến nghị -> backtest -> stoploss tối ưu,
+# cho nhiều mã song song. Chỉ import numpy/pandas (không Streamlit, không Plotly).
+# VD: python advisor.py HPG VNM FPT --stop-loss 7 --format jsonl --out recs.jsonl
+
+def _analyze(item):
+    symbol, df, stop_loss = item
+    try:
+        return {'symbol': symbol, **analyze_symbol(df, stop_loss)}
+    except Exception as e:
+        return {'symbol': symbol, 'error': f"{type(e).__name__}: {e}"}
+
+def run_batch(symbols, stop_loss=7.0, source="yahoo", store=None, workers=None, frames=None):
+    # Trả về danh sách bản ghi theo thứ tự symbols; mã không có dữ liệu được ghi kèm 'error'
+    if frames is None: frames = fetch_histories(symbols, source=source, store=store)
+    items = [(symbol, frames[symbol], stop_loss) for symbol in symbols if symbol in frames]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = dict(zip([i[0] for i in items], pool.map(_analyze, items, chunksize=max(1, len(items) // (workers * 4)))))
+    else:
+        results = {item[0]: _analyze(item) for item in items}
+    return [results.get(symbol, {'symbol': symbol, 'error': "Không có dữ liệu"}) for symbol in symbols]
+
+def _clean(value):
+    # NaN/inf -> null để JSON hợp lệ
+    return None if isinstance(value, float) and not math.isfinite(value) else value
+
+def write_records(records, out, fmt):
+    if fmt == "csv":
+        pd.DataFrame(records).to_csv(out, index=False)
+        return
+    for record in records: out.write(json.dumps({k: _clean(v) for k, v in record.items()}, ensure_ascii=False) + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Khuyến nghị + backtest BB/RSI/ADX cho danh sách mã, không cần Streamlit")
+    parser.add_argument("tickers", nargs="*", help="Các mã, VD: HPG VNM FPT")
+    parser.add_argument("--universe", default=None, help="File danh sách mã (mỗi dòng một mã hoặc CSV cột đầu)")
+    parser.add_argument("--stop-loss", type=float, default=7.0)
+    parser.add_argument("--source", choices=["yahoo", "store"], default="yahoo")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None, help="Mặc định theo đuôi file --out, không có thì jsonl")
+    parser.add_argument("--out", default=None, help="File kết quả (mặc định in ra stdout)")
+    args = parser.parse_args(argv)
+
+    symbols = [normalize_symbol(t) for t in args.tickers]
+    if args.universe: symbols += load_universe(args.universe)
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols: parser.error("Cần ít nhất một mã (tham số hoặc --universe)")
+    fmt = args.format or ("csv" if args.out and args.out.endswith(".csv") else "jsonl")
+
+    t0 = time.perf_counter()
+    records = run_batch(symbols, stop_loss=args.stop_loss, source=args.source, workers=args.workers)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8", newline="") as f: write_records(records, f, fmt)
+    else:
+        write_records(records, sys.stdout, fmt)
+    failed = sum('error' in r for r in records)
+    print(f"{len(records) - failed}/{len(records)} mã trong {time.perf_counter() - t0:.2f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
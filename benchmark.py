@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from engine import calculate_indicators, precalculate_signals, run_simulation, run_backtest, optimize_stoploss, analyze_symbol
+from robustness import robustness_test
+from portfolio import run_portfolio
+
+# --- BỘ ĐO HIỆU NĂNG CÁC ĐOẠN NÓNG ---
+# Dữ liệu giả lập cố định theo seed: bước ngẫu nhiên có chuyển pha (tăng / giảm / đi ngang).
+# Mỗi giai đoạn đo thời gian (lấy lần nhanh nhất trong --repeat lần), số phiên/giây và bộ nhớ đỉnh (tracemalloc,
+# đo ở một lần chạy riêng để không làm chậm số đo thời gian). Kết quả ghi JSON; so với một file JSON trước đó
+# (--baseline) để đánh dấu giai đoạn chậm hơn quá ngưỡng.
+# VD: python benchmark.py --preset full --out bench.json
+#     python benchmark.py --baseline bench.json --threshold 0.2
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "benchmarks")
+PRESETS = {
+    # bars: kích thước một mã; tickers: số mã (mỗi mã ticker_bars phiên) chạy trọn chuỗi analyze_symbol;
+    # portfolio: (số mã, số phiên) của backtest danh mục dùng chung vốn
+    "quick": {'bars': [1_000, 10_000], 'tickers': [1, 10], 'ticker_bars': 1_000, 'portfolio': [(50, 1_000)]},
+    "full": {'bars': [1_000, 10_000, 100_000, 1_000_000], 'tickers': [1, 10, 100, 1_000], 'ticker_bars': 1_000,
+             'portfolio': [(50, 1_000), (500, 5_000)]},
+}
+LOOP_MAX_BARS = 100_000   # run_simulation (vòng lặp Python gốc) chỉ đo tới kích thước này
+ROBUST_PATHS = 1_000      # Số đường giá của giai đoạn robustness_test
+ROBUST_MAX_BARS = 10_000  # robustness_test chỉ đo tới kích thước này
+# Pha: (lợi suất TB ngày, độ biến động ngày)
+REGIMES = np.array([[0.0010, 0.015], [-0.0010, 0.020], [0.0, 0.010]])
+REGIME_STAY = 0.99        # Xác suất giữ nguyên pha mỗi phiên (~100 phiên một pha)
+
+# --- DỮ LIỆU GIẢ LẬP ---
+def synthetic_ohlcv(n_bars, seed=0, start_price=20_000.0):
+    rng = np.random.default_rng(seed)
+    switches = rng.random(n_bars) > REGIME_STAY
+    regime = rng.integers(0, len(REGIMES), n_bars)
+    # Pha của mỗi phiên = pha được bốc ở lần chuyển pha gần nhất
+    last_switch = np.maximum.accumulate(np.where(switches, np.arange(n_bars), 0))
+    drift, vol = REGIMES[regime[last_switch]].T
+    close = start_price * np.exp(np.cumsum(rng.normal(drift, vol)))
+    open_ = np.concatenate([[start_price], close[:-1]]) * (1 + rng.normal(0, vol / 4))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 2)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 2)))
+    # Lịch phiên làm việc chỉ chứa được ~146k phiên trong giới hạn Timestamp của pandas -> dài hơn thì dùng nến giờ
+    index = pd.bdate_range("1990-01-01", periods=n_bars) if n_bars <= 100_000 else pd.date_range("1900-01-01", periods=n_bars, freq="h")
+    df = pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close,
+                       'Volume': rng.integers(10_000, 5_000_000, n_bars).astype(float)}, index=index)
+    df.index.name = "Date"
+    return df
+
+def synthetic_universe(n_tickers, n_bars, seed=0):
+    return {f"SYN{i:04d}.VN": synthetic_ohlcv(n_bars, seed=seed + i) for i in range(n_tickers)}
+
+# --- ĐO MỘT GIAI ĐOẠN ---
+def measure(fn, repeat=3, memory=True):
+    # fn() chạy lại được nhiều lần (tự chuẩn bị dữ liệu đầu vào). Trả về (giây nhanh nhất, MB đỉnh hoặc None)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+    return best, peak_mb
+
+def _row(stage, bars, tickers, seconds, peak_mb):
+    total = bars * tickers
+    return {'stage': stage, 'bars': bars, 'tickers': tickers, 'seconds': seconds,
+            'bars_per_sec': total / seconds if seconds > 0 else float("inf"), 'peak_mb': peak_mb}
+
+def bench_stages(n_bars, repeat=3, memory=True, loop_max_bars=LOOP_MAX_BARS, log=None):
+    raw = synthetic_ohlcv(n_bars)
+    with_ind = calculate_indicators(raw.copy())
+    processed = precalculate_signals(with_ind.copy())
+    stages = [
+        ("calculate_indicators", lambda: calculate_indicators(raw.copy())),
+        ("precalculate_signals", lambda: precalculate_signals(with_ind.copy())),
+        ("run_backtest", lambda: run_backtest(processed, 7.0)),
+        ("optimize_stoploss", lambda: optimize_stoploss(processed)),
+    ]
+    if n_bars <= loop_max_bars: stages.append(("run_simulation", lambda: run_simulation(processed, 7.0)))
+    if n_bars <= ROBUST_MAX_BARS: stages.append(("robustness_test", lambda: robustness_test(processed, n_paths=ROBUST_PATHS)))
+    rows = []
+    for name, fn in stages:
+        rows.append(_row(name, n_bars, 1, *measure(fn, repeat, memory)))
+        if log: log(rows[-1])
+    return rows
+
+def bench_universe(n_tickers, n_bars, repeat=1, memory=True, log=None):
+    frames = list(synthetic_universe(n_tickers, n_bars).values())
+    row = _row("analyze_symbol", n_bars, n_tickers, *measure(lambda: [analyze_symbol(df) for df in frames], repeat, memory))
+    if log: log(row)
+    return [row]
+
+def bench_portfolio(n_tickers, n_bars, repeat=1, memory=True, log=None):
+    # Xếp thẳng hàng + mô phỏng danh mục (chỉ báo / tín hiệu từng mã tính trước, không đo)
+    frames = {symbol: precalculate_signals(calculate_indicators(df)) for symbol, df in synthetic_universe(n_tickers, n_bars).items()}
+    row = _row("run_portfolio", n_bars, n_tickers, *measure(lambda: run_portfolio(frames), repeat, memory))
+    if log: log(row)
+    return [row]
+
+def run_benchmarks(bars, tickers, ticker_bars=1_000, repeat=3, memory=True, loop_max_bars=LOOP_MAX_BARS, log=None, portfolio=()):
+    rows = []
+    for n in bars: rows += bench_stages(n, repeat, memory, loop_max_bars, log)
+    for n in tickers: rows += bench_universe(n, ticker_bars, max(1, repeat if n <= 10 else 1), memory, log)
+    for n_tickers, n_bars in portfolio: rows += bench_portfolio(n_tickers, n_bars, repeat, memory, log)
+    return {'meta': environment(), 'results': rows}
+
+def environment():
+    return {'timestamp': pd.Timestamp.now().isoformat(timespec="seconds"), 'python': sys.version.split()[0],
+            'numpy': np.__version__, 'pandas': pd.__version__, 'platform': platform.platform(),
+            'machine': platform.machine(), 'cpu_count': os.cpu_count()}
+
+# --- SO SÁNH VỚI BASELINE ---
+def compare(current, baseline, threshold=0.2, min_delta=0.005):
+    # Ghép theo (stage, bars, tickers). ratio = thời gian hiện tại / baseline; regression khi ratio > 1 + threshold
+    # và chậm thêm ít nhất min_delta giây (giai đoạn vài ms dao động mạnh theo nhiễu máy)
+    base = {(r['stage'], r['bars'], r['tickers']): r for r in baseline['results']}
+    rows = []
+    for r in current['results']:
+        b = base.get((r['stage'], r['bars'], r['tickers']))
+        if b is None: continue
+        ratio = r['seconds'] / b['seconds'] if b['seconds'] > 0 else float("inf")
+        rows.append({'stage': r['stage'], 'bars': r['bars'], 'tickers': r['tickers'], 'baseline_s': b['seconds'],
+                     'current_s': r['seconds'], 'ratio': ratio,
+                     'regression': ratio > 1 + threshold and r['seconds'] - b['seconds'] > min_delta})
+    return pd.DataFrame(rows, columns=['stage', 'bars', 'tickers', 'baseline_s', 'current_s', 'ratio', 'regression'])
+
+def default_output_path():
+    return os.path.join(BENCH_DIR, f"bench_{pd.Timestamp.now():%Y%m%d_%H%M%S}.json")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo hiệu năng chỉ báo / tín hiệu / backtest trên dữ liệu giả lập")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="quick")
+    parser.add_argument("--bars", type=int, nargs="*", default=None, help="Ghi đè các kích thước một mã")
+    parser.add_argument("--tickers", type=int, nargs="*", default=None, help="Ghi đè số mã của phần nhiều mã")
+    parser.add_argument("--ticker-bars", type=int, default=None)
+    parser.add_argument("--portfolio", nargs="*", default=None, help="Ghi đè kích thước danh mục, dạng MÃxPHIÊN, VD 500x5000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Bỏ lần chạy đo bộ nhớ đỉnh")
+    parser.add_argument("--out", default=None, help="File JSON kết quả (mặc định .data/benchmarks/)")
+    parser.add_argument("--baseline", default=None, help="File JSON của lần chạy trước để so sánh")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Chậm hơn baseline quá tỉ lệ này thì báo (0.2 = 20%%)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Bỏ qua chênh lệch tuyệt đối dưới số giây này")
+    args = parser.parse_args(argv)
+
+    preset = PRESETS[args.preset]
+    bars = preset['bars'] if args.bars is None else args.bars
+    tickers = preset['tickers'] if args.tickers is None else args.tickers
+    ticker_bars = args.ticker_bars or preset['ticker_bars']
+    log = lambda r: print(f"{r['stage']:<22}{r['bars']:>10,} phiên x {r['tickers']:>5,} mã  {r['seconds']:>9.4f}s  {r['bars_per_sec']:>14,.0f} phiên/s"
+                          + (f"  {r['peak_mb']:>8.1f} MB" if r['peak_mb'] is not None else ""), flush=True)
+    portfolio = preset['portfolio'] if args.portfolio is None else [tuple(map(int, p.split("x"))) for p in args.portfolio]
+    result = run_benchmarks(bars, tickers, ticker_bars, args.repeat, not args.no_memory, log=log, portfolio=portfolio)
+
+    out = args.out or default_output_path()
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f: json.dump(result, f, indent=1)
+    print(f"-> {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)
+        table = compare(result, baseline, args.threshold, args.min_delta)
+        print(table.to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+        regressions = table[table['regression']]
+        if len(regressions):
+            print(f"⚠️ {len(regressions)} giai đoạn chậm hơn baseline quá {args.threshold:.0%}")
+            raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
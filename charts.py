@@ -0,0 +1,170 @@
+import time
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from telemetry import span
+
+# --- LỚP DỰNG BIỂU ĐỒ ---
+# Độ phân giải chọn theo khung thời gian: khung ngắn vẽ nến ngày, khung dài gộp nến tuần / tháng,
+# đường chỉ báo được rút gọn bằng LTTB và chuyển sang WebGL (Scattergl) khi còn nhiều điểm.
+
+RANGE_BARS = {"1 Tháng": 22, "3 Tháng": 66, "6 Tháng": 132, "1 Năm": 252, "3 Năm": 756, "Tất cả": None}
+DAILY_MAX_BARS = 300          # Tới ngưỡng này vẫn vẽ nến ngày
+WEEKLY_MAX_BARS = 1000        # Tới ngưỡng này gộp nến tuần, dài hơn thì gộp nến tháng
+MAX_LINE_POINTS = 800         # Số điểm tối đa của mỗi đường chỉ báo sau khi rút gọn
+WEBGL_THRESHOLD = 500         # Đường có nhiều điểm hơn ngưỡng này vẽ bằng WebGL
+RESOLUTIONS = {"D": "Ngày", "W-FRI": "Tuần", "ME": "Tháng"}
+
+BASE_LAYOUT = dict(xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'),
+                   xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333'), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
+
+def slice_range(df, range_label):
+    bars = RANGE_BARS.get(range_label)
+    return df if bars is None else df.iloc[-bars:]
+
+def choose_resolution(n_bars):
+    if n_bars <= DAILY_MAX_BARS: return "D"
+    return "W-FRI" if n_bars <= WEEKLY_MAX_BARS else "ME"
+
+def resample_ohlc(df, rule):
+    if rule == "D": return df[['Open', 'High', 'Low', 'Close']]
+    return df[['Open', 'High', 'Low', 'Close']].resample(rule).agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last'}).dropna()
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: giữ n_out điểm giữ dáng đường nhất. Trả về chỉ số các điểm được chọn.
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    n = len(valid)
+    if n_out >= n or n_out < 3: return valid
+    xv, yv = x[valid], y[valid]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # n_out - 2 thùng giữa điểm đầu và điểm cuối
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        next_start, next_end = (edges[b + 1], edges[b + 2]) if b + 2 < len(edges) else (n - 1, n)
+        if end <= start:
+            selected[b + 1] = a
+            continue
+        avg_x, avg_y = xv[next_start:next_end].mean(), yv[next_start:next_end].mean()
+        area = np.abs((xv[a] - avg_x) * (yv[start:end] - yv[a]) - (xv[a] - xv[start:end]) * (avg_y - yv[a]))
+        a = start + int(np.argmax(area))
+        selected[b + 1] = a
+    return valid[np.unique(selected)]
+
+def _line(df, column, max_points=MAX_LINE_POINTS, webgl=True, **kwargs):
+    # Đường chỉ báo: rút gọn nếu quá dài (max_points=None: giữ nguyên), WebGL nếu vẫn còn nhiều điểm
+    x = df.index
+    y = df[column].to_numpy(dtype=float)
+    if max_points is not None and len(y) > max_points:
+        keep = lttb(x.asi8, y, max_points)
+        x, y = x[keep], y[keep]
+    trace = go.Scattergl if webgl and len(y) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+def build_price_figure(df_chart, rule, **line_opts):
+    candles = resample_ohlc(df_chart, rule)
+    fig = go.Figure()
+    fig.add_trace(_line(df_chart, 'Upper', **line_opts, line=dict(color='rgba(255,255,255,0.5)', width=1, dash='dash'), name="Upper Band"))
+    fig.add_trace(_line(df_chart, 'Lower', **line_opts, line=dict(color='rgba(255,255,255,0.5)', width=1, dash='dash'), name="Lower Band"))
+    fig.add_trace(_line(df_chart, 'SMA20', **line_opts, line=dict(color='#FF914D', width=1.5), name="SMA 20"))
+    fig.add_trace(go.Candlestick(x=candles.index, open=candles['Open'], high=candles['High'], low=candles['Low'], close=candles['Close'], name=f"Giá ({RESOLUTIONS[rule]})"))
+    fig.update_layout(height=500, margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.1, xanchor="center", x=0.5), **BASE_LAYOUT)
+    return fig, len(candles)
+
+def build_rsi_figure(df_chart, **line_opts):
+    fig = go.Figure()
+    fig.add_trace(_line(df_chart, 'RSI', **line_opts, line=dict(color='#E040FB', width=2), name="RSI"))
+    fig.add_hline(y=70, line_dash="dot", line_color="#FF5252")
+    fig.add_hline(y=30, line_dash="dot", line_color="#00E676")
+    fig.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5), **BASE_LAYOUT)
+    return fig
+
+def build_adx_figure(df_chart, **line_opts):
+    fig = go.Figure()
+    fig.add_trace(_line(df_chart, 'ADX', **line_opts, line=dict(color='white', width=2), name="ADX"))
+    fig.add_trace(_line(df_chart, '+DI', **line_opts, line=dict(color='#00E676', width=1.5), name="+DI"))
+    fig.add_trace(_line(df_chart, '-DI', **line_opts, line=dict(color='#FF5252', width=1.5), name="-DI"))
+    fig.add_hline(y=25, line_dash="dot", line_color="gray")
+    fig.update_layout(height=350, margin=dict(l=10, r=10, t=10, b=40), legend=dict(orientation="h", yanchor="top", y=-0.15, xanchor="center", x=0.5), **BASE_LAYOUT)
+    return fig
+
+def build_technical_figures(df, range_label, full_resolution=False):
+    # Trả về (các biểu đồ, thông tin độ phân giải và thời gian dựng).
+    # full_resolution=True: cách vẽ cũ (nến ngày, giữ mọi điểm, không WebGL) để so sánh.
+    with span("build_figures", range=range_label) as sp:
+        figs, info = _build_technical_figures(df, range_label, full_resolution)
+        sp.set(rows=info['bars'])
+        return figs, info
+
+def _build_technical_figures(df, range_label, full_resolution):
+    t0 = time.perf_counter()
+    df_chart = slice_range(df, range_label)
+    rule = "D" if full_resolution else choose_resolution(len(df_chart))
+    line_opts = {'max_points': None, 'webgl': False} if full_resolution else {}
+    fig_price, n_candles = build_price_figure(df_chart, rule, **line_opts)
+    figs = {'price': fig_price, 'rsi': build_rsi_figure(df_chart, **line_opts), 'adx': build_adx_figure(df_chart, **line_opts)}
+    points = sum(len(trace.x) for fig in figs.values() for trace in fig.data)
+    info = {'range': range_label, 'bars': len(df_chart), 'resolution': RESOLUTIONS[rule], 'candles': n_candles, 'points': points,
+            'webgl': any(trace.type == 'scattergl' for fig in figs.values() for trace in fig.data),
+            'build_ms': (time.perf_counter() - t0) * 1000}
+    return figs, info
+
+def payload_bytes(figs):
+    # Kích thước JSON gửi xuống trình duyệt
+    with span("plotly_serialize") as sp:
+        total = sum(len(fig.to_json()) for fig in figs.values())
+        sp.set(bytes=total)
+        return total
+
+def build_intraday_figure(df_intra, ref_price):
+    current_price = df_intra['Close'].iloc[-1]
+    line_color = '#00E676' if current_price >= ref_price else '#FF5252'
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=df_intra.index, y=df_intra['Close'], mode='lines', line=dict(color=line_color, width=2), name='Giá Intraday'))
+    fig.update_layout(height=350, xaxis_rangeslider_visible=False, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=10), xaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', tickformat="%H:%M"), yaxis=dict(showgrid=True, gridwidth=1, gridcolor='#333', autorange=True))
+    return fig
+
+def build_robustness_figure(summary):
+    # Hộp theo từng mức Stoploss từ phân vị đã tính sẵn (p5-p25-p50-p75-p95): gửi 21 hộp thay vì hàng nghìn điểm
+    labels = [f"{sl:g}%" if sl > 0 else "OFF" for sl in summary['stop_loss']]
+    fig = go.Figure()
+    fig.add_trace(go.Box(x=labels, q1=summary['p25'], median=summary['p50'], q3=summary['p75'], lowerfence=summary['p5'],
+                         upperfence=summary['p95'], mean=summary['mean'], marker_color='#00E5FF', name="Mô phỏng"))
+    if 'historical' in summary:
+        fig.add_trace(go.Scatter(x=labels, y=summary['historical'], mode='markers', marker=dict(color='#FFD600', size=8, symbol='diamond'), name="Lịch sử"))
+    fig.add_hline(y=0, line_dash="dot", line_color="#888")
+    fig.update_layout(height=360, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=30, b=10),
+                      legend=dict(orientation="h", y=1.08), xaxis=dict(title="Stoploss"), yaxis=dict(title="%/năm", showgrid=True, gridwidth=1, gridcolor='#333'))
+    return fig
+
+def build_walkforward_figure(result):
+    # Trên: vốn ngoài mẫu (walk-forward so với mức SL chọn trên cả lịch sử); dưới: mức SL được chọn theo thời gian
+    table = result['windows']
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.65, 0.35], vertical_spacing=0.05)
+    fig.add_trace(go.Scatter(x=result['equity'].index, y=result['equity'] / 1e6, line=dict(color='#00E5FF', width=1.5), name="Walk-forward"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=result['static_equity'].index, y=result['static_equity'] / 1e6, line=dict(color='#888', width=1, dash='dot'), name="SL cố định (nhìn trước)"), row=1, col=1)
+    steps_x = list(table['oos_start']) + [table['oos_end'].iloc[-1]]
+    steps_y = list(table['stop_loss']) + [table['stop_loss'].iloc[-1]]
+    fig.add_trace(go.Scatter(x=steps_x, y=steps_y, line=dict(color='#FFD600', width=1.5, shape='hv'), name="SL được chọn %"), row=2, col=1)
+    fig.update_layout(height=420, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=30, b=10),
+                      legend=dict(orientation="h", y=1.08))
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+    fig.update_yaxes(title_text="Triệu VND", row=1, col=1)
+    fig.update_yaxes(title_text="SL %", row=2, col=1)
+    return fig
+
+def measure_ranges(df, full_resolution=False):
+    # Đo số điểm, payload JSON và thời gian dựng / tuần tự hóa cho từng khung thời gian
+    rows = []
+    for label in RANGE_BARS:
+        figs, info = build_technical_figures(df, label, full_resolution=full_resolution)
+        t0 = time.perf_counter()
+        info['payload_kb'] = payload_bytes(figs) / 1024
+        info['serialize_ms'] = (time.perf_counter() - t0) * 1000
+        rows.append(info)
+    return pd.DataFrame(rows)
@@ -0,0 +1,224 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# --- KHO DỮ LIỆU GIÁ CỤC BỘ (OHLCV) ---
+# Mỗi mã lưu một file Parquet dạng cột. Lần tải sau chỉ xin nhà cung cấp phần dữ liệu
+# từ phiên cuối cùng đã lưu trở đi (phiên cuối được tải lại vì có thể chưa đóng cửa).
+
+DEFAULT_STORE_DIR = os.environ.get("STOCK_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "ohlcv"))
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+ADJUST_RTOL = 1e-4          # Lệch giá tương đối lớn hơn mức này ở phiên đã đóng -> lịch sử đã bị điều chỉnh lại
+
+def flatten_columns(df):
+    # yfinance trả về cột MultiIndex (Price, Ticker) -> chỉ giữ tầng tên giá
+    if isinstance(df.columns, pd.MultiIndex): df.columns = df.columns.get_level_values(0)
+    return df
+
+def clean_ohlcv(df):
+    df = flatten_columns(df)
+    df = df[[c for c in OHLCV_COLUMNS if c in df.columns]]
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    df.index.name = "Date"
+    return df
+
+# --- NHÀ CUNG CẤP DỮ LIỆU ---
+# Mọi provider cần hai hàm: fetch(symbol, start=None, interval="1d") trả về DataFrame OHLCV
+# (start=None nghĩa là toàn bộ lịch sử) và fetch_intraday(symbol, interval="5m", start=None) trả về nến trong phiên
+# gần nhất (start: chỉ các nến từ mốc này trở đi, giờ UTC không múi giờ như chỉ mục trả về - dùng cho chế độ trực tiếp).
+# Lỗi mạng / nguồn dữ liệu được báo bằng ProviderError để lớp tải (fetcher.py) thử lại.
+class ProviderError(Exception):
+    pass
+
+def _utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts
+
+def _raise_download_errors(symbol):
+    # yf.download nuốt lỗi và trả về khung rỗng; lỗi được ghi vào yf.shared._ERRORS.
+    # Mã không tồn tại ("delisted" / "no data") vẫn trả về rỗng, còn lỗi mạng thì ném ra để thử lại.
+    import yfinance as yf
+    errors = getattr(getattr(yf, "shared", None), "_ERRORS", None) or {}
+    message = str(errors.get(symbol, ""))
+    if message and "delisted" not in message.lower() and "no data" not in message.lower():
+        raise ProviderError(message)
+
+class YahooProvider:
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+
+    def fetch(self, symbol, start=None, interval="1d"):
+        import yfinance as yf
+        if start is None:
+            df = yf.download(symbol, period="max", interval=interval, progress=False, timeout=self.timeout)
+        else:
+            df = yf.download(symbol, start=pd.Timestamp(start).strftime("%Y-%m-%d"), interval=interval, progress=False, timeout=self.timeout)
+        if df.empty: _raise_download_errors(symbol)
+        return clean_ohlcv(df)
+
+    def fetch_intraday(self, symbol, interval="5m", start=None):
+        import yfinance as yf
+        if start is None:
+            df = yf.download(symbol, period="1d", interval=interval, progress=False, timeout=self.timeout)
+        else:
+            # Mốc epoch giây: Yahoo chỉ trả các nến từ start (nến đang chạy được gửi lại với giá mới nhất)
+            df = yf.download(symbol, start=int(_utc(start).timestamp()), interval=interval, progress=False, timeout=self.timeout)
+        if df.empty: _raise_download_errors(symbol)
+        return flatten_columns(df)
+
+class CsvDirProvider:
+    # Đọc file {symbol}.csv (cột đầu là ngày) trong một thư mục - dùng cho dữ liệu ghi sẵn / chạy offline
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, symbol, start=None, interval="1d"):
+        path = os.path.join(self.root, f"{symbol}.csv")
+        if not os.path.exists(path): return pd.DataFrame(columns=OHLCV_COLUMNS)
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        if start is not None: df = df[df.index >= pd.Timestamp(start)]
+        return clean_ohlcv(df)
+
+    def fetch_intraday(self, symbol, interval="5m", start=None):
+        # File {symbol}_{interval}.csv nếu có, không thì coi như chưa có dữ liệu trong ngày
+        path = os.path.join(self.root, f"{symbol}_{interval}.csv")
+        if not os.path.exists(path): return pd.DataFrame(columns=OHLCV_COLUMNS)
+        df = clean_ohlcv(pd.read_csv(path, index_col=0, parse_dates=True))
+        return df if start is None else df[df.index >= pd.Timestamp(start)]
+
+class FakeProvider:
+    # Nguồn giả lập chạy cục bộ để kiểm thử lớp tải: giá ngẫu nhiên cố định theo mã,
+    # độ trễ và lỗi cấu hình được.
+    #   latency: số giây mỗi lần gọi, hoặc hàm (symbol, interval) -> số giây
+    #   fail_rate: xác suất một lần gọi ném ProviderError
+    #   fail_first: n lần gọi đầu tiên của mỗi (symbol, interval) luôn lỗi (kiểm tra thử lại)
+    #   unknown: các mã coi như không tồn tại (trả về khung rỗng)
+    def __init__(self, latency=0.0, fail_rate=0.0, fail_first=0, unknown=(), bars=1500, seed=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first
+        self.unknown = set(unknown)
+        self.bars = bars
+        self.seed = seed
+        self.calls = Counter()
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, symbol, interval):
+        with self._lock:
+            self.calls[(symbol, interval)] += 1
+            count = self.calls[(symbol, interval)]
+            unlucky = self._rng.random() < self.fail_rate
+        delay = self.latency(symbol, interval) if callable(self.latency) else self.latency
+        if delay: time.sleep(delay)
+        if count <= self.fail_first or unlucky: raise ProviderError(f"Lỗi giả lập {symbol} {interval} (lần {count})")
+
+    def _frame(self, symbol, index):
+        rng = np.random.default_rng(zlib.crc32(symbol.encode()) + self.seed)
+        close = 20000 * np.exp(np.cumsum(rng.normal(0, 0.02, len(index))))
+        open_ = close * (1 + rng.normal(0, 0.005, len(index)))
+        spread = np.abs(rng.normal(0, 0.01, len(index))) * close
+        df = pd.DataFrame({'Open': open_, 'High': np.maximum(open_, close) + spread, 'Low': np.minimum(open_, close) - spread,
+                           'Close': close, 'Volume': rng.integers(1e5, 5e6, len(index)).astype(float)}, index=index)
+        df.index.name = "Date"
+        return df
+
+    def fetch(self, symbol, start=None, interval="1d"):
+        self._call(symbol, interval)
+        if symbol in self.unknown: return pd.DataFrame(columns=OHLCV_COLUMNS)
+        df = self._frame(symbol, pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=self.bars))
+        return df if start is None else df[df.index >= pd.Timestamp(start)]
+
+    def fetch_intraday(self, symbol, interval="5m", start=None):
+        # Phiên gần nhất 9:00-15:00 giờ VN, chỉ mục UTC không múi giờ như yfinance
+        self._call(symbol, interval)
+        if symbol in self.unknown: return pd.DataFrame(columns=OHLCV_COLUMNS)
+        day = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=1)[0]
+        df = self._frame(symbol + interval, pd.date_range(day + pd.Timedelta(hours=2), day + pd.Timedelta(hours=8), freq=interval.replace("m", "min")))
+        return df if start is None else df[df.index >= pd.Timestamp(start)]
+
+# --- KHO LƯU TRỮ ---
+class OHLCVStore:
+    def __init__(self, root=DEFAULT_STORE_DIR, provider=None):
+        self.root = root
+        self.provider = provider if provider is not None else YahooProvider()
+
+    def path(self, symbol):
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9._-]", "_", symbol) + ".parquet")
+
+    def read(self, symbol):
+        path = self.path(symbol)
+        if not os.path.exists(path): return None
+        return pd.read_parquet(path)
+
+    def last_date(self, symbol):
+        path = self.path(symbol)
+        if not os.path.exists(path): return None
+        index = pd.read_parquet(path, columns=[]).index
+        return index[-1] if len(index) else None
+
+    def state_path(self, symbol):
+        return self.path(symbol)[:-len(".parquet")] + ".state.json"
+
+    def _atomic_write(self, target, write_fn):
+        # Ghi ra file tạm trong cùng thư mục rồi os.replace -> người đọc không bao giờ thấy file ghi dở
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+
+    def write(self, symbol, df):
+        self._atomic_write(self.path(symbol), df.to_parquet)
+
+    def save_state(self, symbol, snapshot):
+        # Lưu snapshot của IndicatorState cạnh file giá
+        def dump(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f: json.dump(snapshot, f)
+        self._atomic_write(self.state_path(symbol), dump)
+
+    def load_state(self, symbol):
+        path = self.state_path(symbol)
+        if not os.path.exists(path): return None
+        with open(path, encoding="utf-8") as f: return json.load(f)
+
+    @staticmethod
+    def _adjusted(stored, fresh):
+        cols = [c for c in PRICE_COLUMNS if c in stored.index and c in fresh.index]
+        return not np.allclose(fresh[cols].to_numpy(dtype=float), stored[cols].to_numpy(dtype=float), rtol=ADJUST_RTOL, equal_nan=True)
+
+    def load(self, symbol):
+        cached = self.read(symbol)
+        if cached is None or cached.empty:
+            fresh = self.provider.fetch(symbol)
+            if not fresh.empty: self.write(symbol, fresh)
+            return fresh
+
+        # Chỉ tải bù từ phiên áp chót đã lưu: phiên cuối có thể chưa đóng cửa (được ghi đè bằng dữ liệu mới nhất),
+        # phiên áp chót đã đóng nên phải khớp bản lưu. Lệch nghĩa là nguồn đã điều chỉnh lại cả lịch sử (chia tách,
+        # cổ tức - yfinance mặc định auto_adjust=True) -> tải lại toàn bộ thay vì nối giá mới vào giá cũ.
+        anchor = cached.index[-2] if len(cached) > 1 else cached.index[-1]
+        fresh = self.provider.fetch(symbol, start=anchor)
+        if fresh.empty: return cached
+        if anchor in fresh.index and self._adjusted(cached.loc[anchor], fresh.loc[anchor]):
+            full = self.provider.fetch(symbol)
+            if not full.empty:
+                self.write(symbol, full)
+                # Snapshot chỉ báo dựng trên giá chưa điều chỉnh -> bỏ
+                if os.path.exists(self.state_path(symbol)): os.remove(self.state_path(symbol))
+                return full
+        merged = pd.concat([cached[cached.index < fresh.index[0]], fresh])
+        merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+        if not merged.equals(cached): self.write(symbol, merged)
+        return merged
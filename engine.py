@@ -0,0 +1,429 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from telemetry import timed
+
+# --- LÕI PHÂN TÍCH (KHÔNG PHỤ THUỘC STREAMLIT) ---
+# Các hàm tính toán thuần: import được từ tiến trình con (bộ lọc thị trường) và từ giao diện.
+
+# --- HÀM TÍNH TOÁN CHỈ BÁO ---
+@timed()
+def calculate_indicators(df):
+    df['SMA20'] = df['Close'].rolling(window=20).mean()
+    df['StdDev'] = df['Close'].rolling(window=20).std()
+    df['Upper'] = df['SMA20'] + (2 * df['StdDev'])
+    df['Lower'] = df['SMA20'] - (2 * df['StdDev'])
+    
+    delta = df['Close'].diff()
+    gain = (delta.where(delta > 0, 0)).fillna(0)
+    loss = (-delta.where(delta < 0, 0)).fillna(0)
+    avg_gain = gain.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+    avg_loss = loss.ewm(alpha=1/14, min_periods=14, adjust=False).mean()
+    rs = avg_gain / avg_loss
+    df['RSI'] = 100 - (100 / (1 + rs))
+    
+    df['H-L'] = df['High'] - df['Low']
+    df['H-PC'] = abs(df['High'] - df['Close'].shift(1))
+    df['L-PC'] = abs(df['Low'] - df['Close'].shift(1))
+    df['TR'] = df[['H-L', 'H-PC', 'L-PC']].max(axis=1)
+    
+    df['UpMove'] = df['High'] - df['High'].shift(1)
+    df['DownMove'] = df['Low'].shift(1) - df['Low']
+    df['+DM'] = np.where((df['UpMove'] > df['DownMove']) & (df['UpMove'] > 0), df['UpMove'], 0)
+    df['-DM'] = np.where((df['DownMove'] > df['UpMove']) & (df['DownMove'] > 0), df['DownMove'], 0)
+    
+    df['TR14'] = df['TR'].ewm(alpha=1/14, adjust=False).mean()
+    df['+DM14'] = df['+DM'].ewm(alpha=1/14, adjust=False).mean()
+    df['-DM14'] = df['-DM'].ewm(alpha=1/14, adjust=False).mean()
+    
+    df['+DI'] = 100 * (df['+DM14'] / df['TR14'])
+    df['-DI'] = 100 * (df['-DM14'] / df['TR14'])
+    df['DX'] = 100 * abs(df['+DI'] - df['-DI']) / (df['+DI'] + df['-DI'])
+    df['ADX'] = df['DX'].ewm(alpha=1/14, adjust=False).mean()
+    return df
+
+# --- HÀM TÍNH TRƯỚC TÍN HIỆU ĐỂ GIẢM TẢI CPU ---
+def _lag(arr, k):
+    # Dịch mảng sang phải k phiên theo trục thời gian (trục cuối), k phần tử đầu là NaN (so sánh với NaN luôn False)
+    out = np.empty_like(arr)
+    out[..., :k] = np.nan
+    out[..., k:] = arr[..., :-k]
+    return out
+
+def compute_signals(closes, rsis, adxs, lowers, uppers, di_plus, di_minus,
+                    band_tol=0.01, rsi_buy=30, rsi_sell=70, adx_weak=25, adx_strong=50):
+    # Bản vector hóa của check_signals: mỗi nhánh ADX là một mặt nạ trên toàn bộ mảng.
+    # Trục cuối là thời gian; ngưỡng và dải BB có thể là mảng (số bộ tham số x 1) / (số bộ tham số x phiên)
+    # để tính tín hiệu cho nhiều bộ tham số cùng lúc.
+    adx_1, adx_2 = _lag(adxs, 1), _lag(adxs, 2)
+    dip_1, dip_2 = _lag(di_plus, 1), _lag(di_plus, 2)
+    dim_1, dim_2 = _lag(di_minus, 1), _lag(di_minus, 2)
+
+    # ADX < 25: sideway | ADX > 50: xu hướng cực mạnh | còn lại: trung bình (kể cả ADX = NaN)
+    regimes = [adxs < adx_weak, adxs > adx_strong]
+    adx_falling = (adxs < adx_1) & (adx_1 < adx_2)
+
+    buy_trigger = (closes <= lowers * (1 + band_tol)) & (rsis < rsi_buy)
+    buy_reversal = (di_minus > di_plus) & (di_minus < dim_1)
+    buy_confirm = np.select(regimes, [buy_reversal, adx_falling & (di_minus < dim_1) & (dim_1 < dim_2)], default=buy_reversal)
+
+    sell_trigger = (closes >= uppers * (1 - band_tol)) & (rsis > rsi_sell)
+    sell_reversal = (di_plus > di_minus) & (di_plus < dip_1)
+    sell_confirm = np.select(regimes, [sell_reversal, adx_falling & (di_plus < dip_1) & (dip_1 < dip_2)], default=sell_reversal)
+
+    buy = buy_trigger & buy_confirm
+    sell = sell_trigger & sell_confirm
+    signals = np.zeros(np.broadcast_shapes(buy.shape, sell.shape))
+    signals[buy] = 1
+    signals[sell] = -1          # Tín hiệu bán ghi đè tín hiệu mua như vòng lặp cũ
+    signals[..., :2] = 0        # Cần đủ 2 phiên trước để so sánh
+    return signals
+
+def indicator_arrays(df):
+    return {col: df[col].values.astype(float) for col in ('Close', 'RSI', 'ADX', 'Lower', 'Upper', '+DI', '-DI')}
+
+@timed()
+def precalculate_signals(df):
+    arr = indicator_arrays(df)
+    df['Signal'] = compute_signals(arr['Close'], arr['RSI'], arr['ADX'], arr['Lower'], arr['Upper'], arr['+DI'], arr['-DI'])
+    return df
+
+# --- HÀM XỬ LÝ DỮ LIỆU SAU KHI TẢI ---
+def process_daily(df):
+    df = calculate_indicators(df)
+    return precalculate_signals(df)
+
+# --- KHUNG DỮ LIỆU GỌN (FLOAT32) ---
+# Chỉ giữ các cột mà analyze_current_market, run_simulation và biểu đồ thực sự đọc.
+# Các cột nháp (H-L, H-PC, L-PC, UpMove, DownMove, ±DM, TR, TR14, ±DM14, DX, StdDev, Volume) bị bỏ.
+COMPACT_COLUMNS = ['Open', 'High', 'Low', 'Close', 'SMA20', 'Upper', 'Lower', 'RSI', 'ADX', '+DI', '-DI']
+
+@timed()
+def compact_frame(df):
+    # Mảng (cột x phiên) C-contiguous -> mỗi cột là một dải float32 liền nhau trong một block duy nhất
+    values = np.ascontiguousarray(df[COMPACT_COLUMNS].to_numpy(dtype=np.float32).T)
+    compact = pd.DataFrame(values.T, index=df.index, columns=COMPACT_COLUMNS, copy=False)
+    compact['Signal'] = df['Signal'].to_numpy().astype(np.int8)
+    compact.attrs['memory'] = frame_memory_report(df, compact)
+    return compact
+
+def frame_memory_report(full, compact):
+    full_bytes = int(full.memory_usage(deep=True).sum())
+    compact_bytes = int(compact.memory_usage(deep=True).sum())
+    return {
+        'rows': len(full), 'full_columns': full.shape[1], 'compact_columns': compact.shape[1],
+        'full_bytes': full_bytes, 'compact_bytes': compact_bytes,
+        'saving_pct': (1 - compact_bytes / full_bytes) * 100 if full_bytes else 0.0,
+    }
+
+def localize_intraday(df_intra):
+    # Chuyển giờ về múi giờ Việt Nam (UTC+7)
+    df_intra = df_intra.copy()
+    if df_intra.index.tzinfo is None:
+        df_intra.index = df_intra.index + timedelta(hours=7)
+    else:
+        df_intra.index = df_intra.index.tz_convert('Asia/Ho_Chi_Minh')
+    return df_intra
+
+# --- PHÂN TÍCH HIỆN TẠI (DỮ LIỆU CÓ CẤU TRÚC; GIAO DIỆN TỰ DỰNG HTML) ---
+RECOMMENDATIONS = {
+    1: ("MUA NGAY", "Giá chạm đáy BB, RSI thấp. Các chỉ báo ADX/DI cho tín hiệu đảo chiều tăng."),
+    -1: ("BÁN NGAY", "Giá chạm đỉnh BB, RSI cao. Các chỉ báo ADX/DI cho tín hiệu đảo chiều giảm."),
+    0: ("QUAN SÁT (HOLD)", "Chưa có tín hiệu giao dịch đặc biệt."),
+}
+
+@timed()
+def analyze_market(df):
+    # Khuyến nghị + trạng thái chỉ báo của phiên cuối. band_position: lower/upper/inside, rsi_state: oversold/overbought/neutral
+    if len(df) < 25: return {'enough_data': False, 'signal': 0, 'recommendation': "Không đủ dữ liệu", 'reason': "Chưa đủ dữ liệu."}
+    curr = df.iloc[-1]
+    signal = int(curr['Signal'])
+    rec, reason = RECOMMENDATIONS[signal]
+    band_position = "inside"
+    if curr['Close'] <= curr['Lower'] * 1.01: band_position = "lower"
+    elif curr['Close'] >= curr['Upper'] * 0.99: band_position = "upper"
+    rsi_state = "neutral"
+    if curr['RSI'] < 30: rsi_state = "oversold"
+    elif curr['RSI'] > 70: rsi_state = "overbought"
+    return {
+        'enough_data': True, 'date': df.index[-1].strftime("%Y-%m-%d"), 'close': float(curr['Close']),
+        'signal': signal, 'recommendation': rec, 'reason': reason,
+        'trend': "TĂNG" if curr['+DI'] > curr['-DI'] else "GIẢM",
+        'trend_strength': "YẾU (Sideway)" if curr['ADX'] < 25 else ("CỰC MẠNH" if curr['ADX'] > 50 else "TRUNG BÌNH"),
+        'rsi': float(curr['RSI']), 'adx': float(curr['ADX']), 'plus_di': float(curr['+DI']), 'minus_di': float(curr['-DI']),
+        'band_position': band_position, 'rsi_state': rsi_state,
+    }
+
+# --- LOGIC CHIẾN LƯỢC ---
+def check_signals(curr, prev, prev2):
+    price = curr['Close']; rsi = curr['RSI']; adx = curr['ADX']
+    lower_band = curr['Lower']; upper_band = curr['Upper']
+    
+    buy_trigger = (price <= lower_band * 1.01) and (rsi < 30)
+    if buy_trigger:
+        if adx < 25:
+            if (curr['-DI'] > curr['+DI']) and (curr['-DI'] < prev['-DI']): return 1 
+        elif adx > 50:
+            if (curr['ADX'] < prev['ADX'] < prev2['ADX']) and (curr['-DI'] < prev['-DI'] < prev2['-DI']): return 1
+        else: 
+            if (curr['-DI'] > curr['+DI']) and (curr['-DI'] < prev['-DI']): return 1
+            
+    sell_trigger = (price >= upper_band * 0.99) and (rsi > 70)
+    if sell_trigger:
+        if adx < 25:
+            if (curr['+DI'] > curr['-DI']) and (curr['+DI'] < prev['+DI']): return -1
+        elif adx > 50:
+            if (curr['ADX'] < prev['ADX'] < prev2['ADX']) and (curr['+DI'] < prev['+DI'] < prev2['+DI']): return -1
+        else:
+            if (curr['+DI'] > curr['-DI']) and (curr['+DI'] < prev['+DI']): return -1
+            
+    return 0
+
+# --- HÀM BACKTEST THỰC THI ---
+def run_simulation(df, stop_loss_pct):
+    initial_capital = 100_000_000
+    cash = initial_capital
+    shares = 0
+    position = False
+    entry_price = 0
+    entry_date = None
+    hold_durations = [] 
+    
+    use_sl = stop_loss_pct > 0
+    if len(df) < 50: return 0, 0
+    
+    closes = df['Close'].values.astype(float)   # Khung gọn lưu float32 -> tính tiền bằng float64
+    signals = df['Signal'].values
+    dates = df.index
+    
+    for i in range(50, len(closes)):
+        price = closes[i]
+        signal = signals[i]
+        current_date = dates[i]
+        
+        if position:
+            if use_sl:
+                pct_change = (price - entry_price) / entry_price
+                if pct_change <= -(stop_loss_pct / 100.0):
+                    cash += shares * price * (1 - 0.0015)
+                    shares = 0
+                    position = False
+                    continue 
+            
+            if signal == -1: 
+                cash += shares * price * (1 - 0.0015)
+                shares = 0
+                position = False
+                days_held = (current_date - entry_date).days
+                hold_durations.append(days_held)
+                continue
+        
+        if not position and signal == 1: 
+            shares = int(cash / price)
+            if shares > 0:
+                cash -= shares * price * (1 + 0.0015)
+                entry_price = price
+                entry_date = current_date
+                position = True
+    
+    final_val = cash
+    if position: final_val += shares * closes[-1]
+    
+    total_return_pct = ((final_val - initial_capital) / initial_capital) * 100
+    days = (dates[-1] - dates[0]).days
+    years = days / 365.25 if days > 0 else 1
+    avg_annual_return = total_return_pct / years
+    avg_hold_days = sum(hold_durations) / len(hold_durations) if len(hold_durations) > 0 else 0
+    
+    return avg_annual_return, avg_hold_days
+
+# --- HÀM BACKTEST NHIỀU KỊCH BẢN CÙNG LÚC ---
+FEE_RATE = 0.0015
+EXIT_OPEN, EXIT_SIGNAL, EXIT_STOPLOSS = 0, 1, 2
+EXIT_REASONS = {EXIT_OPEN: "Đang giữ", EXIT_SIGNAL: "Tín hiệu bán", EXIT_STOPLOSS: "Cắt lỗ"}
+
+def simulate_lanes(closes, signals, day_ns, stop_loss_levels, progress_callback=None, record_trades=False):
+    # Cùng luật với run_simulation nhưng nhiều "làn" chạy song song trong MỘT lần duyệt giá:
+    # trạng thái (tiền, cổ phiếu, vị thế...) là mảng đánh chỉ số theo làn. signals là 1 chiều (mọi làn
+    # dùng chung tín hiệu, chỉ khác Stoploss) hoặc 2 chiều (làn x phiên, mỗi bộ tham số một dòng).
+    # record_trades=True: ghi thêm nhật ký lệnh (làn, phiên mua, phiên bán, số cổ phiếu, lý do thoát).
+    signals = np.atleast_2d(signals)
+    levels = np.broadcast_to(np.asarray(stop_loss_levels, dtype=float), (max(signals.shape[0], np.size(stop_loss_levels)),))
+    n_lanes = len(levels)
+    n_bars = len(closes)
+    initial_capital = 100_000_000
+
+    cash = np.full(n_lanes, float(initial_capital))
+    shares = np.zeros(n_lanes)
+    position = np.zeros(n_lanes, dtype=bool)
+    entry_price = np.ones(n_lanes)
+    entry_ns = np.zeros(n_lanes, dtype=np.int64)
+    hold_total = np.zeros(n_lanes, dtype=np.int64)
+    hold_count = np.zeros(n_lanes, dtype=np.int64)
+    trades = np.zeros(n_lanes, dtype=np.int64)
+    entry_idx = np.zeros(n_lanes, dtype=np.int64)
+    trade_log = []
+
+    use_sl = levels > 0
+    sl_limit = -(levels / 100.0)
+    active = (signals != 0).any(axis=0)   # Phiên có ít nhất một tín hiệu ở một làn nào đó
+    report_every = max(1, (n_bars - 50) // 20)
+
+    for i in range(50, n_bars):
+        if progress_callback is not None and (i - 50) % report_every == 0:
+            progress_callback((i - 49) / (n_bars - 50))
+        if not active[i] and not position.any(): continue
+
+        price = closes[i]
+        signal = signals[:, i]
+        holding = position.copy()
+
+        if holding.any():
+            pct_change = (price - entry_price) / entry_price
+            stopped = holding & use_sl & (pct_change <= sl_limit)
+            sold = holding & ~stopped & (signal == -1)
+            exited = np.flatnonzero(stopped | sold)
+            if len(exited):
+                if record_trades:
+                    reasons = np.where(stopped[exited], EXIT_STOPLOSS, EXIT_SIGNAL)
+                    trade_log.extend(zip(exited, entry_idx[exited], np.full(len(exited), i), shares[exited], reasons))
+                sold = np.flatnonzero(sold)
+                hold_total[sold] += (day_ns[i] - entry_ns[sold]) // 86_400_000_000_000
+                hold_count[sold] += 1
+                cash[exited] += shares[exited] * price * (1 - 0.0015)
+                shares[exited] = 0
+                position[exited] = False
+
+        # Chỉ các làn KHÔNG giữ cổ phiếu từ đầu phiên mới được mua
+        buy = np.flatnonzero(~holding & (signal == 1))
+        if len(buy):
+            new_shares = np.trunc(cash[buy] / price)
+            buy = buy[new_shares > 0]
+            shares[buy] = new_shares[new_shares > 0]
+            cash[buy] -= shares[buy] * price * (1 + 0.0015)
+            entry_price[buy] = price
+            entry_ns[buy] = day_ns[i]
+            entry_idx[buy] = i
+            position[buy] = True
+            trades[buy] += 1
+
+    final_val = cash + np.where(position, shares * closes[-1], 0.0)
+    total_return_pct = ((final_val - initial_capital) / initial_capital) * 100
+    days = (day_ns[-1] - day_ns[0]) // 86_400_000_000_000
+    years = days / 365.25 if days > 0 else 1
+    result = {
+        'annual_return': total_return_pct / years,
+        'avg_hold_days': np.divide(hold_total, hold_count, out=np.zeros(n_lanes), where=hold_count > 0),
+        'trades': trades,
+    }
+    if record_trades:
+        # Vị thế còn mở cuối kỳ: định giá theo giá đóng cửa phiên cuối, không tính phí bán
+        still_open = np.flatnonzero(position)
+        trade_log.extend(zip(still_open, entry_idx[still_open], np.full(len(still_open), n_bars - 1), shares[still_open], np.full(len(still_open), EXIT_OPEN)))
+        result['trade_log'] = np.array(trade_log, dtype=[('lane', np.int64), ('entry_idx', np.int64), ('exit_idx', np.int64), ('shares', float), ('reason', np.int8)])
+    return result
+
+def _day_ns(index):
+    return index.values.astype('datetime64[ns]').view(np.int64)   # Mốc thời gian (ns) để tính số ngày nắm giữ
+
+def periods_per_year(day_ns):
+    # Số nến mỗi năm suy từ khoảng cách giữa các nến (~250 nến ngày, ~52 nến tuần, ~12 nến tháng) để quy đổi Sharpe
+    if len(day_ns) < 2 or day_ns[-1] <= day_ns[0]: return 252.0
+    return (len(day_ns) - 1) / ((day_ns[-1] - day_ns[0]) / 86_400_000_000_000 / 365.25)
+
+def run_simulation_sweep(df, stop_loss_levels, progress_callback=None):
+    # Mọi mức Stoploss chạy song song trên cùng một chuỗi tín hiệu
+    n_levels = len(stop_loss_levels)
+    if len(df) < 50: return np.zeros(n_levels), np.zeros(n_levels)
+    result = simulate_lanes(df['Close'].values.astype(float), df['Signal'].values, _day_ns(df.index), stop_loss_levels, progress_callback)
+    return result['annual_return'], result['avg_hold_days']
+
+# --- BACKTEST ĐẦY ĐỦ: NHẬT KÝ LỆNH, ĐƯỜNG VỐN, CHỈ SỐ RỦI RO ---
+@timed()
+def run_backtest(df, stop_loss_pct):
+    # Một lần chạy mô phỏng -> nhật ký lệnh; đường vốn và mọi chỉ số rủi ro tính vector hóa từ đó
+    initial_capital = 100_000_000
+    closes = df['Close'].values.astype(float)
+    n_bars = len(closes)
+    empty_trades = np.zeros(0, dtype=[('entry_idx', np.int64), ('exit_idx', np.int64), ('entry_price', float), ('exit_price', float),
+                                      ('shares', float), ('fees', float), ('pnl', float), ('hold_days', np.int64), ('reason', np.int8)])
+    if n_bars < 50:
+        return {'trades': empty_trades, 'equity': np.full(n_bars, float(initial_capital)), 'drawdown': np.zeros(n_bars),
+                'metrics': {'annual_return': 0, 'avg_hold_days': 0, 'avg_hold_days_all': 0.0, 'max_drawdown': 0.0, 'sharpe': 0.0,
+                            'exposure': 0.0, 'win_rate': 0.0, 'trades': 0, 'signal_exits': 0, 'fees': 0.0}}
+
+    day_ns = _day_ns(df.index)
+    sim = simulate_lanes(closes, df['Signal'].values, day_ns, [stop_loss_pct], record_trades=True)
+    log = sim['trade_log']
+
+    trades = np.zeros(len(log), dtype=empty_trades.dtype)
+    trades['entry_idx'], trades['exit_idx'], trades['shares'], trades['reason'] = log['entry_idx'], log['exit_idx'], log['shares'], log['reason']
+    trades['entry_price'] = closes[log['entry_idx']]
+    trades['exit_price'] = closes[log['exit_idx']]
+    closed = trades['reason'] != EXIT_OPEN
+    buy_fee = trades['shares'] * trades['entry_price'] * FEE_RATE
+    sell_fee = np.where(closed, trades['shares'] * trades['exit_price'] * FEE_RATE, 0.0)
+    trades['fees'] = buy_fee + sell_fee
+    trades['pnl'] = trades['shares'] * (trades['exit_price'] - trades['entry_price']) - trades['fees']
+    trades['hold_days'] = (day_ns[log['exit_idx']] - day_ns[log['entry_idx']]) // 86_400_000_000_000
+
+    # Đường vốn = tiền mặt + cổ phiếu x giá đóng cửa; tiền và số cổ phiếu chỉ đổi ở phiên mua/bán
+    cash_delta = np.zeros(n_bars)
+    share_delta = np.zeros(n_bars)
+    np.add.at(cash_delta, trades['entry_idx'], -trades['shares'] * trades['entry_price'] * (1 + FEE_RATE))
+    np.add.at(share_delta, trades['entry_idx'], trades['shares'])
+    np.add.at(cash_delta, trades['exit_idx'][closed], trades['shares'][closed] * trades['exit_price'][closed] * (1 - FEE_RATE))
+    np.add.at(share_delta, trades['exit_idx'][closed], -trades['shares'][closed])
+    held = np.cumsum(share_delta)
+    equity = initial_capital + np.cumsum(cash_delta) + held * closes
+
+    active = equity[50:]
+    drawdown = active / np.maximum.accumulate(active) - 1
+    daily = np.diff(active) / active[:-1]
+    sharpe = daily.mean() / daily.std() * np.sqrt(periods_per_year(day_ns[50:])) if len(daily) > 1 and daily.std() > 0 else 0.0
+    signal_exits = trades['reason'] == EXIT_SIGNAL
+    metrics = {
+        'annual_return': float(sim['annual_return'][0]),
+        'avg_hold_days': float(sim['avg_hold_days'][0]),   # Như run_simulation: chỉ tính lệnh thoát theo tín hiệu
+        'avg_hold_days_all': float(trades['hold_days'].mean()) if len(trades) else 0.0,
+        'max_drawdown': float(drawdown.min() * 100),
+        'sharpe': float(sharpe),
+        'exposure': float((held[50:] > 0).mean() * 100),
+        'win_rate': float((trades['pnl'][closed] > 0).mean() * 100) if closed.any() else 0.0,
+        'trades': int(len(trades)),
+        'signal_exits': int(signal_exits.sum()),
+        'fees': float(trades['fees'].sum()),
+    }
+    return {'trades': trades, 'equity': equity, 'drawdown': np.concatenate([np.zeros(50), drawdown * 100]), 'metrics': metrics}
+
+def trades_frame(df, trades):
+    # Nhật ký lệnh dạng bảng để hiển thị / xuất CSV
+    return pd.DataFrame({
+        'Ngày mua': df.index[trades['entry_idx']], 'Giá mua': trades['entry_price'],
+        'Ngày bán': df.index[trades['exit_idx']], 'Giá bán': trades['exit_price'],
+        'Số CP': trades['shares'].astype(np.int64), 'Phí': trades['fees'], 'Lãi/lỗ': trades['pnl'],
+        'Số ngày': trades['hold_days'], 'Lý do': [EXIT_REASONS[int(r)] for r in trades['reason']],
+    })
+
+# --- HÀM TÌM STOPLOSS TỐI ƯU ---
+DEFAULT_SL_LEVELS = [x * 0.5 for x in range(21)]   # 21 kịch bản 0% - 10%, bước 0.5%
+
+@timed()
+def optimize_stoploss(df, stop_loss_levels=None, progress_callback=None):
+    # Có thể truyền lưới mịn hơn, VD np.arange(0, 20.05, 0.05)
+    levels = np.asarray(DEFAULT_SL_LEVELS if stop_loss_levels is None else stop_loss_levels, dtype=float)
+    returns, holds = run_simulation_sweep(df, levels, progress_callback=progress_callback)
+    best = int(np.argmax(returns))   # Mức đầu tiên đạt lợi nhuận cao nhất
+    return float(levels[best]), float(returns[best]), float(holds[best])
+
+# --- PHÂN TÍCH TRỌN GÓI MỘT MÃ (DÙNG CHO CHẠY NỀN / CLI) ---
+def analyze_symbol(df, stop_loss_pct=7.0, stop_loss_levels=None):
+    # df: OHLCV thô. Trả về dict phẳng: khuyến nghị, chỉ số backtest với stop_loss_pct và stoploss tối ưu
+    df = process_daily(df.copy())
+    record = analyze_market(df)
+    record['bars'] = len(df)
+    record['stop_loss'] = float(stop_loss_pct)
+    record.update(run_backtest(df, stop_loss_pct)['metrics'])
+    opt_sl, opt_return, opt_hold = optimize_stoploss(df, stop_loss_levels)
+    record.update({'opt_stoploss': opt_sl, 'opt_annual_return': opt_return, 'opt_avg_hold_days': opt_hold})
+    return record
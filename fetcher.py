@@ -0,0 +1,153 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import pandas as pd
+from data_store import OHLCVStore
+from engine import process_daily, compact_frame, localize_intraday
+from shared_cache import DATA_CACHE
+from shared_store import SHARED_STORE
+from telemetry import span
+
+# --- LỚP TẢI DỮ LIỆU ĐỒNG THỜI ---
+# Mỗi lần gọi nhà cung cấp chạy trên một luồng I/O (tối đa max_concurrency luồng cùng lúc), có hạn thời gian
+# riêng và được thử lại với thời gian chờ tăng dần (backoff mũ + jitter). Nến ngày và nến trong phiên của
+# một mã được tải song song; danh sách theo dõi được tải nền trên một nhóm luồng riêng nhỏ hơn để không
+# chiếm chỗ của yêu cầu người dùng đang chờ. Kết quả đi qua DATA_CACHE nên tải nền xong là lần mở sau lấy ngay.
+
+class FetchError(Exception):
+    def __init__(self, label, attempts, cause):
+        self.label = label
+        self.attempts = attempts
+        self.cause = cause
+        super().__init__(f"{label}: thất bại sau {attempts} lần thử ({cause})")
+
+class FetchTimeout(FetchError):
+    pass
+
+class Fetcher:
+    def __init__(self, max_concurrency=4, timeout=30.0, retries=2, backoff=0.5, max_backoff=8.0, sleep=time.sleep):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self._io = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="fetch-io")
+        self._tasks = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="fetch-task")
+        self._background = ThreadPoolExecutor(max_workers=max(1, max_concurrency // 2), thread_name_prefix="fetch-prefetch")
+        self._lock = threading.Lock()
+        self.attempts = self.retries_used = self.timeouts = self.failures = 0
+
+    def _count(self, name):
+        with self._lock: setattr(self, name, getattr(self, name) + 1)
+
+    def backoff_delay(self, attempt):
+        # Lần thử thứ attempt (từ 1): backoff * 2^(attempt-1), tối đa max_backoff, nhân jitter 50-100%
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def call(self, fn, label=""):
+        # Chạy fn() trên luồng I/O, mỗi lần thử chờ tối đa timeout giây tính từ lúc gửi (kể cả thời gian xếp hàng chờ
+        # tới lượt), thử lại tối đa retries lần. Lần thử quá hạn còn trong hàng đợi bị hủy; đã chạy thì bị bỏ rơi
+        # (luồng vẫn chạy tới khi timeout của chính provider cắt).
+        last = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count('retries_used')
+                self.sleep(self.backoff_delay(attempt))
+            self._count('attempts')
+            future = self._io.submit(contextvars.copy_context().run, fn)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()
+                self._count('timeouts')
+                last = TimeoutError(f"quá {self.timeout:g}s")
+            except Exception as e:
+                last = e
+        self._count('failures')
+        error_cls = FetchTimeout if isinstance(last, TimeoutError) else FetchError
+        raise error_cls(label, self.retries + 1, last)
+
+    # Chạy trong bản sao ngữ cảnh để span trên luồng tải vẫn được gom vào trace của lượt chạy đã gửi yêu cầu
+    def submit(self, fn, *args, **kwargs):
+        return self._tasks.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def submit_background(self, fn, *args, **kwargs):
+        return self._background.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {'attempts': self.attempts, 'retries': self.retries_used, 'timeouts': self.timeouts, 'failures': self.failures,
+                    'max_concurrency': self.max_concurrency, 'timeout': self.timeout}
+
+FETCHER = Fetcher(max_concurrency=int(os.environ.get("STOCK_FETCH_CONCURRENCY", "4")),
+                  timeout=float(os.environ.get("STOCK_FETCH_TIMEOUT", "30")))
+
+# --- TẢI MỘT MÃ ---
+def frame_bytes(df):
+    # Ước lượng lượng dữ liệu nhận về (kích thước khung trong bộ nhớ - yfinance không báo số byte trên đường truyền)
+    return int(df.memory_usage(index=True).sum()) if df is not None else 0
+
+def _download(stage, fn, symbol):
+    with span(stage, symbol=symbol) as sp:
+        df = fn()
+        sp.set(rows=len(df), bytes=frame_bytes(df))
+        return df
+
+def load_daily(symbol, fetcher=None, cache=DATA_CACHE, store=None, shared=SHARED_STORE):
+    # shared: kho ánh xạ bộ nhớ dùng chung giữa các tiến trình. Bản còn hạn do tiến trình khác ghi được dùng ngay
+    # (không tải, không tính); bản tự tính được xuất bản vào kho và trả về dạng ánh xạ thay cho bản sao riêng.
+    fetcher = fetcher or FETCHER
+    store = store if store is not None else OHLCVStore()
+    with span("load_daily", symbol=symbol, cache="hit") as sp:
+        mapped = shared.get_fresh(symbol) if shared is not None else None
+        if mapped is not None:
+            sp.set(cache="shared", rows=len(mapped))
+            return mapped
+        def fetch():
+            sp.set(cache="miss")
+            try:
+                return fetcher.call(lambda: _download("download_daily", lambda: store.load(symbol), symbol), f"{symbol} 1d")
+            except FetchError:
+                # Nguồn lỗi nhưng kho cục bộ còn dữ liệu -> dùng tạm bản đã lưu
+                cached = store.read(symbol)
+                if cached is None or cached.empty: raise
+                return cached
+        def process(raw):
+            frame = compact_frame(process_daily(raw))
+            mapped = shared.publish(symbol, frame) if shared is not None else None
+            return frame if mapped is None else mapped      # Không xuất bản được -> dùng bản riêng
+        df = cache.get_or_compute(symbol, "1d", fetch=fetch, process=process)
+        sp.set(rows=len(df))
+        return df
+
+def load_intraday(symbol, fetcher=None, cache=DATA_CACHE, store=None, interval="5m"):
+    fetcher = fetcher or FETCHER
+    provider = (store if store is not None else OHLCVStore()).provider
+    with span("load_intraday", symbol=symbol, cache="hit") as sp:
+        def fetch():
+            sp.set(cache="miss")
+            return fetcher.call(lambda: _download("download_intraday", lambda: provider.fetch_intraday(symbol, interval), symbol), f"{symbol} {interval}")
+        df = cache.get_or_compute(symbol, interval, fetch=fetch, process=localize_intraday)
+        sp.set(rows=len(df))
+        return df
+
+def load_symbol(symbol, fetcher=None, cache=DATA_CACHE, store=None, shared=SHARED_STORE):
+    # Tải song song nến ngày và nến trong phiên. Trả về (df_daily, df_intra, lỗi intraday hoặc None).
+    # Lỗi nến ngày được ném ra (FetchError / FetchTimeout); lỗi intraday chỉ làm mất biểu đồ trong ngày.
+    fetcher = fetcher or FETCHER
+    daily = fetcher.submit(load_daily, symbol, fetcher, cache, store, shared)
+    intra = fetcher.submit(load_intraday, symbol, fetcher, cache, store)
+    df_daily = daily.result()
+    try:
+        return df_daily, intra.result(), None
+    except FetchError as e:
+        return df_daily, pd.DataFrame(), e
+
+def prefetch(symbols, fetcher=None, cache=DATA_CACHE, store=None, shared=SHARED_STORE):
+    # Tải nền danh sách theo dõi vào cache; trả về {symbol: future}. Lỗi nằm trong future, không ném ra.
+    fetcher = fetcher or FETCHER
+    return {symbol: fetcher.submit_background(load_symbol, symbol, fetcher, cache, store, shared) for symbol in symbols}
@@ -0,0 +1,169 @@
+import copy
+import math
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# --- TRẠNG THÁI CHỈ BÁO CẬP NHẬT TỪNG PHIÊN ---
+# Giữ đúng những gì calculate_indicators cần để tính phiên kế tiếp: cửa sổ 20 giá đóng cửa
+# (tổng và tổng bình phương cho Bollinger Bands) và giá trị EWM cuối của RSI, TR14, ±DM14, ADX.
+# Mỗi phiên mới chỉ tốn O(1) thay vì tính lại cả khung dữ liệu.
+
+BB_WINDOW = 20
+BB_MULT = 2
+WILDER_ALPHA = 1 / 14
+RSI_MIN_PERIODS = 14
+
+def _div(a, b):
+    # Chia theo kiểu pandas: x/0 -> inf, 0/0 -> NaN (float Python sẽ báo lỗi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return float(np.float64(a) / np.float64(b))
+
+class _Ewm:
+    # Sao chép từng bước thuật toán ewm(adjust=False, ignore_na=False) của pandas
+    def __init__(self, min_periods=0):
+        self.weighted = math.nan
+        self.old_wt = 1.0
+        self.nobs = 0
+        self.min_periods = max(min_periods, 1)
+
+    def update(self, x):
+        is_obs = x == x
+        self.nobs += int(is_obs)
+        if self.weighted == self.weighted:
+            self.old_wt *= 1 - WILDER_ALPHA
+            if is_obs:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + WILDER_ALPHA * x) / (self.old_wt + WILDER_ALPHA)
+                self.old_wt = 1.0
+        elif is_obs:
+            self.weighted = x
+        return self.weighted if self.nobs >= self.min_periods else math.nan
+
+class IndicatorState:
+    def __init__(self):
+        self.window = deque(maxlen=BB_WINDOW)
+        self.win_sum = 0.0
+        self.win_sumsq = 0.0
+        self.win_nan = 0
+        self.win_shift = 0.0
+        self.pushes = 0
+        self.prev_close = math.nan
+        self.prev_high = math.nan
+        self.prev_low = math.nan
+        self.avg_gain = _Ewm(RSI_MIN_PERIODS)
+        self.avg_loss = _Ewm(RSI_MIN_PERIODS)
+        self.tr14 = _Ewm()
+        self.pdm14 = _Ewm()
+        self.mdm14 = _Ewm()
+        self.adx = _Ewm()
+        self.last_date = None
+        self.bars = 0
+
+    @classmethod
+    def from_frame(cls, df):
+        # Dựng trạng thái từ lịch sử một lần duy nhất
+        state = cls()
+        for date, high, low, close in zip(df.index, df['High'].values, df['Low'].values, df['Close'].values):
+            state.update(high, low, close, date)
+        return state
+
+    def _push_close(self, close):
+        # Tổng và tổng bình phương tính trên (giá - win_shift) để tránh triệt tiêu số khi giá lớn
+        if len(self.window) == BB_WINDOW:
+            old = self.window[0]
+            if old == old:
+                self.win_sum -= old - self.win_shift
+                self.win_sumsq -= (old - self.win_shift) ** 2
+            else:
+                self.win_nan -= 1
+        self.window.append(close)
+        if close == close:
+            self.win_sum += close - self.win_shift
+            self.win_sumsq += (close - self.win_shift) ** 2
+        else:
+            self.win_nan += 1
+        # Cộng trừ liên tục sẽ tích lũy sai số -> sau mỗi vòng cửa sổ dời tâm và tính lại tổng
+        self.pushes += 1
+        if self.pushes % BB_WINDOW == 0:
+            valid = [v for v in self.window if v == v]
+            self.win_shift = math.fsum(valid) / len(valid) if valid else 0.0
+            self.win_sum = math.fsum(v - self.win_shift for v in valid)
+            self.win_sumsq = math.fsum((v - self.win_shift) ** 2 for v in valid)
+
+    def update(self, high, low, close, date=None):
+        high, low, close = float(high), float(low), float(close)
+        self._push_close(close)
+        if len(self.window) == BB_WINDOW and self.win_nan == 0:
+            mean_dev = self.win_sum / BB_WINDOW
+            sma = self.win_shift + mean_dev
+            var = (self.win_sumsq - self.win_sum * mean_dev) / (BB_WINDOW - 1)
+            std = math.sqrt(max(var, 0.0))
+        else:
+            sma = std = math.nan
+
+        delta = close - self.prev_close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        rsi = 100 - _div(100, 1 + _div(self.avg_gain.update(gain), self.avg_loss.update(loss)))
+
+        # TR bỏ qua NaN như df[[...]].max(axis=1); ±DM = 0 khi không so sánh được
+        ranges = [v for v in (high - low, abs(high - self.prev_close), abs(low - self.prev_close)) if v == v]
+        tr = max(ranges) if ranges else math.nan
+        up_move = high - self.prev_high
+        down_move = self.prev_low - low
+        plus_dm = up_move if (up_move > down_move and up_move > 0) else 0.0
+        minus_dm = down_move if (down_move > up_move and down_move > 0) else 0.0
+
+        tr14 = self.tr14.update(tr)
+        plus_dm14 = self.pdm14.update(plus_dm)
+        minus_dm14 = self.mdm14.update(minus_dm)
+        plus_di = 100 * _div(plus_dm14, tr14)
+        minus_di = 100 * _div(minus_dm14, tr14)
+        dx = _div(100 * abs(plus_di - minus_di), plus_di + minus_di)
+        adx = self.adx.update(dx)
+
+        self.prev_close, self.prev_high, self.prev_low = close, high, low
+        self.last_date = date if date is not None else self.last_date
+        self.bars += 1
+        return {
+            'SMA20': sma, 'StdDev': std, 'Upper': sma + BB_MULT * std, 'Lower': sma - BB_MULT * std,
+            'RSI': rsi, 'TR': tr, 'TR14': tr14, '+DM14': plus_dm14, '-DM14': minus_dm14,
+            '+DI': plus_di, '-DI': minus_di, 'DX': dx, 'ADX': adx,
+        }
+
+    def preview(self, high, low, close):
+        # Tính chỉ báo cho một phiên tạm tính (chưa đóng cửa) mà không thay đổi trạng thái
+        return copy.deepcopy(self).update(high, low, close)
+
+    def catch_up(self, df):
+        # Áp dụng các phiên mới hơn last_date, trả về khung chỉ báo của riêng các phiên đó
+        if self.last_date is not None: df = df[df.index > self.last_date]
+        rows = [self.update(h, l, c, d) for d, h, l, c in zip(df.index, df['High'].values, df['Low'].values, df['Close'].values)]
+        return pd.DataFrame(rows, index=df.index)
+
+    def snapshot(self):
+        ewms = {name: [e.weighted, e.old_wt, e.nobs, e.min_periods] for name, e in
+                (('avg_gain', self.avg_gain), ('avg_loss', self.avg_loss), ('tr14', self.tr14),
+                 ('pdm14', self.pdm14), ('mdm14', self.mdm14), ('adx', self.adx))}
+        return {
+            'window': list(self.window), 'win_sum': self.win_sum, 'win_sumsq': self.win_sumsq,
+            'win_nan': self.win_nan, 'win_shift': self.win_shift, 'pushes': self.pushes,
+            'prev': [self.prev_high, self.prev_low, self.prev_close], 'ewm': ewms,
+            'last_date': None if self.last_date is None else pd.Timestamp(self.last_date).isoformat(),
+            'bars': self.bars,
+        }
+
+    @classmethod
+    def restore(cls, snap):
+        state = cls()
+        state.window.extend(snap['window'])
+        state.win_sum, state.win_sumsq = snap['win_sum'], snap['win_sumsq']
+        state.win_nan, state.win_shift, state.pushes = snap['win_nan'], snap['win_shift'], snap['pushes']
+        state.prev_high, state.prev_low, state.prev_close = snap['prev']
+        for name, (weighted, old_wt, nobs, min_periods) in snap['ewm'].items():
+            ewm = getattr(state, name)
+            ewm.weighted, ewm.old_wt, ewm.nobs, ewm.min_periods = weighted, old_wt, nobs, min_periods
+        state.last_date = None if snap['last_date'] is None else pd.Timestamp(snap['last_date'])
+        state.bars = snap['bars']
+        return state
@@ -0,0 +1,239 @@
+import argparse
+import os
+import time
+import zlib
+import numpy as np
+import pandas as pd
+from data_store import OHLCVStore, OHLCV_COLUMNS
+from engine import compute_signals, localize_intraday
+from fetcher import FETCHER, frame_bytes
+from indicator_state import IndicatorState
+from telemetry import span
+
+# --- CHẾ ĐỘ TRỰC TIẾP: NẾN TRONG PHIÊN CẬP NHẬT GIA TĂNG ---
+# Mỗi lần cập nhật chỉ xin nguồn các nến từ mốc thời gian của nến cuối đã có (nến đang chạy được gửi lại với giá mới
+# nhất, các nến sau đó là nến mới) thay vì tải lại cả phiên. Nến nhận về được ghi vào một vòng đệm cố định sức chứa;
+# nến ngày "hôm nay" tạm tính được gộp dần (mở cửa, cao/thấp nhất, khối lượng của các nến đã đóng + nến đang chạy)
+# và chỉ báo ngày tính bằng IndicatorState.preview() trên trạng thái của các phiên đã đóng -> O(1) mỗi lần cập nhật.
+# Băng thông và CPU mỗi lần cập nhật không tăng theo thời gian trong phiên (vòng đệm giới hạn cả chi phí vẽ biểu đồ).
+# Nguồn dữ liệu cắm được: ProviderFeed bọc provider của OHLCVStore (Yahoo, CSV...), SimulatedFeed là phiên giả lập
+# chạy theo đồng hồ để chạy thử ngoài giờ giao dịch / không có mạng (STOCK_LIVE_FEED=sim).
+# Thời gian trong vòng đệm là UTC không múi giờ như chỉ mục của yfinance; ngày giao dịch tính theo giờ Việt Nam.
+
+RING_CAPACITY = 512        # > 288 nến 5 phút của một ngày -> cả phiên luôn nằm trong vòng đệm
+LIVE_POLL_SECONDS = float(os.environ.get("STOCK_LIVE_POLL", "15"))
+SIGNAL_COLUMNS = ('Close', 'RSI', 'ADX', 'Lower', 'Upper', '+DI', '-DI')
+VN_OFFSET_NS = 7 * 3_600_000_000_000
+DAY_NS = 86_400_000_000_000
+
+def _utc_ns(index):
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None: index = index.tz_convert("UTC").tz_localize(None)
+    return index.as_unit("ns").asi8
+
+def _interval_seconds(interval):
+    return int(interval[:-1]) * {"m": 60, "h": 3600}[interval[-1]]
+
+# --- NGUỒN DỮ LIỆU ---
+# Mọi nguồn cần hàm poll(symbol, since) trả về khung OHLCV các nến có thời gian >= since (since=None: cả phiên gần nhất)
+class ProviderFeed:
+    def __init__(self, provider=None, interval="5m"):
+        self.provider = provider if provider is not None else OHLCVStore().provider
+        self.interval = interval
+
+    def poll(self, symbol, since=None):
+        return self.provider.fetch_intraday(symbol, self.interval, start=since)
+
+class SimulatedFeed:
+    # Phiên giả lập 9:00-15:00 giờ VN theo đồng hồ clock: đường giá từng giây cố định theo (mã, ngày), nến đang chạy
+    # chỉ gồm các giây đã trôi qua nên giá của nó đổi dần giữa hai lần poll như nguồn thật
+    def __init__(self, interval="5m", clock=time.time, seed=0, start_price=20_000.0, volatility=0.0004):
+        self.interval = interval
+        self.clock = clock
+        self.seed = seed
+        self.start_price = start_price
+        self.volatility = volatility
+        self._paths = {}       # symbol -> (ngày, giá từng giây, khối lượng từng giây); chỉ giữ ngày gần nhất
+
+    def _path(self, symbol, day):
+        cached = self._paths.get(symbol)
+        if cached is not None and cached[0] == day: return cached[1], cached[2]
+        rng = np.random.default_rng([zlib.crc32(symbol.encode()), int(day // DAY_NS), self.seed])
+        seconds = 6 * 3600
+        prices = self.start_price * np.exp(np.cumsum(rng.normal(0, self.volatility, seconds)))
+        volumes = rng.integers(0, 2_000, seconds).astype(float)
+        self._paths[symbol] = (day, prices, volumes)
+        return prices, volumes
+
+    def poll(self, symbol, since=None):
+        now_ns = int(self.clock() * 1e9)
+        day = (now_ns + VN_OFFSET_NS) // DAY_NS * DAY_NS - VN_OFFSET_NS     # 0:00 giờ VN, tính bằng UTC
+        session_open = day + 9 * 3_600_000_000_000
+        prices, volumes = self._path(symbol, day)
+        elapsed = min((now_ns - session_open) // 1_000_000_000 + 1, len(prices))
+        if elapsed <= 0: return pd.DataFrame(columns=OHLCV_COLUMNS)
+        step = _interval_seconds(self.interval)
+        first = 0 if since is None else max((_utc_ns([since])[0] - session_open) // (step * 1_000_000_000), 0)
+        starts = np.arange(first * step, elapsed, step)
+        if not len(starts): return pd.DataFrame(columns=OHLCV_COLUMNS)
+        seg_p, seg_v = prices[starts[0]:elapsed], volumes[starts[0]:elapsed]
+        offsets = starts - starts[0]
+        df = pd.DataFrame({'Open': seg_p[offsets], 'High': np.maximum.reduceat(seg_p, offsets), 'Low': np.minimum.reduceat(seg_p, offsets),
+                           'Close': seg_p[np.append(offsets[1:], len(seg_p)) - 1], 'Volume': np.add.reduceat(seg_v, offsets)},
+                          index=pd.DatetimeIndex(session_open + starts * 1_000_000_000, name="Datetime"))
+        return df
+
+# --- VÒNG ĐỆM NẾN TRONG PHIÊN ---
+class IntradayRing:
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros((capacity, len(OHLCV_COLUMNS)))
+        self.start = self.size = 0
+
+    @property
+    def last_time(self):
+        return int(self.times[(self.start + self.size - 1) % self.capacity]) if self.size else None
+
+    def last_row(self):
+        return self.values[(self.start + self.size - 1) % self.capacity]
+
+    def push(self, ts, row):
+        # Cùng mốc với nến cuối -> ghi đè (nến đang chạy đổi giá); mốc mới -> thêm, đầy thì đè nến cũ nhất
+        if self.size and ts == self.last_time:
+            self.values[(self.start + self.size - 1) % self.capacity] = row
+            return False
+        pos = (self.start + self.size) % self.capacity
+        self.times[pos], self.values[pos] = ts, row
+        if self.size == self.capacity: self.start = (self.start + 1) % self.capacity
+        else: self.size += 1
+        return True
+
+    def clear(self):
+        self.start = self.size = 0
+
+    def frame(self):
+        order = (self.start + np.arange(self.size)) % self.capacity
+        return pd.DataFrame(self.values[order], index=pd.DatetimeIndex(self.times[order], name="Datetime"), columns=OHLCV_COLUMNS)
+
+# --- PHIÊN TRỰC TIẾP CỦA MỘT MÃ ---
+class LiveSession:
+    def __init__(self, symbol, daily, feed=None, fetcher=None, capacity=RING_CAPACITY):
+        self.symbol = symbol
+        self.daily = daily            # Khung ngày đã có chỉ báo (High/Low/Close + SIGNAL_COLUMNS)
+        self.feed = feed if feed is not None else default_feed(start_price=float(daily['Close'].iloc[-1]))
+        self.fetcher = fetcher
+        self.ring = IntradayRing(capacity)
+        self.session_day = None       # Ngày giao dịch (ns, 0:00 giờ VN) của các nến trong vòng đệm
+        self.state = None             # IndicatorState sau phiên ngày đã đóng cuối cùng
+        self.tail = None              # 2 phiên ngày đã đóng cuối (SIGNAL_COLUMNS) để tính tín hiệu
+        self.closed = None            # [mở cửa, cao nhất, thấp nhất, khối lượng] của các nến đã đóng trong phiên
+        self.ticks = self.bars_received = self.bytes_received = 0
+        self.last_new = 0
+
+    def _seed(self, day):
+        # Lịch sử ngày trước phiên đang chạy: bỏ nến ngày cuối nếu chính là hôm nay (nến tạm của nguồn nến ngày)
+        daily = self.daily
+        if len(daily) and _utc_ns(daily.index[-1:])[0] // DAY_NS * DAY_NS >= day: daily = daily.iloc[:-1]
+        self.state = IndicatorState.from_frame(daily)
+        self.tail = {col: daily[col].to_numpy(dtype=float)[-2:] for col in SIGNAL_COLUMNS}
+
+    def _roll(self, day):
+        # Sang phiên mới: chốt phiên trước vào trạng thái ngày (O(1)) rồi làm trống vòng đệm
+        if self.state is None:
+            self._seed(day)
+        elif self.ring.size:
+            bar = self.provisional()
+            self.state.update(bar['High'], bar['Low'], bar['Close'], bar['Date'])
+            self.tail = {col: np.append(self.tail[col], bar[col])[-2:] for col in SIGNAL_COLUMNS}
+        self.ring.clear()
+        self.closed = None
+        self.session_day = day
+
+    def _fold(self, row):
+        o, h, l, _, v = row
+        if self.closed is None: self.closed = [o, h, l, v]
+        else: self.closed = [self.closed[0], max(self.closed[1], h), min(self.closed[2], l), self.closed[3] + v]
+
+    def apply(self, bars):
+        # Đưa các nến nhận về vào vòng đệm; trả về số nến mới (không tính nến đang chạy được cập nhật)
+        if bars is None or bars.empty: return 0
+        times = _utc_ns(bars.index)
+        values = bars.reindex(columns=OHLCV_COLUMNS).to_numpy(dtype=float, copy=True)
+        values[:, 4] = np.nan_to_num(values[:, 4])
+        new = 0
+        for ts, row in zip(times, values):
+            if row[3] != row[3]: continue                           # Nến chưa có giá
+            last = self.ring.last_time
+            if last is not None and ts < last: continue             # Cũ hơn nến cuối đã có
+            day = (ts + VN_OFFSET_NS) // DAY_NS * DAY_NS - VN_OFFSET_NS
+            if day != self.session_day: self._roll(day)
+            elif ts > last: self._fold(self.ring.last_row())
+            new += self.ring.push(ts, row)
+        return new
+
+    def tick(self):
+        fetcher = self.fetcher or FETCHER
+        since = self.ring.last_time
+        since = None if since is None else pd.Timestamp(since)
+        with span("live_tick", symbol=self.symbol, since=str(since)) as sp:
+            bars = fetcher.call(lambda: self.feed.poll(self.symbol, since), f"{self.symbol} live")
+            self.last_new = self.apply(bars)
+            received = frame_bytes(bars)
+            sp.set(rows=len(bars), new=self.last_new, bytes=received)
+        self.ticks += 1
+        self.bars_received += len(bars)
+        self.bytes_received += received
+        return self.last_new
+
+    def intraday(self):
+        return localize_intraday(self.ring.frame()) if self.ring.size else pd.DataFrame(columns=OHLCV_COLUMNS)
+
+    def provisional(self):
+        # Nến ngày hôm nay tạm tính (gộp các nến trong phiên) kèm chỉ báo và tín hiệu; None nếu chưa có nến nào
+        if not self.ring.size: return None
+        o, h, l, c, v = self.ring.last_row()
+        if self.closed is not None:
+            o, h, l, v = self.closed[0], max(self.closed[1], h), min(self.closed[2], l), self.closed[3] + v
+        bar = {'Date': pd.Timestamp(self.session_day + VN_OFFSET_NS), 'Open': o, 'High': h, 'Low': l, 'Close': c, 'Volume': v}
+        bar.update(self.state.preview(h, l, c))
+        # Tín hiệu chỉ cần 2 phiên trước đó: mảng 3 phần tử, phiên tạm tính ở cuối
+        signals = compute_signals(*(np.append(self.tail[col], bar[col]) for col in SIGNAL_COLUMNS))
+        bar['Signal'] = int(signals[-1])
+        bar['prev_close'] = float(self.tail['Close'][-1]) if len(self.tail['Close']) else float('nan')
+        return bar
+
+    def stats(self):
+        return {'ticks': self.ticks, 'bars': self.ring.size, 'bars_received': self.bars_received, 'bytes_received': self.bytes_received,
+                'last_new': self.last_new}
+
+def default_feed(interval="5m", start_price=20_000.0):
+    # start_price chỉ dùng cho phiên giả lập (đặt bằng giá đóng cửa gần nhất để nối liền với nến ngày)
+    return SimulatedFeed(interval, start_price=start_price) if os.environ.get("STOCK_LIVE_FEED") == "sim" else ProviderFeed(interval=interval)
+
+def main(argv=None):
+    # Chạy thử một phiên giả lập: đồng hồ tua nhanh, in thời gian / số nến / số byte của từng lần cập nhật
+    parser = argparse.ArgumentParser(description="Chạy thử chế độ trực tiếp trên phiên giả lập")
+    parser.add_argument("ticker", nargs="?", default="HPG.VN")
+    parser.add_argument("--bars", type=int, default=3000, help="Số phiên ngày lịch sử giả lập")
+    parser.add_argument("--step", type=float, default=60.0, help="Số giây đồng hồ giả lập trôi qua giữa hai lần cập nhật")
+    args = parser.parse_args(argv)
+    from benchmark import synthetic_ohlcv
+    from engine import process_daily
+    session_open = pd.Timestamp.today().normalize() + pd.Timedelta(hours=2)
+    now = [session_open.timestamp()]
+    daily = process_daily(synthetic_ohlcv(args.bars))
+    live = LiveSession(args.ticker, daily, SimulatedFeed(clock=lambda: now[0], start_price=float(daily['Close'].iloc[-1])))
+    for i in range(int(6 * 3600 / args.step)):
+        now[0] += args.step
+        t0 = time.perf_counter()
+        live.tick()
+        bar = live.provisional()
+        ms = (time.perf_counter() - t0) * 1000
+        if i % max(1, int(1800 / args.step)) == 0:
+            print(f"{pd.Timestamp(now[0], unit='s') + pd.Timedelta(hours=7):%H:%M} {ms:6.2f} ms  nến {live.ring.size:3d}  "
+                  f"giá {bar['Close']:,.0f}  RSI {bar['RSI']:.1f}  tín hiệu {bar['Signal']:+d}")
+    print(live.stats())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from engine import calculate_indicators, compute_signals, indicator_arrays, simulate_lanes, _day_ns
+
+# --- TỐI ƯU THAM SỐ CHIẾN LƯỢC (BB / RSI / ADX) ---
+# RSI, ADX, ±DI không phụ thuộc tham số nên chỉ tính một lần. Dải Bollinger chỉ tính lại khi đổi
+# cửa sổ / hệ số nhân. Đổi ngưỡng chỉ đổi mặt nạ tín hiệu -> toàn bộ các bộ tham số của một khối
+# được đưa vào simulate_lanes thành các "làn" và backtest trong một lần duyệt giá.
+
+PARAM_NAMES = ['bb_window', 'bb_mult', 'band_tol', 'rsi_buy', 'rsi_sell', 'adx_weak', 'adx_strong']
+DEFAULT_PARAMS = {'bb_window': 20, 'bb_mult': 2.0, 'band_tol': 0.01, 'rsi_buy': 30, 'rsi_sell': 70, 'adx_weak': 25, 'adx_strong': 50}
+DEFAULT_GRID = {
+    'bb_window': [15, 20, 25, 30],
+    'bb_mult': [1.5, 2.0, 2.5],
+    'band_tol': [0.0, 0.01, 0.02],
+    'rsi_buy': [25, 30, 35],
+    'rsi_sell': [65, 70, 75],
+    'adx_weak': [20, 25],
+    'adx_strong': [40, 50],
+}
+# Dưới ngưỡng (số bộ tham số x số phiên) này, khởi động tiến trình con + gửi khung dữ liệu tốn hơn cả phần tính
+# (VD 1296 bộ x 5000 phiên: 0.3s một tiến trình, 0.7s bốn tiến trình) -> tính ngay trong tiến trình hiện tại
+POOL_MIN_CELLS = 50_000_000
+
+def grid_combinations(grid=None):
+    grid = grid or DEFAULT_GRID
+    names = [n for n in PARAM_NAMES if n in grid]
+    combos = pd.DataFrame(list(itertools.product(*(grid[n] for n in names))), columns=names)
+    for name in PARAM_NAMES:
+        if name not in combos: combos[name] = DEFAULT_PARAMS[name]
+    return combos[PARAM_NAMES]
+
+def random_combinations(n, grid=None, seed=0):
+    # Lấy ngẫu nhiên n bộ tham số (không lặp) từ lưới
+    combos = grid_combinations(grid)
+    if n >= len(combos): return combos
+    return combos.sample(n=n, random_state=seed).reset_index(drop=True)
+
+# --- ĐÁNH GIÁ MỘT KHỐI BỘ THAM SỐ (CHẠY TRONG TIẾN TRÌNH CON) ---
+def evaluate_combinations(df, combos, stop_loss=7.0):
+    # df: khung đã qua calculate_indicators; combos: DataFrame với các cột PARAM_NAMES
+    combos = combos.reset_index(drop=True)
+    arr = indicator_arrays(df)
+    closes = arr['Close']
+    n_bars = len(closes)
+    signals = np.zeros((len(combos), n_bars), dtype=np.int8)
+    rolling = {}
+
+    for (window, mult), group in combos.groupby(['bb_window', 'bb_mult'], sort=False):
+        if window not in rolling:
+            roll = df['Close'].astype(float).rolling(window=int(window))
+            rolling[window] = (roll.mean().values, roll.std().values)
+        sma, std = rolling[window]
+        col = lambda name: group[name].to_numpy(dtype=float)[:, None]
+        signals[group.index.to_numpy()] = compute_signals(
+            closes, arr['RSI'], arr['ADX'], sma - mult * std, sma + mult * std, arr['+DI'], arr['-DI'],
+            band_tol=col('band_tol'), rsi_buy=col('rsi_buy'), rsi_sell=col('rsi_sell'),
+            adx_weak=col('adx_weak'), adx_strong=col('adx_strong'))
+
+    result = combos.copy()
+    if n_bars < 50:
+        result['annual_return'] = result['avg_hold_days'] = 0.0
+        result['trades'] = 0
+        return result
+    sim = simulate_lanes(closes, signals, _day_ns(df.index), np.full(len(combos), float(stop_loss)))
+    result['annual_return'] = sim['annual_return']
+    result['avg_hold_days'] = sim['avg_hold_days']
+    result['trades'] = sim['trades']
+    return result
+
+def _evaluate_chunk(item):
+    return evaluate_combinations(*item)
+
+def optimize_strategy(df, combos=None, stop_loss=7.0, workers=None):
+    # df: dữ liệu OHLCV thô của một mã. Trả về (bảng xếp hạng, số giây)
+    t0 = time.perf_counter()
+    combos = grid_combinations() if combos is None else combos.reset_index(drop=True)
+    base = calculate_indicators(df.copy())
+    if workers is None: workers = (os.cpu_count() or 1) if len(combos) * len(df) >= POOL_MIN_CELLS else 1
+    workers = min(workers, len(combos))
+    if workers > 1:
+        # Chia theo (bb_window, bb_mult) để mỗi tiến trình tái sử dụng dải BB trong khối của mình
+        order = combos.sort_values(['bb_window', 'bb_mult'], kind='stable').index.to_numpy()
+        chunks = [combos.loc[idx] for idx in np.array_split(order, workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_evaluate_chunk, [(base, chunk, stop_loss) for chunk in chunks]))
+        result = pd.concat(parts, ignore_index=True)
+    else:
+        result = evaluate_combinations(base, combos, stop_loss)
+    ranked = result.sort_values(['annual_return', 'trades'], ascending=[False, False]).reset_index(drop=True)
+    return ranked, time.perf_counter() - t0
+
+def main(argv=None):
+    from data_store import OHLCVStore
+    parser = argparse.ArgumentParser(description="Tối ưu tham số BB/RSI/ADX trên lịch sử một mã")
+    parser.add_argument("symbol")
+    parser.add_argument("--stop-loss", type=float, default=7.0)
+    parser.add_argument("--random", type=int, default=None, help="Chỉ thử ngẫu nhiên N bộ tham số")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--out", default=None, help="Ghi toàn bộ bảng xếp hạng ra CSV")
+    args = parser.parse_args(argv)
+
+    symbol = args.symbol.upper() if "." in args.symbol else f"{args.symbol.upper()}.VN"
+    df = OHLCVStore().load(symbol)
+    if df.empty: raise SystemExit(f"Không tìm thấy mã {symbol}")
+    combos = random_combinations(args.random) if args.random else grid_combinations()
+    ranked, seconds = optimize_strategy(df, combos, stop_loss=args.stop_loss, workers=args.workers)
+    if args.out: ranked.to_csv(args.out, index=False)
+    print(ranked.head(args.top).to_string(index=False))
+    print(f"{len(combos)} bộ tham số x {len(df)} phiên trong {seconds:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+import streamlit as st
+from screener import parse_universe, fetch_histories
+from portfolio import prepare_frames, run_portfolio, portfolio_trades_frame, contribution_frame
+
+# --- CẤU HÌNH TRANG WEB ---
+st.set_page_config(layout="wide", page_title="Backtest danh mục", page_icon="💼")
+
+st.markdown("<h1 style='text-align:center; font-weight:900; color:#00E676;'>💼 BACKTEST DANH MỤC</h1>", unsafe_allow_html=True)
+st.caption("Chạy chiến lược BB/RSI/ADX trên nhiều mã cùng lúc với chung một nguồn vốn: giới hạn số mã nắm giữ, tỉ trọng mỗi lệnh, cùng luật Stoploss và phí 0.15%.")
+
+with st.form(key='portfolio_form'):
+    uploaded = st.file_uploader("File danh sách mã (.txt / .csv, mỗi dòng một mã):", type=["txt", "csv"])
+    typed = st.text_area("Hoặc nhập trực tiếp:", placeholder="HPG\nVNM\nFPT")
+    c_sl, c_max, c_size, c_src = st.columns(4)
+    with c_sl: stop_loss = st.number_input("Cắt lỗ % (0 = Tắt):", min_value=0.0, max_value=20.0, value=7.0, step=0.5)
+    with c_max: max_positions = st.number_input("Số mã nắm giữ tối đa:", min_value=1, max_value=100, value=10)
+    with c_size: size_pct = st.number_input("Tỉ trọng mỗi lệnh % (0 = chia đều):", min_value=0.0, max_value=100.0, value=0.0, step=5.0)
+    with c_src: source = st.radio("Nguồn dữ liệu:", ["yahoo", "store"], format_func=lambda s: "Yahoo Finance" if s == "yahoo" else "Kho cục bộ", horizontal=True)
+    run = st.form_submit_button(label='🚀 CHẠY BACKTEST DANH MỤC', use_container_width=True)
+
+if run:
+    text = uploaded.getvalue().decode("utf-8") if uploaded is not None else typed
+    symbols = parse_universe(text)
+    if not symbols:
+        st.warning("⚠️ Vui lòng cung cấp danh sách mã!")
+        st.stop()
+
+    with st.spinner(f"Đang tải và tính chỉ báo cho {len(symbols)} mã..."):
+        frames = prepare_frames(fetch_histories(symbols, source=source))
+    if not frames:
+        st.error("❌ Không có mã nào đủ dữ liệu!")
+        st.stop()
+    with st.spinner("Đang mô phỏng danh mục..."):
+        result = run_portfolio(frames, stop_loss, int(max_positions), size_pct / 100 if size_pct > 0 else None)
+    st.session_state['portfolio'] = result
+
+if 'portfolio' in st.session_state:
+    result = st.session_state['portfolio']
+    m = result['metrics']
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Lợi nhuận TB", f"{m['annual_return']:+.1f}%/năm")
+    c2.metric("Sụt giảm tối đa", f"{m['max_drawdown']:.1f}%")
+    c3.metric("Sharpe", f"{m['sharpe']:.2f}")
+    c4.metric("Số mã nắm giữ TB", f"{m['avg_positions']:.1f}")
+    c5.metric("Tỷ lệ thắng", f"{m['win_rate']:.0f}% ({m['trades']} lệnh)")
+
+    fig = make_subplots(rows=3, cols=1, shared_xaxes=True, row_heights=[0.55, 0.25, 0.2], vertical_spacing=0.04)
+    fig.add_trace(go.Scatter(x=result['dates'], y=result['equity'] / 1e6, line=dict(color='#00E5FF', width=1.5), name="Vốn (triệu VND)"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=result['dates'], y=result['drawdown'], line=dict(color='#FF5252', width=1), fill='tozeroy', fillcolor='rgba(255,82,82,0.2)', name="Sụt giảm %"), row=2, col=1)
+    fig.add_trace(go.Scatter(x=result['dates'], y=result['positions'], line=dict(color='#FFD600', width=1, shape='hv'), name="Số mã nắm giữ"), row=3, col=1)
+    fig.update_layout(height=560, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(color='#FAFAFA'), margin=dict(l=10, r=10, t=10, b=10), showlegend=False)
+    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='#333')
+    st.plotly_chart(fig, use_container_width=True, config={'scrollZoom': False, 'displayModeBar': False})
+
+    trades = portfolio_trades_frame(result)
+    with st.expander(f"📊 Đóng góp theo mã ({len(result['symbols'])} mã)"):
+        st.dataframe(contribution_frame(result), use_container_width=True, hide_index=True)
+    with st.expander(f"📒 Nhật ký lệnh ({len(trades)} lệnh)"):
+        st.dataframe(trades, use_container_width=True, hide_index=True)
+        st.download_button("⬇️ Tải CSV", trades.to_csv(index=False).encode("utf-8"), file_name="portfolio_trades.csv", mime="text/csv")
@@ -0,0 +1,47 @@
+import os
+import streamlit as st
+from screener import parse_universe, run_screener, default_output_path
+
+# --- CẤU HÌNH TRANG WEB ---
+st.set_page_config(layout="wide", page_title="Bộ lọc thị trường", page_icon="🔎")
+
+st.markdown("<h1 style='text-align:center; font-weight:900; color:#00E676;'>🔎 BỘ LỌC THỊ TRƯỜNG</h1>", unsafe_allow_html=True)
+st.caption("Quét chiến lược BB/RSI/ADX trên toàn bộ danh sách mã (HOSE/HNX/UPCoM), xếp hạng tín hiệu phiên gần nhất theo lợi nhuận backtest.")
+
+with st.form(key='screener_form'):
+    uploaded = st.file_uploader("File danh sách mã (.txt / .csv, mỗi dòng một mã):", type=["txt", "csv"])
+    typed = st.text_area("Hoặc nhập trực tiếp:", placeholder="HPG\nVNM\nFPT")
+    c_sl, c_src, c_workers = st.columns(3)
+    with c_sl: stop_loss = st.number_input("Cắt lỗ % (0 = Tắt):", min_value=0.0, max_value=20.0, value=7.0, step=0.5)
+    with c_src: source = st.radio("Nguồn dữ liệu:", ["yahoo", "store"], format_func=lambda s: "Yahoo Finance" if s == "yahoo" else "Kho cục bộ", horizontal=True)
+    with c_workers: workers = st.number_input("Số tiến trình:", min_value=1, max_value=64, value=os.cpu_count() or 1)
+    show_all = st.checkbox("Hiện cả các mã không có tín hiệu")
+    run = st.form_submit_button(label='🚀 QUÉT THỊ TRƯỜNG', use_container_width=True)
+
+if run:
+    text = uploaded.getvalue().decode("utf-8") if uploaded is not None else typed
+    symbols = parse_universe(text)
+    if not symbols:
+        st.warning("⚠️ Vui lòng cung cấp danh sách mã!")
+        st.stop()
+
+    with st.spinner(f"Đang quét {len(symbols)} mã..."):
+        table, timings = run_screener(symbols, stop_loss=stop_loss, source=source, workers=int(workers), only_signals=not show_all)
+    out = default_output_path()
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    table.to_csv(out, index=False)
+    st.session_state['screener'] = (table, timings, out)
+
+if 'screener' in st.session_state:
+    table, timings, out = st.session_state['screener']
+    st.markdown(f"### 📋 Kết quả: {len(table)} mã")
+    st.dataframe(table.rename(columns={
+        'symbol': 'Mã', 'date': 'Ngày', 'close': 'Giá', 'signal': 'Tín hiệu', 'rsi': 'RSI', 'adx': 'ADX',
+        'annual_return': 'LN %/năm', 'avg_hold_days': 'Nắm giữ TB (ngày)', 'opt_stoploss': 'SL tối ưu %',
+        'opt_annual_return': 'LN tối ưu %/năm', 'bars': 'Số phiên',
+    }), use_container_width=True, hide_index=True)
+    st.download_button("⬇️ Tải CSV", table.to_csv(index=False).encode("utf-8"), file_name=os.path.basename(out), mime="text/csv")
+    st.caption(f"Đã lưu: {out}")
+
+    with st.expander("⏱️ Thông lượng từng giai đoạn"):
+        st.dataframe(timings, use_container_width=True, hide_index=True)
@@ -0,0 +1,219 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from engine import process_daily, compact_frame, periods_per_year, FEE_RATE, EXIT_OPEN, EXIT_SIGNAL, EXIT_STOPLOSS, EXIT_REASONS
+from screener import fetch_histories, load_universe
+from telemetry import timed
+
+# --- BACKTEST DANH MỤC NHIỀU MÃ, DÙNG CHUNG VỐN ---
+# Các mã được xếp thẳng hàng thành mảng (ngày x mã) trên hợp các ngày giao dịch. Ngày một mã không có nến
+# (ngừng giao dịch, chưa niêm yết, đã hủy niêm yết) thì mã đó không mua / bán / cắt lỗ được, vị thế đang giữ
+# định giá theo giá đóng cửa gần nhất. Luật tín hiệu, Stoploss và phí 0.15% giống run_simulation, riêng số cổ phiếu
+# mua tính trên tiền đã trừ phí mua nên tiền mặt không bao giờ âm; mỗi mã chỉ giao dịch từ phiên thứ 50 của chính nó.
+# Mỗi ngày là một bước vector hóa trên toàn bộ các mã (không lặp theo mã).
+# Phân bổ vốn: tối đa max_positions mã cùng lúc, mỗi lệnh mua tối đa position_size x tổng tài sản; khi nhiều mã
+# cùng có tín hiệu mua hơn số chỗ trống, ưu tiên mã có RSI thấp hơn.
+
+INITIAL_CAPITAL = 100_000_000
+WARMUP_BARS = 50
+PORTFOLIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "portfolio")
+TRADE_DTYPE = [('ticker', np.int64), ('entry_idx', np.int64), ('exit_idx', np.int64), ('entry_price', float), ('exit_price', float),
+               ('shares', float), ('fees', float), ('pnl', float), ('hold_days', np.int64), ('reason', np.int8)]
+
+# --- CHUẨN BỊ DỮ LIỆU ---
+def _prepare(item):
+    symbol, df = item
+    if len(df) < WARMUP_BARS: return symbol, None
+    return symbol, compact_frame(process_daily(df.copy()))
+
+def prepare_frames(frames, workers=None):
+    # OHLCV thô -> khung gọn có chỉ báo + Signal, tính trên nhiều tiến trình như bộ lọc thị trường
+    items = list(frames.items())
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_prepare, items, chunksize=max(1, len(items) // (workers * 4))))
+    else:
+        results = [_prepare(item) for item in items]
+    return {symbol: df for symbol, df in results if df is not None}
+
+def align_frames(frames):
+    # frames: {mã: khung đã có Close, RSI, Signal}. Trả về dict các mảng (ngày x mã) trên hợp các ngày giao dịch
+    symbols = list(frames)
+    column = lambda name: pd.concat({s: frames[s][name] for s in symbols}, axis=1).sort_index()
+    close = column('Close').astype(float)
+    dates = close.index
+    tradable = close.notna().to_numpy() & (close.to_numpy() > 0)
+    bar_no = np.cumsum(tradable, axis=0) - 1          # Số thứ tự phiên của chính mã đó
+    return {
+        'symbols': symbols, 'dates': dates,
+        'close': close.to_numpy(),
+        'mark': close.ffill().fillna(0.0).to_numpy(),  # Giá định giá: đóng cửa gần nhất (ngày ngừng giao dịch giữ giá cũ)
+        'tradable': tradable,
+        'eligible': tradable & (bar_no >= WARMUP_BARS),
+        'signal': column('Signal').reindex(dates).fillna(0).to_numpy(dtype=np.int8),
+        'rsi': column('RSI').reindex(dates).to_numpy(dtype=float),
+    }
+
+# --- MÔ PHỎNG ---
+@timed()
+def run_portfolio(frames, stop_loss_pct=7.0, max_positions=10, position_size=None, initial_capital=INITIAL_CAPITAL):
+    # frames: {mã: khung đã qua process_daily} hoặc kết quả align_frames. position_size: tỉ lệ tổng tài sản cho mỗi
+    # lệnh mua (mặc định 1 / max_positions). Trả về dict: dates, symbols, equity, drawdown, positions, trades, metrics
+    data = frames if 'close' in frames else align_frames(frames)
+    close, mark, eligible, signal, rsi = (data[k] for k in ('close', 'mark', 'eligible', 'signal', 'rsi'))
+    dates = data['dates']
+    n_dates, n_tickers = close.shape
+    position_size = 1.0 / max_positions if position_size is None else position_size
+    use_sl = stop_loss_pct > 0
+    sl_limit = -(stop_loss_pct / 100.0)
+
+    cash = float(initial_capital)
+    shares = np.zeros(n_tickers)
+    held = np.zeros(n_tickers, dtype=bool)
+    entry_price = np.ones(n_tickers)
+    entry_idx = np.zeros(n_tickers, dtype=np.int64)
+    equity = np.full(n_dates, float(initial_capital))
+    positions = np.zeros(n_dates, dtype=np.int64)
+    log = []                                   # Các khối (mã, phiên mua, phiên bán, số CP, lý do)
+
+    buy_ready = eligible & (signal == 1)
+    active = buy_ready.any(axis=1)
+    start = int(np.argmax(eligible.any(axis=1))) if eligible.any() else n_dates
+
+    for t in range(start, n_dates):
+        if not held.any():
+            equity[t] = cash
+            if not active[t]: continue
+        price = close[t]
+        holding = held.copy()
+
+        # Bán: cắt lỗ hoặc tín hiệu bán, chỉ với mã có giao dịch trong ngày
+        if holding.any():
+            can_trade = holding & eligible[t]
+            with np.errstate(invalid='ignore'):
+                stopped = can_trade & use_sl & ((price - entry_price) / entry_price <= sl_limit)
+            exited = np.flatnonzero(stopped | (can_trade & (signal[t] == -1)))
+            if len(exited):
+                cash += float(np.sum(shares[exited] * price[exited] * (1 - FEE_RATE)))
+                log.append((exited, entry_idx[exited], np.full(len(exited), t), shares[exited].copy(),
+                            np.where(stopped[exited], EXIT_STOPLOSS, EXIT_SIGNAL)))
+                shares[exited] = 0
+                held[exited] = False
+
+        # Mua: mã không giữ từ đầu ngày, có tín hiệu mua; lấp chỗ trống theo RSI tăng dần
+        slots = max_positions - int(held.sum())
+        if active[t] and slots > 0:
+            candidates = np.flatnonzero(buy_ready[t] & ~holding)
+            if len(candidates):
+                candidates = candidates[np.argsort(rsi[t, candidates], kind='stable')][:slots]
+                total = cash + float(np.dot(shares[held], mark[t, held]))
+                # Phân bổ tham lam theo thứ tự ưu tiên: mỗi mã tối đa position_size x tổng tài sản, tới khi hết tiền.
+                # Tiền khả dụng đã trừ sẵn phí mua (cash / (1 + phí)) để tổng tiền mua + phí không vượt quá tiền mặt
+                target = np.full(len(candidates), position_size * total)
+                budget = np.clip(cash / (1 + FEE_RATE) - (np.cumsum(target) - target), 0.0, target)
+                new_shares = np.trunc(budget / price[candidates])
+                bought = candidates[new_shares > 0]
+                if len(bought):
+                    shares[bought] = new_shares[new_shares > 0]
+                    cash -= float(np.sum(shares[bought] * price[bought] * (1 + FEE_RATE)))
+                    assert cash >= -1e-6, f"Tiền mặt âm ({cash}) ngày {t}: phân bổ vượt vốn"
+                    entry_price[bought] = price[bought]
+                    entry_idx[bought] = t
+                    held[bought] = True
+
+        equity[t] = cash + float(np.dot(shares[held], mark[t, held]))
+        positions[t] = int(held.sum())
+
+    # Vị thế còn mở cuối kỳ: định giá theo giá đóng cửa gần nhất, không tính phí bán
+    still_open = np.flatnonzero(held)
+    log.append((still_open, entry_idx[still_open], np.full(len(still_open), n_dates - 1), shares[still_open], np.full(len(still_open), EXIT_OPEN)))
+    trades = _trade_table(log, close, mark, dates)
+    return {'dates': dates, 'symbols': data['symbols'], 'equity': equity, 'positions': positions, 'trades': trades,
+            **_portfolio_metrics(equity, positions, trades, dates, start, initial_capital)}
+
+def _trade_table(log, close, mark, dates):
+    ticker, entry, exit_, shares, reason = (np.concatenate([part[k] for part in log]) for k in range(5))
+    trades = np.zeros(len(ticker), dtype=TRADE_DTYPE)
+    trades['ticker'], trades['entry_idx'], trades['exit_idx'], trades['shares'], trades['reason'] = ticker, entry, exit_, shares, reason
+    closed = trades['reason'] != EXIT_OPEN
+    trades['entry_price'] = close[entry, ticker]
+    trades['exit_price'] = np.where(closed, close[exit_, ticker], mark[exit_, ticker])
+    trades['fees'] = shares * trades['entry_price'] * FEE_RATE + np.where(closed, shares * trades['exit_price'] * FEE_RATE, 0.0)
+    trades['pnl'] = shares * (trades['exit_price'] - trades['entry_price']) - trades['fees']
+    day_ns = dates.values.astype('datetime64[ns]').view(np.int64)
+    trades['hold_days'] = (day_ns[exit_] - day_ns[entry]) // 86_400_000_000_000
+    return trades[np.lexsort((trades['ticker'], trades['entry_idx']))]
+
+def _portfolio_metrics(equity, positions, trades, dates, start, initial_capital):
+    active = equity[start:] if start < len(equity) else equity[-1:]
+    drawdown = np.zeros(len(equity))
+    drawdown[len(equity) - len(active):] = (active / np.maximum.accumulate(active) - 1) * 100
+    daily = np.diff(active) / active[:-1]
+    day_ns = dates.values.astype('datetime64[ns]').view(np.int64)[len(equity) - len(active):]
+    sharpe = daily.mean() / daily.std() * np.sqrt(periods_per_year(day_ns)) if len(daily) > 1 and daily.std() > 0 else 0.0
+    days = (dates[-1] - dates[0]).days if len(dates) else 0
+    years = days / 365.25 if days > 0 else 1
+    closed = trades['reason'] != EXIT_OPEN
+    signal_exits = trades['reason'] == EXIT_SIGNAL
+    return {'drawdown': drawdown, 'metrics': {
+        'annual_return': float((equity[-1] - initial_capital) / initial_capital * 100 / years),
+        'final_equity': float(equity[-1]),
+        'max_drawdown': float(drawdown.min()),
+        'sharpe': float(sharpe),
+        'exposure': float((positions[start:] > 0).mean() * 100) if start < len(positions) else 0.0,
+        'avg_positions': float(positions[start:].mean()) if start < len(positions) else 0.0,
+        'win_rate': float((trades['pnl'][closed] > 0).mean() * 100) if closed.any() else 0.0,
+        'trades': int(len(trades)),
+        'signal_exits': int(signal_exits.sum()),
+        'avg_hold_days': float(trades['hold_days'][signal_exits].mean()) if signal_exits.any() else 0.0,
+        'fees': float(trades['fees'].sum()),
+    }}
+
+def portfolio_trades_frame(result):
+    trades = result['trades']
+    dates, symbols = result['dates'], np.asarray(result['symbols'])
+    return pd.DataFrame({
+        'Mã': symbols[trades['ticker']],
+        'Ngày mua': dates[trades['entry_idx']], 'Giá mua': trades['entry_price'],
+        'Ngày bán': dates[trades['exit_idx']], 'Giá bán': trades['exit_price'],
+        'Số CP': trades['shares'].astype(np.int64), 'Phí': trades['fees'], 'Lãi/lỗ': trades['pnl'],
+        'Số ngày': trades['hold_days'], 'Lý do': [EXIT_REASONS[int(r)] for r in trades['reason']],
+    })
+
+def contribution_frame(result):
+    # Lãi/lỗ, số lệnh và tỉ lệ thắng theo từng mã
+    table = portfolio_trades_frame(result)
+    grouped = table.groupby('Mã')
+    summary = pd.DataFrame({'Số lệnh': grouped.size(), 'Lãi/lỗ': grouped['Lãi/lỗ'].sum(),
+                            'Tỷ lệ thắng %': grouped['Lãi/lỗ'].apply(lambda pnl: (pnl > 0).mean() * 100)})
+    return summary.sort_values('Lãi/lỗ', ascending=False).reset_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest BB/RSI/ADX trên danh mục nhiều mã dùng chung vốn")
+    parser.add_argument("universe", help="File danh sách mã (mỗi dòng một mã hoặc CSV cột đầu)")
+    parser.add_argument("--stop-loss", type=float, default=7.0)
+    parser.add_argument("--max-positions", type=int, default=10)
+    parser.add_argument("--position-size", type=float, default=None, help="Tỉ lệ tổng tài sản mỗi lệnh (mặc định 1/max-positions)")
+    parser.add_argument("--source", choices=["yahoo", "store"], default="yahoo")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default=None, help="File CSV nhật ký lệnh")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    frames = prepare_frames(fetch_histories(load_universe(args.universe), source=args.source), workers=args.workers)
+    if not frames: raise SystemExit("Không có dữ liệu")
+    t1 = time.perf_counter()
+    result = run_portfolio(frames, args.stop_loss, args.max_positions, args.position_size)
+    t2 = time.perf_counter()
+    out = args.out or os.path.join(PORTFOLIO_DIR, f"portfolio_{pd.Timestamp.now():%Y%m%d_%H%M}.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    portfolio_trades_frame(result).to_csv(out, index=False)
+    for key, value in result['metrics'].items(): print(f"{key:<16}{value:,.2f}")
+    print(f"{len(frames)} mã x {len(result['dates'])} ngày: chuẩn bị {t1 - t0:.2f}s, mô phỏng {t2 - t1:.2f}s -> {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import numpy as np
+import pandas as pd
+from engine import compute_signals, simulate_lanes, _day_ns, FEE_RATE, EXIT_OPEN, DEFAULT_SL_LEVELS
+from indicator_state import BB_WINDOW, BB_MULT, WILDER_ALPHA, RSI_MIN_PERIODS
+from telemetry import timed
+
+# --- KIỂM ĐỊNH ĐỘ BỀN STOPLOSS (MONTE CARLO / BOOTSTRAP) ---
+# Stoploss "tối ưu" chọn trên MỘT đường giá lịch sử dễ khớp quá mức (nhất là mã thanh khoản thấp).
+# Ở đây sinh hàng nghìn đường giá giả lập rồi chạy chiến lược với MỌI mức Stoploss cùng lúc:
+#  - "block": bootstrap theo khối các phiên lịch sử (giữ tương quan ngắn hạn và biên độ cao-thấp trong phiên),
+#    chỉ báo + tín hiệu tính lại trên mảng (đường x phiên), backtest trên mảng trạng thái (đường x mức SL).
+#  - "shuffle": xáo trộn thứ tự các lệnh lịch sử của từng mức SL. Lợi nhuận kép không đổi theo thứ tự lệnh
+#    nên chỉ phân phối sụt giảm thay đổi (sụt giảm đo tại các điểm đóng lệnh).
+# Trục đường giá được chia khối (chunk) để bộ nhớ không tăng theo số đường.
+
+INITIAL_CAPITAL = 100_000_000
+CHUNK_BYTES = 8 * 1024 ** 2      # Kích thước tối đa một mảng (đường x phiên) float64 trong một khối
+PERCENTILES = [5, 25, 50, 75, 95]
+
+# --- SINH ĐƯỜNG GIÁ ---
+def bar_returns(df):
+    # Mỗi phiên từ phiên thứ 2: log(C/C trước), log(H/C), log(L/C). Phiên lỗi dữ liệu -> phiên đứng giá
+    close = df['Close'].to_numpy(dtype=float)
+    high = df['High'].to_numpy(dtype=float)
+    low = df['Low'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rows = np.column_stack([np.log(close[1:] / close[:-1]), np.log(high[1:] / close[1:]), np.log(low[1:] / close[1:])])
+    return np.where(np.isfinite(rows), rows, 0.0)
+
+def block_bootstrap(df, n_paths, block=20, rng=None):
+    # Moving block bootstrap: ghép các khối `block` phiên liên tiếp bốc ngẫu nhiên (có hoàn lại).
+    # Trả về (close, high, low), mỗi mảng (n_paths x số phiên); phiên đầu giữ nguyên như lịch sử.
+    rng = rng if rng is not None else np.random.default_rng()
+    rows = bar_returns(df)
+    n = len(rows)
+    block = max(1, min(block, n))
+    starts = rng.integers(0, n - block + 1, size=(n_paths, -(-n // block)))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :n]
+    first = df.iloc[0]
+    log_close = np.empty((n_paths, n + 1))
+    log_close[:, 0] = np.log(float(first['Close']))
+    np.cumsum(rows[idx, 0], axis=1, out=log_close[:, 1:])
+    log_close[:, 1:] += log_close[:, :1]
+    close = np.exp(log_close)
+    high = np.empty_like(close)
+    low = np.empty_like(close)
+    high[:, 0], low[:, 0] = float(first['High']), float(first['Low'])
+    high[:, 1:] = close[:, 1:] * np.exp(rows[idx, 1])
+    low[:, 1:] = close[:, 1:] * np.exp(rows[idx, 2])
+    return close, high, low
+
+# --- CHỈ BÁO VÀ TÍN HIỆU TRÊN MẢNG (ĐƯỜNG x PHIÊN) ---
+def _ewm(x, min_periods=0):
+    # ewm(alpha=1/14, adjust=False) của pandas theo trục phiên. NaN chỉ có ở đầu chuỗi (VD DX khi ±DM14 đều bằng 0):
+    # pandas bắt đầu từ quan sát đầu tiên -> điền ngược giá trị đó cho các phiên trước rồi đặt lại NaN sau khi tính
+    xt = np.ascontiguousarray(x.T)
+    bar = np.arange(len(xt))[:, None]
+    leading = None
+    missing = np.isnan(xt)
+    if missing.any():
+        first = np.argmax(~missing, axis=0)
+        leading = bar < first
+        xt = np.where(leading, xt[first, np.arange(xt.shape[1])], xt)
+    weighted = WILDER_ALPHA * xt
+    out = np.empty_like(xt)
+    out[0] = xt[0]
+    for i in range(1, len(xt)):
+        np.multiply(out[i - 1], 1 - WILDER_ALPHA, out=out[i])
+        out[i] += weighted[i]
+    if leading is not None: out[leading] = np.nan
+    if min_periods > 1: out[:min_periods - 1] = np.nan
+    return out.T
+
+def _rolling_band(close):
+    # SMA và độ lệch chuẩn (ddof=1) cửa sổ BB_WINDOW bằng tổng tích lũy; trừ giá phiên đầu để giảm sai số làm tròn
+    shifted = close - close[:, :1]
+    s1 = np.cumsum(shifted, axis=1)
+    s2 = np.cumsum(shifted * shifted, axis=1)
+    s1[:, BB_WINDOW:] -= s1[:, :-BB_WINDOW].copy()
+    s2[:, BB_WINDOW:] -= s2[:, :-BB_WINDOW].copy()
+    mean = s1 / BB_WINDOW
+    std = np.sqrt(np.maximum((s2 - s1 * mean) / (BB_WINDOW - 1), 0.0))
+    mean += close[:, :1]
+    mean[:, :BB_WINDOW - 1] = std[:, :BB_WINDOW - 1] = np.nan
+    return mean, std
+
+def path_signals(close, high, low):
+    # Cùng công thức calculate_indicators + compute_signals, vector hóa trên mọi đường giá. Trả về int8 (đường x phiên)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sma, std = _rolling_band(close)
+        lower, upper = sma - BB_MULT * std, sma + BB_MULT * std
+        del sma, std
+
+        delta = np.zeros_like(close)
+        delta[:, 1:] = np.diff(close, axis=1)
+        avg_gain = _ewm(np.maximum(delta, 0.0), RSI_MIN_PERIODS)
+        avg_loss = _ewm(np.maximum(-delta, 0.0), RSI_MIN_PERIODS)
+        rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+        del delta, avg_gain, avg_loss
+
+        prev_close = np.empty_like(close)
+        prev_close[:, 0] = np.nan
+        prev_close[:, 1:] = close[:, :-1]
+        tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        del prev_close
+        up_move = np.full_like(high, np.nan)
+        down_move = np.full_like(low, np.nan)
+        up_move[:, 1:] = np.diff(high, axis=1)
+        down_move[:, 1:] = -np.diff(low, axis=1)
+        plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+        minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+        del up_move, down_move
+        tr14 = _ewm(tr)
+        di_plus = 100 * (_ewm(plus_dm) / tr14)
+        di_minus = 100 * (_ewm(minus_dm) / tr14)
+        del tr, tr14, plus_dm, minus_dm
+        adx = _ewm(100 * np.abs(di_plus - di_minus) / (di_plus + di_minus))
+
+        return compute_signals(close, rsi, adx, lower, upper, di_plus, di_minus).astype(np.int8)
+
+# --- BACKTEST NHIỀU ĐƯỜNG GIÁ x NHIỀU MỨC STOPLOSS ---
+def simulate_paths(close, signals, stop_loss_levels, years):
+    # Cùng luật với simulate_lanes; trạng thái là mảng (đường x mức SL). Trả về (lợi nhuận %/năm, sụt giảm tối đa %)
+    # cùng kích thước (đường x mức SL); sụt giảm tính như run_backtest (đường vốn từ phiên 50, theo giá đóng cửa).
+    levels = np.asarray(stop_loss_levels, dtype=float)
+    n_paths, n_bars = close.shape
+    shape = (n_paths, len(levels))
+    if n_bars < 50: return np.zeros(shape), np.zeros(shape)
+    sl_limit = np.where(levels > 0, -levels / 100.0, -np.inf)   # Mức 0 = tắt Stoploss
+    close_t = np.ascontiguousarray(close.T)
+    signals_t = np.ascontiguousarray(signals.T)
+
+    cash = np.full(shape, float(INITIAL_CAPITAL))
+    shares = np.zeros(shape)
+    entry_price = np.ones(shape)
+    position = np.zeros(shape, dtype=bool)
+    peak = cash.copy()
+    min_ratio = np.ones(shape)         # Đáy của vốn / đỉnh trước đó
+    equity = np.empty(shape)
+    ratio = np.empty(shape)
+    exited = np.empty(shape, dtype=bool)
+
+    # Mỗi phiên chỉ các phép kiểm tra Stoploss / định giá chạy trên toàn mảng; mua chỉ xét các đường có tín hiệu mua
+    for i in range(50, n_bars):
+        price = close_t[i][:, None]
+        signal = signals_t[i]
+        np.subtract(price, entry_price, out=ratio)
+        ratio /= entry_price
+        np.less_equal(ratio, sl_limit, out=exited)
+        exited |= (signal == -1)[:, None]
+        exited &= position
+        if exited.any():
+            np.multiply(shares, price, out=ratio)
+            ratio *= 1 - FEE_RATE
+            np.add(cash, ratio, out=cash, where=exited)
+            np.copyto(shares, 0.0, where=exited)
+            position ^= exited
+
+        rows = np.flatnonzero(signal == 1)
+        if len(rows):
+            # Chỉ đường / mức KHÔNG giữ cổ phiếu từ đầu phiên mới được mua
+            row_price = close_t[i, rows][:, None]
+            row_cash = cash[rows]
+            new_shares = np.trunc(row_cash / row_price)
+            buy = ~(position[rows] | exited[rows]) & (new_shares > 0)
+            shares[rows] = np.where(buy, new_shares, shares[rows])
+            cash[rows] = np.where(buy, row_cash - new_shares * row_price * (1 + FEE_RATE), row_cash)
+            entry_price[rows] = np.where(buy, row_price, entry_price[rows])
+            position[rows] |= buy
+
+        np.multiply(shares, price, out=equity)
+        equity += cash
+        np.maximum(peak, equity, out=peak)
+        np.divide(equity, peak, out=ratio)
+        np.minimum(min_ratio, ratio, out=min_ratio)
+
+    annual_return = (equity - INITIAL_CAPITAL) / INITIAL_CAPITAL * 100 / years
+    return annual_return, (min_ratio - 1) * 100
+
+def _years(index):
+    day_ns = _day_ns(index)
+    days = (day_ns[-1] - day_ns[0]) // 86_400_000_000_000
+    return days / 365.25 if days > 0 else 1
+
+# --- XÁO TRỘN THỨ TỰ LỆNH ---
+def trade_shuffle(df, stop_loss_levels, n_paths, rng=None):
+    # Mỗi lệnh lịch sử -> hệ số vốn (giá bán sau phí / giá mua sau phí; lệnh còn mở định giá theo giá cuối, không phí bán).
+    # Mỗi đường giả lập là một hoán vị các lệnh; trả về (lợi nhuận %/năm, sụt giảm tối đa %) (đường x mức SL).
+    rng = rng if rng is not None else np.random.default_rng()
+    levels = np.asarray(stop_loss_levels, dtype=float)
+    returns = np.zeros((n_paths, len(levels)))
+    drawdowns = np.zeros((n_paths, len(levels)))
+    if len(df) < 50: return returns, drawdowns
+    closes = df['Close'].to_numpy(dtype=float)
+    log = simulate_lanes(closes, df['Signal'].values, _day_ns(df.index), levels, record_trades=True)['trade_log']
+    sell_fee = np.where(log['reason'] == EXIT_OPEN, 0.0, FEE_RATE)
+    factors = closes[log['exit_idx']] * (1 - sell_fee) / (closes[log['entry_idx']] * (1 + FEE_RATE))
+    years = _years(df.index)
+    for lane in range(len(levels)):
+        f = factors[log['lane'] == lane]
+        if not len(f): continue
+        order = np.argsort(rng.random((n_paths, len(f))), axis=1)
+        curve = np.cumprod(f[order], axis=1)
+        peak = np.maximum(np.maximum.accumulate(curve, axis=1), 1.0)
+        drawdowns[:, lane] = np.minimum((curve / peak - 1).min(axis=1), 0.0) * 100
+        returns[:, lane] = (curve[:, -1] - 1) * 100 / years
+    return returns, drawdowns
+
+# --- CHẠY KIỂM ĐỊNH ---
+def summarize(levels, annual_return, max_drawdown, historical=None):
+    # Phân phối theo từng mức SL; best_share = % số đường mà mức này cho lợi nhuận cao nhất
+    best = np.bincount(np.argmax(annual_return, axis=1), minlength=len(levels))
+    summary = pd.DataFrame({'stop_loss': levels})
+    if historical is not None: summary['historical'] = historical
+    summary['mean'] = annual_return.mean(axis=0)
+    for p, values in zip(PERCENTILES, np.percentile(annual_return, PERCENTILES, axis=0)): summary[f'p{p}'] = values
+    summary['prob_loss'] = (annual_return < 0).mean(axis=0) * 100
+    summary['dd_median'] = np.median(max_drawdown, axis=0)
+    summary['dd_p5'] = np.percentile(max_drawdown, 5, axis=0)    # 5% đường tệ nhất sụt sâu hơn mức này
+    summary['best_share'] = best / len(annual_return) * 100
+    return summary
+
+@timed()
+def robustness_test(df, stop_loss_levels=None, n_paths=10_000, method="block", block=20, seed=0,
+                    chunk_bytes=CHUNK_BYTES, progress_callback=None):
+    # df: khung đã có chỉ báo + Signal (cần OHLC). Trả về dict: levels, annual_return / max_drawdown
+    # (float32, đường x mức SL), historical (lợi nhuận lịch sử từng mức) và summary (DataFrame theo mức SL).
+    levels = np.asarray(DEFAULT_SL_LEVELS if stop_loss_levels is None else stop_loss_levels, dtype=float)
+    rng = np.random.default_rng(seed)
+    n_bars = len(df)
+    if n_bars >= 50:
+        historical = simulate_lanes(df['Close'].to_numpy(dtype=float), df['Signal'].values, _day_ns(df.index), levels)['annual_return']
+    else:
+        historical = np.zeros(len(levels))
+
+    if method == "shuffle":
+        returns, drawdowns = trade_shuffle(df, levels, n_paths, rng)
+        if progress_callback is not None: progress_callback(1.0)
+    elif method == "block":
+        returns = np.empty((n_paths, len(levels)), dtype=np.float32)
+        drawdowns = np.empty_like(returns)
+        years = _years(df.index)
+        chunk = max(1, min(n_paths, chunk_bytes // (8 * max(n_bars, 1))))
+        for start in range(0, n_paths, chunk):
+            stop = min(start + chunk, n_paths)
+            close, high, low = block_bootstrap(df, stop - start, block, rng)
+            signals = path_signals(close, high, low)
+            del high, low
+            returns[start:stop], drawdowns[start:stop] = simulate_paths(close, signals, levels, years)
+            if progress_callback is not None: progress_callback(stop / n_paths)
+    else:
+        raise ValueError(f"Phương pháp không hợp lệ: {method}")
+
+    returns = np.asarray(returns, dtype=np.float32)
+    drawdowns = np.asarray(drawdowns, dtype=np.float32)
+    return {'levels': levels, 'annual_return': returns, 'max_drawdown': drawdowns, 'historical': historical,
+            'summary': summarize(levels, returns, drawdowns, historical)}
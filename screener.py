@@ -0,0 +1,130 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from data_store import OHLCVStore, clean_ohlcv
+from engine import process_daily, run_simulation_sweep, DEFAULT_SL_LEVELS
+
+# --- BỘ LỌC TOÀN THỊ TRƯỜNG (HOSE / HNX / UPCoM) ---
+# Ba giai đoạn: tải lịch sử hàng loạt -> tính chỉ báo, tín hiệu và backtest trên nhiều tiến trình
+# -> xếp hạng tín hiệu MUA/BÁN của phiên gần nhất theo lợi nhuận backtest.
+
+SCREENER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "screener")
+SIGNAL_LABELS = {1: "MUA", -1: "BÁN", 0: ""}
+
+def normalize_symbol(ticker):
+    ticker = ticker.strip().upper()
+    return ticker if "." in ticker else f"{ticker}.VN"
+
+def parse_universe(text):
+    # Mỗi dòng một mã; chấp nhận CSV (lấy cột đầu), bỏ dòng trống, dòng '#' và tiêu đề 'symbol'/'ticker'
+    symbols = []
+    for line in text.splitlines():
+        token = line.split(",")[0].strip()
+        if not token or token.startswith("#") or token.lower() in ("symbol", "ticker", "mã"): continue
+        symbols.append(normalize_symbol(token))
+    return list(dict.fromkeys(symbols))
+
+def load_universe(path):
+    with open(path, encoding="utf-8") as f: return parse_universe(f.read())
+
+# --- GIAI ĐOẠN 1: TẢI DỮ LIỆU ---
+def fetch_histories(symbols, source="yahoo", store=None, batch_size=200):
+    # source="yahoo": yf.download nhiều mã một lượt (và ghi vào kho cục bộ nếu có store)
+    # source="store": chỉ đọc kho cục bộ, không gọi mạng
+    store = store if store is not None else OHLCVStore()
+    frames = {}
+    if source == "store":
+        for symbol in symbols:
+            df = store.read(symbol)
+            if df is not None and not df.empty: frames[symbol] = df
+        return frames
+
+    import yfinance as yf
+    for start in range(0, len(symbols), batch_size):
+        batch = symbols[start:start + batch_size]
+        raw = yf.download(batch, period="max", interval="1d", group_by="ticker", threads=True, progress=False)
+        if raw.empty: continue
+        for symbol in batch:
+            if symbol not in raw.columns.get_level_values(0): continue
+            df = clean_ohlcv(raw[symbol].dropna(how="all"))
+            if df.empty: continue
+            frames[symbol] = df
+            store.write(symbol, df)
+    return frames
+
+# --- GIAI ĐOẠN 2: TÍNH TOÁN (CHẠY TRONG TIẾN TRÌNH CON) ---
+def scan_symbol(item):
+    symbol, df, stop_loss = item
+    if len(df) < 50: return None
+    df = process_daily(df)
+    levels = np.append(np.asarray(DEFAULT_SL_LEVELS, dtype=float), stop_loss)
+    returns, holds = run_simulation_sweep(df, levels)
+    best = int(np.argmax(returns[:-1]))
+    last = df.iloc[-1]
+    return {
+        'symbol': symbol, 'date': df.index[-1].strftime("%Y-%m-%d"), 'close': float(last['Close']),
+        'signal': SIGNAL_LABELS[int(last['Signal'])], 'rsi': float(last['RSI']), 'adx': float(last['ADX']),
+        'annual_return': float(returns[-1]), 'avg_hold_days': float(holds[-1]),
+        'opt_stoploss': float(levels[best]), 'opt_annual_return': float(returns[best]), 'bars': len(df),
+    }
+
+def _stage(name, seconds, symbols, bars):
+    return {'stage': name, 'seconds': seconds, 'symbols': symbols, 'bars': bars,
+            'symbols_per_sec': symbols / seconds if seconds > 0 else float("inf"),
+            'bars_per_sec': bars / seconds if seconds > 0 else float("inf")}
+
+def run_screener(symbols, stop_loss=7.0, source="yahoo", store=None, workers=None, only_signals=True, frames=None):
+    # Trả về (bảng xếp hạng, thống kê thời gian từng giai đoạn)
+    timings = []
+    t0 = time.perf_counter()
+    if frames is None: frames = fetch_histories(symbols, source=source, store=store)
+    total_bars = sum(len(df) for df in frames.values())
+    timings.append(_stage("fetch", time.perf_counter() - t0, len(frames), total_bars))
+
+    t0 = time.perf_counter()
+    items = [(symbol, df, stop_loss) for symbol, df in frames.items()]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(items) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(scan_symbol, items, chunksize=max(1, len(items) // (workers * 4))))
+    else:
+        rows = [scan_symbol(item) for item in items]
+    rows = [r for r in rows if r is not None]
+    timings.append(_stage("compute", time.perf_counter() - t0, len(items), total_bars))
+
+    t0 = time.perf_counter()
+    table = pd.DataFrame(rows, columns=['symbol', 'date', 'close', 'signal', 'rsi', 'adx', 'annual_return',
+                                        'avg_hold_days', 'opt_stoploss', 'opt_annual_return', 'bars'])
+    if only_signals: table = table[table['signal'] != ""]
+    # Tín hiệu MUA lên trước, trong mỗi nhóm xếp theo lợi nhuận backtest giảm dần
+    table = table.assign(_order=table['signal'].map({"MUA": 0, "BÁN": 1, "": 2}))
+    table = table.sort_values(['_order', 'annual_return'], ascending=[True, False]).drop(columns='_order').reset_index(drop=True)
+    timings.append(_stage("rank", time.perf_counter() - t0, len(rows), 0))
+    return table, pd.DataFrame(timings)
+
+def default_output_path():
+    return os.path.join(SCREENER_DIR, f"screener_{pd.Timestamp.now():%Y%m%d_%H%M}.csv")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quét tín hiệu BB/RSI/ADX trên toàn bộ danh sách mã")
+    parser.add_argument("universe", help="File danh sách mã (mỗi dòng một mã hoặc CSV cột đầu)")
+    parser.add_argument("--out", default=None, help="File CSV kết quả")
+    parser.add_argument("--stop-loss", type=float, default=7.0)
+    parser.add_argument("--source", choices=["yahoo", "store"], default="yahoo")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--all", action="store_true", help="Giữ cả các mã không có tín hiệu")
+    args = parser.parse_args(argv)
+
+    symbols = load_universe(args.universe)
+    table, timings = run_screener(symbols, stop_loss=args.stop_loss, source=args.source, workers=args.workers, only_signals=not args.all)
+    out = args.out or default_output_path()
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    table.to_csv(out, index=False)
+    print(timings.to_string(index=False))
+    print(f"{len(table)} tín hiệu -> {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+# --- BỘ NHỚ ĐỆM DÙNG CHUNG TOÀN TIẾN TRÌNH ---
+# Streamlit chạy lại script ở mỗi lần tương tác nhưng module import thì chỉ nạp một lần,
+# nên đối tượng DATA_CACHE bên dưới được chia sẻ giữa mọi phiên người dùng trong cùng tiến trình.
+# Khung dữ liệu trả về là dùng chung: nơi gọi KHÔNG được sửa trực tiếp (hãy .copy() nếu cần).
+
+VN_TZ = timezone(timedelta(hours=7))
+SESSION_OPEN = (9, 0)
+SESSION_CLOSE = (15, 0)
+INTRADAY_TTL = 60        # Giây - nến 5 phút thay đổi liên tục trong phiên
+DAILY_TTL = 300          # Giây - nến ngày trong phiên vẫn còn đang chạy
+
+def is_trading_time(now):
+    if now.weekday() >= 5: return False
+    return SESSION_OPEN <= (now.hour, now.minute) < SESSION_CLOSE
+
+def market_ttl(interval, now=None):
+    # Trong giờ giao dịch: hết hạn nhanh. Ngoài giờ: giữ tới phiên mở cửa kế tiếp.
+    now = now or datetime.now(VN_TZ)
+    if is_trading_time(now): return INTRADAY_TTL if interval != "1d" else DAILY_TTL
+    next_open = now.replace(hour=SESSION_OPEN[0], minute=SESSION_OPEN[1], second=0, microsecond=0)
+    if (now.hour, now.minute) >= SESSION_OPEN: next_open += timedelta(days=1)
+    while next_open.weekday() >= 5: next_open += timedelta(days=1)
+    return max((next_open - now).total_seconds(), INTRADAY_TTL)
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SharedDataCache:
+    def __init__(self, max_bytes=512 * 1024 ** 2, ttl_fn=market_ttl, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_fn = ttl_fn
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (symbol, interval, last_ts) -> (frame, signature, nbytes), theo thứ tự LRU
+        self._latest = {}               # (symbol, interval) -> (last_ts, hạn dùng)
+        self._inflight = {}             # (symbol, interval) -> _Flight đang tải
+        self._bytes = 0
+        self.hits = self.misses = self.evictions = self.coalesced = 0
+
+    def get_or_compute(self, symbol, interval, fetch, process):
+        # fetch() tải dữ liệu thô, process(raw) tính chỉ báo + tín hiệu. Các yêu cầu đồng thời cùng
+        # (symbol, interval) chỉ kích hoạt MỘT lần fetch/process, các luồng khác chờ kết quả đó.
+        key = (symbol, interval)
+        with self._lock:
+            latest = self._latest.get(key)
+            if latest is not None and latest[1] > self.clock():
+                entry_key = key + (latest[0],)
+                if entry_key in self._entries:
+                    self.hits += 1
+                    self._entries.move_to_end(entry_key)
+                    return self._entries[entry_key][0]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None: raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._refresh(key, fetch, process)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock: del self._inflight[key]
+            flight.event.set()
+
+    def _refresh(self, key, fetch, process):
+        raw = fetch()
+        if raw is None or raw.empty: return raw   # Không lưu kết quả rỗng (mã sai / chưa có dữ liệu)
+
+        # Phiên cuối có thể chưa đóng cửa: cùng mốc thời gian nhưng giá khác thì vẫn phải tính lại
+        last_ts = raw.index[-1]
+        entry_key = key + (last_ts,)
+        # So sánh theo byte của dòng cuối (float64): NaN != NaN nên so giá trị sẽ luôn coi nến có ô trống là dữ liệu mới
+        signature = (len(raw), tuple(raw.columns), raw.iloc[-1].to_numpy(dtype=np.float64).tobytes())
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            reusable = entry is not None and entry[1] == signature
+            if reusable:
+                self.hits += 1
+                self._entries.move_to_end(entry_key)
+                self._latest[key] = (last_ts, self.clock() + self.ttl_fn(key[1]))
+                return entry[0]
+            self.misses += 1
+
+        frame = process(raw)
+        nbytes = int(frame.memory_usage(deep=True).sum())
+        with self._lock:
+            # Bản cũ của cùng mã/khung thời gian đã lỗi thời -> bỏ luôn
+            for old_key in [k for k in self._entries if k[:2] == key]: self._drop(old_key)
+            self._entries[entry_key] = (frame, signature, nbytes)
+            self._bytes += nbytes
+            self._latest[key] = (last_ts, self.clock() + self.ttl_fn(key[1]))
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return frame
+
+    def _drop(self, entry_key):
+        self._bytes -= self._entries.pop(entry_key)[2]
+        if self._latest.get(entry_key[:2], (None,))[0] == entry_key[2]: del self._latest[entry_key[:2]]
+
+    def invalidate(self, symbol=None):
+        with self._lock:
+            for entry_key in [k for k in self._entries if symbol is None or k[0] == symbol]: self._drop(entry_key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'coalesced': self.coalesced,
+                'entries': len(self._entries), 'bytes': self._bytes, 'max_bytes': self.max_bytes,
+            }
+
+DATA_CACHE = SharedDataCache(max_bytes=int(os.environ.get("STOCK_CACHE_MB", "512")) * 1024 ** 2)
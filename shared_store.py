@@ -0,0 +1,215 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from engine import COMPACT_COLUMNS, process_daily, compact_frame
+from shared_cache import market_ttl
+
+# --- KHO CHỈ BÁO DÙNG CHUNG GIỮA CÁC TIẾN TRÌNH (MEMORY-MAPPED) ---
+# Nhiều tiến trình Streamlit chạy sau bộ cân bằng tải: mỗi mã chỉ MỘT tiến trình tính chỉ báo rồi ghi ra một file
+# bố cục cố định; mọi tiến trình ánh xạ file đó chỉ đọc (mmap) và dựng DataFrame trỏ thẳng vào vùng ánh xạ, không
+# sao chép. Các trang bộ nhớ là page cache của hệ điều hành nên dùng chung: thêm tiến trình không làm tăng bộ nhớ thực.
+# Bố cục file (little-endian):
+#   [0, HEADER_BYTES)         header cố định (HEADER_DTYPE) + JSON siêu dữ liệu (tên chỉ mục, múi giờ, attrs)
+#   [HEADER_BYTES, +8n)       chỉ mục thời gian int64 (ns, UTC nếu có múi giờ)
+#   tiếp theo, 4 x n x c      các cột COMPACT_COLUMNS float32, mỗi cột một dải liền nhau (như compact_frame)
+#   tiếp theo, n              Signal int8
+# Phiên bản mới (có nến mới / nến đang chạy đổi giá) ghi ra file tạm rồi os.replace vào đúng tên file: thao tác
+# nguyên tử, người đọc đang ánh xạ bản cũ vẫn dùng tiếp được (inode cũ chỉ bị giải phóng khi không còn ai ánh xạ).
+# Trên Windows không thể thay file đang được ánh xạ (PermissionError) -> kho mặc định tắt (STOCK_SHARED_STORE=1 để bật);
+# khi bật mà thay file thất bại, publish() trả về None và nơi gọi dùng bản riêng của tiến trình.
+
+MAX_MAPS = int(os.environ.get("STOCK_SHARED_MAPS", "512"))   # Số file ánh xạ tối đa giữ trong một tiến trình (LRU)
+SHARED_DIR = os.environ.get("STOCK_SHARED_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "shared"))
+MAGIC = b"STKIND01"
+LAYOUT_VERSION = 1
+HEADER_BYTES = 4096
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('layout', '<u4'), ('n_columns', '<u4'), ('n_rows', '<u8'), ('version', '<u8'),
+                         ('written_at', '<f8'), ('expires_at', '<f8'), ('meta_len', '<u4')])
+
+class _Mapping:
+    __slots__ = ("identity", "mm", "frame")
+
+    def __init__(self, identity, mm, frame):
+        self.identity = identity    # (inode, mtime, kích thước) của file đã ánh xạ
+        self.mm = mm
+        self.frame = frame
+
+class SharedFrameStore:
+    def __init__(self, root=SHARED_DIR, ttl_fn=market_ttl, clock=time.time, max_maps=MAX_MAPS):
+        self.root = root
+        self.ttl_fn = ttl_fn
+        self.clock = clock
+        self.max_maps = max_maps
+        self._lock = threading.Lock()
+        self._maps = OrderedDict()   # (symbol, interval) -> _Mapping đang dùng trong tiến trình này, theo thứ tự LRU
+        self.maps = self.remaps = self.publishes = self.stale = self.evictions = self.failures = 0
+
+    def path(self, symbol, interval="1d"):
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9._-]", "_", symbol) + f".{interval}.bin")
+
+    # --- GHI ---
+    def publish(self, symbol, frame, interval="1d"):
+        # Ghi phiên bản mới của khung (đã có chỉ báo + Signal) rồi trả về khung ánh xạ từ file vừa ghi;
+        # None nếu không thay được file (Windows: file đang được ánh xạ)
+        n_rows = len(frame)
+        index = frame.index
+        tz = str(index.tz) if getattr(index, "tz", None) is not None else None
+        if tz is not None: index = index.tz_convert("UTC").tz_localize(None)
+        meta = json.dumps({'symbol': symbol, 'index_name': frame.index.name, 'tz': tz, 'attrs': frame.attrs}, default=str).encode("utf-8")
+        if HEADER_DTYPE.itemsize + len(meta) > HEADER_BYTES: meta = json.dumps({'symbol': symbol, 'index_name': frame.index.name, 'tz': tz}).encode("utf-8")
+
+        previous = self._read_header(self.path(symbol, interval))
+        now = self.clock()
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (MAGIC, LAYOUT_VERSION, len(COMPACT_COLUMNS), n_rows, (int(previous['version']) + 1) if previous is not None else 1,
+                     now, now + self.ttl_fn(interval), len(meta))
+        values = np.full((len(COMPACT_COLUMNS), n_rows), np.nan, dtype='<f4')
+        for i, col in enumerate(COMPACT_COLUMNS):
+            if col in frame: values[i] = frame[col].to_numpy(dtype=np.float32)
+        signal = frame['Signal'].to_numpy().astype('<i1') if 'Signal' in frame else np.zeros(n_rows, dtype='<i1')
+
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header.tobytes() + meta + b"\0" * (HEADER_BYTES - HEADER_DTYPE.itemsize - len(meta)))
+                f.write(np.ascontiguousarray(index.values.astype('datetime64[ns]').view('<i8')).tobytes())
+                f.write(values.tobytes())
+                f.write(signal.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.replace(tmp_path, self.path(symbol, interval))
+            except OSError:
+                os.remove(tmp_path)
+                with self._lock: self.failures += 1
+                return None
+        except BaseException:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        with self._lock: self.publishes += 1
+        return self.get(symbol, interval)
+
+    # --- ĐỌC ---
+    @staticmethod
+    def _read_header(path):
+        try:
+            with open(path, "rb") as f: raw = f.read(HEADER_DTYPE.itemsize)
+        except FileNotFoundError:
+            return None
+        if len(raw) < HEADER_DTYPE.itemsize: return None
+        header = np.frombuffer(raw, dtype=HEADER_DTYPE)[0]
+        return header if header['magic'] == MAGIC and header['layout'] == LAYOUT_VERSION else None
+
+    def get(self, symbol, interval="1d"):
+        # Khung ánh xạ chỉ đọc của phiên bản hiện tại, None nếu chưa có. Chỉ ánh xạ lại khi file đã được thay (đổi inode)
+        path = self.path(symbol, interval)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        key = (symbol, interval)
+        with self._lock:
+            current = self._maps.get(key)
+            if current is not None and current.identity == identity:
+                self._maps.move_to_end(key)
+                return current.frame
+        mapping = self._map(path, identity)
+        if mapping is None: return None
+        frame = mapping.frame     # Giữ trước khi thả khóa: luồng khác có thể loại ngay mapping này khỏi LRU
+        with self._lock:
+            old = self._maps.pop(key, None)
+            if old is not None: self.remaps += 1
+            self.maps += 1
+            self._maps[key] = mapping
+            evicted = [self._maps.popitem(last=False)[1] for _ in range(len(self._maps) - self.max_maps)]
+            self.evictions += len(evicted)
+        for stale in ([old] if old is not None else []) + evicted: self._release(stale)
+        return frame
+
+    @staticmethod
+    def _release(mapping):
+        # Bỏ tham chiếu của kho tới khung; nếu không còn ai dùng khung thì đóng mmap ngay (trả file descriptor và vùng
+        # ánh xạ). Khung còn được dùng (DATA_CACHE, một phiên khác) thì mmap tự đóng khi khung cuối cùng được giải phóng.
+        mapping.frame = None
+        try:
+            mapping.mm.close()
+        except BufferError:
+            pass
+
+    def _map(self, path, identity):
+        try:
+            with open(path, "rb") as f: mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        header = np.frombuffer(mm, dtype=HEADER_DTYPE, count=1)[0]
+        if header['magic'] != MAGIC or header['layout'] != LAYOUT_VERSION: return None
+        n_rows, n_columns = int(header['n_rows']), int(header['n_columns'])
+        meta = json.loads(bytes(mm[HEADER_DTYPE.itemsize:HEADER_DTYPE.itemsize + int(header['meta_len'])]))
+        offset = HEADER_BYTES
+        stamps = np.frombuffer(mm, dtype='<i8', count=n_rows, offset=offset).view('datetime64[ns]')
+        offset += 8 * n_rows
+        values = np.frombuffer(mm, dtype='<f4', count=n_rows * n_columns, offset=offset).reshape(n_columns, n_rows)
+        offset += 4 * n_rows * n_columns
+        signal = np.frombuffer(mm, dtype='<i1', count=n_rows, offset=offset)
+
+        index = pd.DatetimeIndex(stamps, name=meta.get('index_name'), copy=False)
+        if meta.get('tz'): index = index.tz_localize("UTC").tz_convert(meta['tz'])
+        # concat giữ nguyên cả khối float32 lẫn cột Signal dưới dạng view (gán cột mới sẽ sao chép Signal)
+        frame = pd.concat([pd.DataFrame(values.T, index=index, columns=COMPACT_COLUMNS, copy=False),
+                           pd.Series(signal, index=index, name='Signal', copy=False)], axis=1)
+        frame.attrs.update(meta.get('attrs') or {})
+        frame.attrs['shared'] = {'version': int(header['version']), 'written_at': float(header['written_at']),
+                                 'expires_at': float(header['expires_at']), 'bytes': len(mm)}
+        return _Mapping(identity, mm, frame)
+
+    def get_fresh(self, symbol, interval="1d"):
+        # Như get() nhưng chỉ trả về bản còn hạn (theo TTL thị trường lúc ghi), không thì None -> cần tải / tính lại
+        frame = self.get(symbol, interval)
+        if frame is None: return None
+        if frame.attrs['shared']['expires_at'] <= self.clock():
+            with self._lock: self.stale += 1
+            return None
+        return frame
+
+    def stats(self):
+        with self._lock:
+            return {'mapped': len(self._maps), 'maps': self.maps, 'remaps': self.remaps, 'publishes': self.publishes,
+                    'stale': self.stale, 'evictions': self.evictions, 'failures': self.failures,
+                    'mapped_bytes': sum(m.frame.attrs['shared']['bytes'] for m in self._maps.values())}
+
+SHARED_STORE = SharedFrameStore() if os.environ.get("STOCK_SHARED_STORE", "0" if os.name == "nt" else "1") != "0" else None
+
+def main(argv=None):
+    # Tiến trình ghi riêng (VD cron sau giờ đóng cửa): tính sẵn và xuất bản cho mọi worker
+    from data_store import OHLCVStore
+    from screener import normalize_symbol, load_universe
+    parser = argparse.ArgumentParser(description="Tính chỉ báo và ghi vào kho ánh xạ bộ nhớ dùng chung")
+    parser.add_argument("tickers", nargs="*")
+    parser.add_argument("--universe", default=None)
+    parser.add_argument("--source", choices=["yahoo", "store"], default="yahoo")
+    args = parser.parse_args(argv)
+    symbols = [normalize_symbol(t) for t in args.tickers] + (load_universe(args.universe) if args.universe else [])
+    store, shared = OHLCVStore(), SHARED_STORE or SharedFrameStore()
+    t0 = time.perf_counter()
+    for symbol in dict.fromkeys(symbols):
+        raw = store.load(symbol) if args.source == "yahoo" else store.read(symbol)
+        if raw is None or raw.empty: continue
+        frame = shared.publish(symbol, compact_frame(process_daily(raw.copy())))
+        if frame is None:
+            print(f"{symbol}: không thay được file (đang được ánh xạ)")
+            continue
+        print(f"{symbol}: phiên bản {frame.attrs['shared']['version']}, {len(frame)} phiên")
+    print(f"{shared.publishes} mã trong {time.perf_counter() - t0:.2f}s -> {shared.root}")
+
+if __name__ == "__main__":
+    main()
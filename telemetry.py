@@ -0,0 +1,172 @@
+import contextvars
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+import numpy as np
+
+# --- ĐO THỜI GIAN TỪNG GIAI ĐOẠN (SPAN) ---
+# with span("fetch_daily", symbol=s) as sp: ...; sp.set(rows=len(df), cache="miss")
+# hoặc @timed("calculate_indicators"). Tắt bằng STOCK_TELEMETRY=0: span() trả về một đối tượng rỗng dùng chung
+# và @timed chỉ còn một phép kiểm tra cờ.
+# Mỗi giai đoạn giữ tối đa max_samples mẫu gần nhất (dùng chung mọi phiên trong tiến trình) để tính p50/p95.
+# start_trace() gom các span của một lượt chạy trang (kể cả span trên luồng tải nền nếu luồng được chạy trong
+# contextvars.copy_context(), xem fetcher.py) để hiển thị trong khung chẩn đoán.
+
+WRITE_INTERVAL = float(os.environ.get("STOCK_TELEMETRY_WRITE_S", "15"))   # Giây tối thiểu giữa hai lần ghi file
+TELEMETRY_DIR = os.environ.get("STOCK_TELEMETRY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "telemetry"))
+_current_trace = contextvars.ContextVar("telemetry_trace", default=None)
+
+class _NullSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def set(self, **attrs): pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    __slots__ = ("recorder", "name", "attrs", "start")
+
+    def __init__(self, recorder, name, attrs):
+        self.recorder = recorder
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None: self.attrs['error'] = exc_type.__name__
+        self.recorder.record(self.name, time.perf_counter() - self.start, self.attrs)
+        return False
+
+class Recorder:
+    def __init__(self, enabled=True, max_samples=1000):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))   # stage -> thời gian (giây)
+        self._totals = defaultdict(lambda: defaultdict(float))                # stage -> count, sum, rows, bytes, cache_hit, ...
+        self._last_write = None
+
+    def span(self, name, **attrs):
+        return Span(self, name, attrs) if self.enabled else NULL_SPAN
+
+    def timed(self, name=None):
+        # Decorator; ghi số dòng nếu tham số đầu có len() (DataFrame / mảng)
+        def decorate(fn):
+            stage = name or fn.__name__
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return fn(*args, **kwargs)
+                attrs = {'rows': len(args[0])} if args and hasattr(args[0], "__len__") else {}
+                with Span(self, stage, attrs): return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def record(self, name, seconds, attrs):
+        with self._lock:
+            self._samples[name].append(seconds)
+            totals = self._totals[name]
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            for key in ('rows', 'bytes'):
+                if key in attrs: totals[key] += attrs[key]
+            if 'cache' in attrs: totals[f"cache_{attrs['cache']}"] += 1
+            if 'error' in attrs: totals['errors'] += 1
+        trace = _current_trace.get()
+        if trace is not None: trace.append({'stage': name, 'ms': seconds * 1000, **attrs})
+
+    def summary(self):
+        # Mỗi giai đoạn: số lần, p50/p95/max (ms) trên các mẫu gần nhất, tổng dòng / byte, cache hit / miss / shared
+        with self._lock:
+            samples = {k: np.array(v) for k, v in self._samples.items()}
+            totals = {k: dict(v) for k, v in self._totals.items()}
+        rows = []
+        for stage in sorted(samples):
+            ms = samples[stage] * 1000
+            t = totals[stage]
+            rows.append({'stage': stage, 'count': int(t['count']), 'p50_ms': float(np.percentile(ms, 50)),
+                         'p95_ms': float(np.percentile(ms, 95)), 'max_ms': float(ms.max()), 'total_s': t['seconds'],
+                         'rows': int(t.get('rows', 0)), 'bytes': int(t.get('bytes', 0)),
+                         'cache_hit': int(t.get('cache_hit', 0)), 'cache_miss': int(t.get('cache_miss', 0)),
+                         'cache_shared': int(t.get('cache_shared', 0)),
+                         'errors': int(t.get('errors', 0))})
+        return rows
+
+    def to_json(self):
+        return json.dumps({'timestamp': time.time(), 'stages': self.summary()}, ensure_ascii=False, indent=1)
+
+    def to_prometheus(self, prefix="stock_advisor", labels=None):
+        # labels: nhãn thêm vào mọi chuỗi (VD pid để các tiến trình không trùng chuỗi trong textfile collector)
+        extra = "".join(f',{k}="{v}"' for k, v in (labels or {}).items())
+        lines = [f"# HELP {prefix}_stage_seconds Thời gian mỗi giai đoạn (phân vị trên các mẫu gần nhất)",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        counters = []
+        for r in self.summary():
+            label = f'stage="{r["stage"]}"{extra}'
+            lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.5"}} {r["p50_ms"] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds{{{label},quantile="0.95"}} {r["p95_ms"] / 1000:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{{label}}} {r["total_s"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{{label}}} {r["count"]}')
+            counters += [(f"{prefix}_stage_rows_total", label, r['rows']), (f"{prefix}_stage_bytes_total", label, r['bytes']),
+                         (f"{prefix}_stage_cache_total", label + ',result="hit"', r['cache_hit']),
+                         (f"{prefix}_stage_cache_total", label + ',result="miss"', r['cache_miss']),
+                         (f"{prefix}_stage_cache_total", label + ',result="shared"', r['cache_shared']),
+                         (f"{prefix}_stage_errors_total", label, r['errors'])]
+        for metric in dict.fromkeys(m for m, _, _ in counters):
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f"{m}{{{label}}} {value}" for m, label, value in counters if m == metric]
+        return "\n".join(lines) + "\n"
+
+    def write(self, directory=TELEMETRY_DIR, min_interval=WRITE_INTERVAL, clock=time.monotonic):
+        # Ghi metrics.<pid>.prom (cho textfile collector của node_exporter) và metrics.<pid>.json, thay thế nguyên tử.
+        # Mỗi tiến trình một cặp file (chuỗi Prometheus có nhãn pid) nên các worker không ghi đè lên nhau; gọi dày hơn
+        # min_interval giây thì bỏ qua. Trả về True nếu đã ghi. File của tiến trình đã kết thúc được dọn đi.
+        now = clock()
+        with self._lock:
+            if self._last_write is not None and now - self._last_write < min_interval: return False
+            self._last_write = now
+        pid = os.getpid()
+        os.makedirs(directory, exist_ok=True)
+        for name, text in ((f"metrics.{pid}.prom", self.to_prometheus(labels={'pid': pid})), (f"metrics.{pid}.json", self.to_json())):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f: f.write(text)
+            os.replace(tmp_path, os.path.join(directory, name))
+        _remove_dead(directory)
+        return True
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+def _remove_dead(directory):
+    if os.name == "nt": return      # os.kill(pid, 0) trên Windows là gửi CTRL_C_EVENT, không phải kiểm tra tồn tại
+    for name in os.listdir(directory):
+        parts = name.split(".")
+        if len(parts) != 3 or parts[0] != "metrics" or not parts[1].isdigit(): continue
+        try:
+            os.kill(int(parts[1]), 0)
+        except ProcessLookupError:
+            try: os.remove(os.path.join(directory, name))
+            except FileNotFoundError: pass
+        except OSError:
+            pass        # Tiến trình còn sống nhưng của người dùng khác
+
+def start_trace():
+    # Bắt đầu gom span của ngữ cảnh hiện tại (VD một lượt chạy trang); trả về danh sách được điền dần
+    spans = []
+    _current_trace.set(spans)
+    return spans
+
+TELEMETRY = Recorder(enabled=os.environ.get("STOCK_TELEMETRY", "1") != "0")
+span = TELEMETRY.span
+timed = TELEMETRY.timed
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Các module nằm ở thư mục gốc (không phải package) -> thêm vào sys.path khi chạy pytest từ bất kỳ đâu
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("STOCK_SHARED_STORE", "0")
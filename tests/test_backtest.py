@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_ohlcv
+from engine import process_daily, compact_frame, run_simulation, run_simulation_sweep, run_backtest, EXIT_OPEN, EXIT_STOPLOSS
+
+SL_LEVELS = [0.0, 2.0, 5.0, 7.0, 10.0]
+
+@pytest.fixture(scope="module", params=[0, 1, 2])
+def daily(request):
+    return process_daily(synthetic_ohlcv(1500, seed=request.param))
+
+def test_fixture_has_trades(daily):
+    assert (daily['Signal'] == 1).sum() > 0 and (daily['Signal'] == -1).sum() > 0
+
+@pytest.mark.parametrize("stop_loss", SL_LEVELS)
+def test_backtest_matches_loop(daily, stop_loss):
+    annual, hold = run_simulation(daily, stop_loss)
+    result = run_backtest(daily, stop_loss)
+    m = result['metrics']
+    assert m['annual_return'] == pytest.approx(annual, rel=1e-9, abs=1e-9)
+    assert m['avg_hold_days'] == pytest.approx(hold, rel=1e-9, abs=1e-9)
+
+    # Vốn cuối kỳ của đường vốn phải khớp lợi nhuận năm của vòng lặp
+    years = (daily.index[-1] - daily.index[0]).days / 365.25
+    assert (result['equity'][-1] / 100_000_000 - 1) * 100 / years == pytest.approx(annual, rel=1e-9, abs=1e-9)
+    trades = result['trades']
+    assert m['trades'] == len(trades) and (trades['entry_idx'] >= 50).all()
+    if stop_loss == 0: assert not (trades['reason'] == EXIT_STOPLOSS).any()
+    assert (trades['reason'] == EXIT_OPEN).sum() <= 1
+
+def test_sweep_matches_loop(daily):
+    returns, holds = run_simulation_sweep(daily, SL_LEVELS)
+    expected = np.array([run_simulation(daily, sl) for sl in SL_LEVELS])
+    np.testing.assert_allclose(returns, expected[:, 0], rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(holds, expected[:, 1], rtol=1e-9, atol=1e-9)
+
+def test_compact_frame_matches_full(daily):
+    # Khung gọn float32 cho cùng chuỗi tín hiệu -> kết quả gần như trùng (giá lưu float32)
+    compact = compact_frame(daily)
+    for sl in (0.0, 7.0):
+        assert run_backtest(compact, sl)['metrics']['annual_return'] == pytest.approx(run_simulation(compact, sl)[0], rel=1e-9, abs=1e-9)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from data_store import OHLCVStore, FakeProvider
+
+class SplitProvider:
+    # Nguồn đã điều chỉnh giá (auto_adjust): sau khi split() mọi phiên trước ngày chia tách bị chia theo tỉ lệ
+    def __init__(self, bars=60):
+        index = pd.bdate_range("2024-01-01", periods=bars, name="Date")
+        self.df = pd.DataFrame({'Open': 100.0, 'High': 101.0, 'Low': 99.0, 'Close': 100.0, 'Volume': 1e6}, index=index)
+        self.calls = []
+
+    def fetch(self, symbol, start=None, interval="1d"):
+        self.calls.append(start)
+        return self.df if start is None else self.df[self.df.index >= pd.Timestamp(start)]
+
+    def append(self, n=1):
+        index = pd.bdate_range(self.df.index[-1] + pd.offsets.BDay(), periods=n, name="Date")
+        last = self.df.iloc[-1]
+        self.df = pd.concat([self.df, pd.DataFrame([last.to_dict()] * n, index=index)])
+
+    def split(self, ratio):
+        self.df = self.df.copy()
+        self.df[['Open', 'High', 'Low', 'Close']] /= ratio
+
+def test_topup_appends_new_bars_only(tmp_path):
+    provider = SplitProvider()
+    store = OHLCVStore(root=str(tmp_path), provider=provider)
+    assert len(store.load("AAA.VN")) == 60
+    provider.append(3)
+    df = store.load("AAA.VN")
+    assert len(df) == 63 and provider.calls[-1] == provider.df.index[-5]
+    pd.testing.assert_frame_equal(store.read("AAA.VN"), provider.df, check_freq=False)
+
+def test_split_rewrites_whole_history(tmp_path):
+    provider = SplitProvider()
+    store = OHLCVStore(root=str(tmp_path), provider=provider)
+    store.load("AAA.VN")
+    store.save_state("AAA.VN", {'bars': 60})
+    provider.append(3)
+    provider.split(2)
+    df = store.load("AAA.VN")
+    # Không còn bậc giá giả 100 -> 50 trong lịch sử đã lưu
+    assert np.allclose(df['Close'], 50.0) and len(df) == 63
+    assert provider.calls[-1] is None
+    pd.testing.assert_frame_equal(store.read("AAA.VN"), provider.df, check_freq=False)
+    assert store.load_state("AAA.VN") is None
+
+def test_running_bar_change_is_not_a_split(tmp_path):
+    # Phiên cuối đã lưu chưa đóng cửa: giá của nó đổi không được coi là điều chỉnh lịch sử
+    provider = SplitProvider()
+    store = OHLCVStore(root=str(tmp_path), provider=provider)
+    store.load("AAA.VN")
+    provider.df = provider.df.copy()
+    provider.df.iloc[-1, provider.df.columns.get_loc('Close')] = 104.0
+    df = store.load("AAA.VN")
+    assert None not in provider.calls[1:] and df['Close'].iloc[-1] == 104.0 and df['Close'].iloc[-2] == 100.0
+
+def test_fake_provider_incremental_load(tmp_path):
+    provider = FakeProvider(bars=300)
+    store = OHLCVStore(root=str(tmp_path), provider=provider)
+    first = store.load("HPG.VN")
+    again = store.load("HPG.VN")
+    pd.testing.assert_frame_equal(first, again, check_freq=False)
+    assert provider.calls[("HPG.VN", "1d")] == 2
@@ -0,0 +1,128 @@
+import threading
+import time
+import pytest
+from data_store import FakeProvider, OHLCVStore, ProviderError
+from fetcher import Fetcher, FetchError, FetchTimeout, load_daily, load_symbol, prefetch
+from shared_cache import SharedDataCache
+
+def make_fetcher(**kwargs):
+    sleeps = []
+    kwargs.setdefault('sleep', sleeps.append)
+    fetcher = Fetcher(**kwargs)
+    return fetcher, sleeps
+
+def make_store(tmp_path, **provider_kwargs):
+    provider = FakeProvider(bars=300, **provider_kwargs)
+    return OHLCVStore(root=str(tmp_path), provider=provider), provider
+
+def test_retries_until_success_with_backoff():
+    provider = FakeProvider(bars=100, fail_first=2)
+    fetcher, sleeps = make_fetcher(retries=3, backoff=0.5, max_backoff=8.0)
+    df = fetcher.call(lambda: provider.fetch("HPG.VN"), "HPG.VN 1d")
+    assert len(df) == 100
+    assert fetcher.stats()['attempts'] == 3 and fetcher.stats()['retries'] == 2 and fetcher.stats()['failures'] == 0
+    # Backoff mũ có jitter 50-100%: lần thử lại k chờ trong [0.5, 1] x 0.5 x 2^(k-1)
+    assert len(sleeps) == 2
+    for k, delay in enumerate(sleeps, start=1):
+        assert 0.25 * 2 ** (k - 1) <= delay <= 0.5 * 2 ** (k - 1)
+
+def test_backoff_is_capped():
+    fetcher, _ = make_fetcher(backoff=1.0, max_backoff=2.0)
+    assert all(fetcher.backoff_delay(attempt) <= 2.0 for attempt in range(1, 10))
+
+def test_gives_up_after_retries():
+    provider = FakeProvider(bars=100, fail_first=10)
+    fetcher, sleeps = make_fetcher(retries=2)
+    with pytest.raises(FetchError) as info:
+        fetcher.call(lambda: provider.fetch("HPG.VN"), "HPG.VN 1d")
+    assert not isinstance(info.value, FetchTimeout)
+    assert info.value.attempts == 3 and isinstance(info.value.cause, ProviderError)
+    assert provider.calls[("HPG.VN", "1d")] == 3 and len(sleeps) == 2 and fetcher.stats()['failures'] == 1
+
+def test_fail_rate_is_retried():
+    provider = FakeProvider(bars=50, fail_rate=0.5, seed=1)
+    fetcher, _ = make_fetcher(retries=10)
+    for _ in range(10): fetcher.call(lambda: provider.fetch("HPG.VN"), "HPG.VN 1d")
+    assert fetcher.stats()['retries'] > 0 and fetcher.stats()['failures'] == 0
+
+def test_slow_provider_times_out():
+    provider = FakeProvider(bars=50, latency=0.5)
+    fetcher, _ = make_fetcher(timeout=0.05, retries=1)
+    with pytest.raises(FetchTimeout) as info:
+        fetcher.call(lambda: provider.fetch("HPG.VN"), "HPG.VN 1d")
+    assert info.value.attempts == 2 and fetcher.stats()['timeouts'] == 2
+
+def test_timeout_includes_queue_time():
+    # Luồng I/O duy nhất bận 0.15s rồi lần thử chạy chậm: hết hạn sau timeout tính từ lúc gửi, không phải chờ hàng + timeout
+    fetcher, _ = make_fetcher(max_concurrency=1, timeout=0.2, retries=0)
+    blocker = fetcher._io.submit(time.sleep, 0.15)
+    t0 = time.perf_counter()
+    with pytest.raises(FetchTimeout):
+        fetcher.call(lambda: time.sleep(0.5), "queued")
+    elapsed = time.perf_counter() - t0
+    blocker.result()
+    assert 0.15 < elapsed < 0.3
+
+def test_concurrency_is_capped():
+    fetcher, _ = make_fetcher(max_concurrency=2, timeout=5.0)
+    active, peak, lock = [0], [0], threading.Lock()
+    def slow():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock: active[0] -= 1
+        return active
+    futures = [fetcher.submit(fetcher.call, slow, f"job {i}") for i in range(8)]
+    for future in futures: future.result()
+    assert peak[0] == 2
+
+def test_concurrent_loads_coalesce_into_one_fetch(tmp_path):
+    store, provider = make_store(tmp_path, latency=0.2)
+    fetcher, _ = make_fetcher(max_concurrency=4)
+    cache = SharedDataCache()
+    futures = [fetcher.submit(load_daily, "HPG.VN", fetcher, cache, store, None) for _ in range(8)]
+    frames = [future.result() for future in futures]
+    assert provider.calls[("HPG.VN", "1d")] == 1
+    assert all(frame is frames[0] for frame in frames)
+    stats = cache.stats()
+    assert stats['misses'] == 1 and stats['coalesced'] + stats['hits'] == 7 and stats['coalesced'] > 0
+
+def test_load_daily_falls_back_to_local_store(tmp_path):
+    store, provider = make_store(tmp_path)
+    fetcher, _ = make_fetcher(retries=1)
+    fresh = load_daily("HPG.VN", fetcher, SharedDataCache(), store, None)
+    provider.fail_first = 10**6
+    fallback = load_daily("HPG.VN", fetcher, SharedDataCache(), store, None)
+    assert fallback.equals(fresh)
+    # Không có bản lưu -> lỗi được ném ra
+    with pytest.raises(FetchError):
+        load_daily("VNM.VN", fetcher, SharedDataCache(), store, None)
+
+class BrokenIntraday(FakeProvider):
+    def fetch_intraday(self, symbol, interval="5m", start=None):
+        raise ProviderError("intraday down")
+
+def test_load_symbol_keeps_daily_when_intraday_fails(tmp_path):
+    store = OHLCVStore(root=str(tmp_path), provider=BrokenIntraday(bars=300))
+    fetcher, _ = make_fetcher(retries=0)
+    df_daily, df_intra, error = load_symbol("HPG.VN", fetcher, SharedDataCache(), store, None)
+    assert len(df_daily) == 300 and df_intra.empty and isinstance(error, FetchError)
+
+def test_load_symbol_fetches_both(tmp_path):
+    store, provider = make_store(tmp_path)
+    fetcher, _ = make_fetcher()
+    df_daily, df_intra, error = load_symbol("HPG.VN", fetcher, SharedDataCache(), store, None)
+    assert error is None and len(df_daily) == 300 and len(df_intra) > 0
+    assert provider.calls[("HPG.VN", "1d")] == 1 and provider.calls[("HPG.VN", "5m")] == 1
+
+def test_prefetch_warms_cache(tmp_path):
+    store, provider = make_store(tmp_path, unknown={"XXX.VN"})
+    fetcher, _ = make_fetcher()
+    cache = SharedDataCache()
+    jobs = prefetch(["HPG.VN", "VNM.VN", "XXX.VN"], fetcher, cache, store, None)
+    for job in jobs.values(): job.exception()
+    assert jobs["HPG.VN"].exception() is None
+    calls = provider.calls[("HPG.VN", "1d")]
+    load_daily("HPG.VN", fetcher, cache, store, None)
+    assert provider.calls[("HPG.VN", "1d")] == calls and cache.stats()['hits'] >= 1
@@ -0,0 +1,47 @@
+import json
+import numpy as np
+import pytest
+from benchmark import synthetic_ohlcv
+from engine import calculate_indicators
+from indicator_state import IndicatorState
+
+COLUMNS = ['SMA20', 'StdDev', 'Upper', 'Lower', 'RSI', 'TR14', '+DI', '-DI', 'DX', 'ADX']
+
+def batch(df):
+    return calculate_indicators(df.copy())[COLUMNS]
+
+def assert_matches(stream, expected):
+    for col in COLUMNS:
+        np.testing.assert_allclose(stream[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float), rtol=1e-9, atol=1e-9, err_msg=col)
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_streaming_matches_batch(seed):
+    df = synthetic_ohlcv(400, seed=seed)
+    state = IndicatorState()
+    assert_matches(state.catch_up(df), batch(df))
+    assert state.bars == len(df) and state.last_date == df.index[-1]
+
+def test_large_prices_and_gaps():
+    # Giá lớn (kiểm tra dời tâm cửa sổ) và vài phiên thiếu giá đóng cửa
+    df = synthetic_ohlcv(300, seed=5)
+    df[['Open', 'High', 'Low', 'Close']] *= 1000
+    df.iloc[[60, 61, 150], df.columns.get_loc('Close')] = np.nan
+    assert_matches(IndicatorState().catch_up(df), batch(df))
+
+def test_catch_up_after_snapshot_restore():
+    df = synthetic_ohlcv(300, seed=3)
+    state = IndicatorState.from_frame(df.iloc[:200])
+    restored = IndicatorState.restore(json.loads(json.dumps(state.snapshot())))
+    tail = restored.catch_up(df)
+    assert len(tail) == 100
+    assert_matches(tail, batch(df).iloc[200:])
+
+def test_preview_does_not_mutate():
+    df = synthetic_ohlcv(120, seed=4)
+    state = IndicatorState.from_frame(df.iloc[:-1])
+    before = state.snapshot()
+    last = df.iloc[-1]
+    preview = state.preview(last['High'], last['Low'], last['Close'])
+    assert state.snapshot() == before
+    expected = batch(df).iloc[-1]
+    for col in COLUMNS: assert preview[col] == pytest.approx(expected[col], rel=1e-9)
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_ohlcv
+from data_store import OHLCV_COLUMNS
+from engine import process_daily
+from live import LiveSession, SimulatedFeed, IntradayRing, DAY_NS
+
+SESSION_OPEN = pd.Timestamp("2026-10-16 02:00").timestamp()     # 9:00 giờ VN
+
+class DirectFetcher:
+    def call(self, fn, label): return fn()
+
+@pytest.fixture
+def raw():
+    raw = synthetic_ohlcv(600, seed=3)
+    raw.index = pd.DatetimeIndex(pd.bdate_range(end="2026-10-15", periods=len(raw)), name="Date")   # Hôm nay là phiên mới
+    return raw
+
+def run_session(raw, seconds, poll_every=17):
+    now = [SESSION_OPEN]
+    feed = SimulatedFeed(clock=lambda: now[0], start_price=float(raw['Close'].iloc[-1]))
+    live = LiveSession("AAA.VN", process_daily(raw.copy()), feed, fetcher=DirectFetcher())
+    while now[0] < SESSION_OPEN + seconds:
+        now[0] += poll_every
+        live.tick()
+    return live, now
+
+def resampled(feed, symbol, seconds):
+    # Chuẩn đối chiếu: đường giá từng giây của phiên giả lập, gộp nến 5 phút bằng pandas
+    day = int(SESSION_OPEN * 1e9 + 7 * 3_600_000_000_000) // DAY_NS * DAY_NS - 7 * 3_600_000_000_000
+    prices, volumes = feed._path(symbol, day)
+    n = min(seconds + 1, len(prices))
+    per_second = pd.DataFrame({'Open': prices[:n], 'High': prices[:n], 'Low': prices[:n], 'Close': prices[:n], 'Volume': volumes[:n]},
+                              index=pd.DatetimeIndex(pd.Timestamp(SESSION_OPEN, unit="s") + pd.to_timedelta(np.arange(n), unit="s")))
+    return per_second.resample("5min").agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'})
+
+@pytest.mark.parametrize("seconds", [1234, 6 * 3600 + 60])
+def test_ring_matches_resample(raw, seconds):
+    live, now = run_session(raw, seconds)
+    ring = live.ring.frame()
+    expected = resampled(live.feed, "AAA.VN", int(now[0] - SESSION_OPEN))
+    np.testing.assert_array_equal(ring.index.asi8, expected.index.as_unit("ns").asi8)
+    np.testing.assert_allclose(ring.to_numpy(), expected[OHLCV_COLUMNS].to_numpy(), rtol=1e-12)
+    # Cả phiên tải một lần cũng cho cùng kết quả
+    one_shot = live.feed.poll("AAA.VN")
+    np.testing.assert_allclose(ring.to_numpy(), one_shot.to_numpy(), rtol=1e-12)
+    assert live.bars_received < len(ring) * 2 + live.ticks      # Mỗi lần chỉ nhận nến đang chạy + nến mới
+
+def test_provisional_matches_batch(raw):
+    live, _ = run_session(raw, 3 * 3600)
+    bar = live.provisional()
+    intraday = live.ring.frame()
+    day = pd.DataFrame({'Open': [intraday['Open'].iloc[0]], 'High': [intraday['High'].max()], 'Low': [intraday['Low'].min()],
+                        'Close': [intraday['Close'].iloc[-1]], 'Volume': [intraday['Volume'].sum()]},
+                       index=pd.DatetimeIndex([pd.Timestamp("2026-10-16")], name="Date"))
+    expected = process_daily(pd.concat([raw, day])).iloc[-1]
+    assert bar['Date'] == pd.Timestamp("2026-10-16")
+    for col in ['Open', 'High', 'Low', 'Close', 'Volume', 'SMA20', 'Upper', 'Lower', 'RSI', 'ADX', '+DI', '-DI', 'Signal']:
+        assert bar[col] == pytest.approx(expected[col], rel=1e-9), col
+    assert bar['prev_close'] == raw['Close'].iloc[-1]
+
+def test_daily_with_today_bar_is_ignored(raw):
+    # Nguồn nến ngày đã có nến tạm của hôm nay -> không được tính hai lần vào trạng thái
+    live, now = run_session(raw, 600)
+    today = pd.DataFrame([live.provisional()]).set_index('Date')[['Open', 'High', 'Low', 'Close', 'Volume']]
+    other = LiveSession("AAA.VN", process_daily(pd.concat([raw, today])), live.feed, fetcher=DirectFetcher())
+    other.tick()
+    assert other.provisional()['RSI'] == pytest.approx(live.provisional()['RSI'], rel=1e-12)
+    assert other.provisional()['prev_close'] == raw['Close'].iloc[-1]
+
+def test_rollover_closes_previous_session(raw):
+    live, now = run_session(raw, 6 * 3600 + 60)
+    closed = live.provisional()
+    now[0] = SESSION_OPEN + 86_400 + 10
+    live.tick()
+    assert live.state.bars == len(raw) + 1 and live.ring.size == 1
+    assert live.provisional()['Date'] == pd.Timestamp("2026-10-17")
+    assert live.provisional()['prev_close'] == pytest.approx(closed['Close'])
+
+def test_ring_wraps_and_overwrites_running_bar():
+    ring = IntradayRing(4)
+    for t in range(7): assert ring.push(t, np.full(5, float(t)))
+    assert not ring.push(6, np.full(5, 60.0))
+    frame = ring.frame()
+    assert frame.index.asi8.tolist() == [3, 4, 5, 6] and frame['Close'].tolist() == [3.0, 4.0, 5.0, 60.0]
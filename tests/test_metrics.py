@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+from benchmark import synthetic_ohlcv
+from engine import periods_per_year, process_daily, run_backtest, _day_ns
+from timeframes import TimeframeCache
+
+def test_periods_per_year_follows_bar_spacing():
+    for freq, expected in (("B", 261), ("W-FRI", 52), ("ME", 12)):
+        index = pd.date_range("2010-01-01", periods=200, freq=freq)
+        assert abs(periods_per_year(_day_ns(index)) - expected) < 1
+
+def test_sharpe_annualized_with_bar_frequency():
+    daily = process_daily(synthetic_ohlcv(5000, seed=2))
+    weekly = TimeframeCache().get("X.VN", "1wk", daily)
+    bt = run_backtest(weekly, 0)
+    returns = np.diff(bt['equity'][50:]) / bt['equity'][50:-1]
+    assert bt['metrics']['trades'] > 0
+    # Nến tuần: năm hóa bằng ~52 kỳ, không phải 252 (Sharpe sẽ bị thổi lên ~2.2 lần)
+    assert np.isclose(bt['metrics']['sharpe'], returns.mean() / returns.std() * np.sqrt(periods_per_year(_day_ns(weekly.index[50:]))))
+    assert abs(periods_per_year(_day_ns(weekly.index[50:])) - 52) < 1
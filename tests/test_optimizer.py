@@ -0,0 +1,23 @@
+import pandas as pd
+import pytest
+import optimizer
+from benchmark import synthetic_ohlcv
+from engine import process_daily, run_simulation
+from optimizer import optimize_strategy, grid_combinations, DEFAULT_PARAMS, PARAM_NAMES
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_default_combo_matches_engine(seed):
+    # Dải BB tính lại trong bộ tối ưu phải trùng calculate_indicators ở bộ tham số mặc định
+    raw = synthetic_ohlcv(1500, seed=seed)
+    combos = grid_combinations({'bb_window': [15, 20], 'rsi_buy': [30, 35]})
+    ranked, _ = optimize_strategy(raw, combos, stop_loss=7.0, workers=1)
+    row = ranked.loc[(ranked[PARAM_NAMES] == pd.Series(DEFAULT_PARAMS)[PARAM_NAMES]).all(axis=1)]
+    annual, hold = run_simulation(process_daily(raw.copy()), 7.0)
+    assert len(row) == 1
+    assert row['annual_return'].iloc[0] == annual and row['avg_hold_days'].iloc[0] == hold
+
+def test_small_sweep_stays_in_process(monkeypatch):
+    def no_pool(*args, **kwargs): raise AssertionError("không được mở tiến trình con")
+    monkeypatch.setattr(optimizer, "ProcessPoolExecutor", no_pool)
+    ranked, _ = optimize_strategy(synthetic_ohlcv(1000, seed=0))
+    assert len(ranked) == len(grid_combinations())
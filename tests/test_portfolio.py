@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from benchmark import synthetic_universe
+from engine import FEE_RATE
+from portfolio import prepare_frames, run_portfolio
+
+def flat_frame(price, buy_at, n_bars=80, rsi=20.0):
+    index = pd.bdate_range("2024-01-01", periods=n_bars, name="Date")
+    signal = np.zeros(n_bars, dtype=np.int8)
+    signal[buy_at] = 1
+    return pd.DataFrame({'Close': float(price), 'RSI': rsi, 'Signal': signal}, index=index)
+
+def test_same_day_buys_reserve_fees():
+    # Hai mã mua cùng ngày, mỗi lệnh được tới 100% tài sản: trước đây lệnh đầu tiêu hết tiền chưa tính phí -> tiền âm
+    frames = {'AAA.VN': flat_frame(100.0, 60, rsi=10.0), 'BBB.VN': flat_frame(100.0, 60, rsi=20.0)}
+    result = run_portfolio(frames, stop_loss_pct=0, max_positions=2, position_size=1.0, initial_capital=1_000_000)
+    trades = result['trades']
+    assert len(trades) == 1 and trades['shares'][0] == 9985    # trunc(1e6 / 1.0015 / 100)
+    cost = trades['shares'][0] * 100.0 * (1 + FEE_RATE)
+    assert np.isclose(result['equity'][60], 1_000_000 - cost + trades['shares'][0] * 100.0)
+    assert 1_000_000 - cost >= 0
+
+def test_cash_never_negative_on_random_universe():
+    frames = prepare_frames(synthetic_universe(20, 1500, seed=4), workers=1)
+    for size in (0.1, 0.5, 1.0):
+        result = run_portfolio(frames, stop_loss_pct=5, max_positions=5, position_size=size)
+        assert (result['equity'] > 0).all() and len(result['trades']) > 0
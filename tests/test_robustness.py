@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_ohlcv
+from engine import process_daily, simulate_lanes, run_backtest, _day_ns, DEFAULT_SL_LEVELS
+from robustness import path_signals, simulate_paths, block_bootstrap, _years
+
+@pytest.fixture(scope="module", params=[0, 1, 2])
+def daily(request):
+    return process_daily(synthetic_ohlcv(1500, seed=request.param))
+
+def historical_path(df):
+    # Đường giá lịch sử nguyên vẹn dưới dạng mảng (1 đường x phiên)
+    return tuple(df[col].to_numpy(dtype=float)[None, :] for col in ('Close', 'High', 'Low'))
+
+def test_path_signals_match_engine(daily):
+    close, high, low = historical_path(daily)
+    np.testing.assert_array_equal(path_signals(close, high, low)[0], daily['Signal'].to_numpy().astype(np.int8))
+
+def test_simulate_paths_match_engine(daily):
+    close, high, low = historical_path(daily)
+    returns, drawdowns = simulate_paths(close, path_signals(close, high, low), DEFAULT_SL_LEVELS, _years(daily.index))
+    expected = simulate_lanes(close[0], daily['Signal'].values, _day_ns(daily.index), DEFAULT_SL_LEVELS)['annual_return']
+    np.testing.assert_allclose(returns[0], expected, rtol=1e-9, atol=1e-9)
+    for k, level in enumerate(DEFAULT_SL_LEVELS):
+        assert drawdowns[0, k] == pytest.approx(run_backtest(daily, level)['metrics']['max_drawdown'], rel=1e-9, abs=1e-9)
+
+def test_bootstrap_with_whole_history_block_reproduces_prices(daily):
+    # Một khối dài bằng cả lịch sử chỉ có một vị trí bắt đầu -> đúng đường giá lịch sử
+    close, high, low = block_bootstrap(daily, 2, block=len(daily), rng=np.random.default_rng(0))
+    for path, col in ((close, 'Close'), (high, 'High'), (low, 'Low')):
+        np.testing.assert_allclose(path, np.tile(daily[col].to_numpy(dtype=float), (2, 1)), rtol=1e-9)
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+from shared_cache import SharedDataCache
+
+def raw_frame(last_volume=np.nan, close=101.0):
+    index = pd.bdate_range("2024-01-01", periods=3, name="Date")
+    return pd.DataFrame({'Open': [100.0, 100.0, 100.0], 'Close': [100.0, 100.0, close], 'Volume': [1e6, 1e6, last_volume]}, index=index)
+
+def test_nan_in_last_bar_still_reuses_entry():
+    now = [0.0]
+    cache = SharedDataCache(ttl_fn=lambda interval: 10, clock=lambda: now[0])
+    processed = []
+    process = lambda raw: processed.append(1) or raw.assign(Signal=0)
+    first = cache.get_or_compute("AAA.VN", "1d", fetch=raw_frame, process=process)
+    now[0] += 60                                   # Hết hạn -> tải lại, dòng cuối giống hệt (có NaN)
+    again = cache.get_or_compute("AAA.VN", "1d", fetch=raw_frame, process=process)
+    assert again is first and len(processed) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_changed_last_bar_is_recomputed():
+    now = [0.0]
+    cache = SharedDataCache(ttl_fn=lambda interval: 10, clock=lambda: now[0])
+    process = lambda raw: raw.assign(Signal=0)
+    first = cache.get_or_compute("AAA.VN", "1d", fetch=raw_frame, process=process)
+    now[0] += 60
+    again = cache.get_or_compute("AAA.VN", "1d", fetch=lambda: raw_frame(close=102.0), process=process)
+    assert again is not first and again['Close'].iloc[-1] == 102.0 and cache.stats()['misses'] == 2
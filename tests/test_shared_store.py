@@ -0,0 +1,79 @@
+import gc
+import os
+import time
+import numpy as np
+import pandas as pd
+from benchmark import synthetic_ohlcv
+from engine import process_daily, compact_frame
+from fetcher import load_daily
+from data_store import FakeProvider, OHLCVStore
+from shared_cache import SharedDataCache
+from shared_store import SharedFrameStore
+from telemetry import Recorder
+
+def open_fds(root):
+    fds = [os.path.join("/proc/self/fd", fd) for fd in os.listdir("/proc/self/fd")]
+    targets = []
+    for fd in fds:
+        try: targets.append(os.readlink(fd))
+        except OSError: pass
+    return sum(t.startswith(str(root)) for t in targets)
+
+def test_roundtrip_is_zero_copy(tmp_path):
+    store = SharedFrameStore(root=str(tmp_path))
+    frame = compact_frame(process_daily(synthetic_ohlcv(1000, seed=1)))
+    mapped = store.publish("AAA.VN", frame)
+    pd.testing.assert_frame_equal(mapped[frame.columns], frame, check_freq=False, check_index_type=False)
+    assert not mapped['Close'].to_numpy().flags.writeable and mapped.attrs['shared']['version'] == 1
+    assert store.publish("AAA.VN", frame).attrs['shared']['version'] == 2
+
+def test_mappings_are_bounded_and_released(tmp_path):
+    store = SharedFrameStore(root=str(tmp_path), max_maps=4)
+    frame = compact_frame(process_daily(synthetic_ohlcv(300, seed=1)))
+    for i in range(20): store.publish(f"S{i:02d}.VN", frame)
+    gc.collect()
+    stats = store.stats()
+    assert stats['mapped'] == 4 and stats['evictions'] == 16
+    # Khung không còn ai giữ -> mmap đã đóng, không rò file descriptor
+    if os.path.isdir("/proc/self/fd"): assert open_fds(tmp_path) <= 4
+
+def test_evicted_frame_in_use_stays_valid(tmp_path):
+    store = SharedFrameStore(root=str(tmp_path), max_maps=1)
+    frame = compact_frame(process_daily(synthetic_ohlcv(300, seed=1)))
+    held = store.publish("AAA.VN", frame)
+    store.publish("BBB.VN", frame)
+    assert store.stats()['mapped'] == 1
+    np.testing.assert_array_equal(held['Close'].to_numpy(), frame['Close'].to_numpy())
+
+def test_shared_hits_are_exported(tmp_path, monkeypatch):
+    import fetcher
+    recorder = Recorder()
+    monkeypatch.setattr(fetcher, "span", recorder.span)
+    shared = SharedFrameStore(root=str(tmp_path / "shared"))
+    store = OHLCVStore(root=str(tmp_path / "ohlcv"), provider=FakeProvider(bars=300))
+    load_daily("HPG.VN", cache=SharedDataCache(), store=store, shared=shared)
+    load_daily("HPG.VN", cache=SharedDataCache(), store=store, shared=shared)
+    row = next(r for r in recorder.summary() if r['stage'] == 'load_daily')
+    assert row['cache_miss'] == 1 and row['cache_shared'] == 1
+    assert 'stock_advisor_stage_cache_total{stage="load_daily",result="shared"} 1' in recorder.to_prometheus()
+
+def test_failed_replace_falls_back_to_private_frame(tmp_path, monkeypatch):
+    # Windows: file đích đang được ánh xạ -> os.replace báo PermissionError
+    import shared_store
+    shared = SharedFrameStore(root=str(tmp_path / "shared"))
+    store = OHLCVStore(root=str(tmp_path / "ohlcv"), provider=FakeProvider(bars=300))
+    first = load_daily("HPG.VN", cache=SharedDataCache(), store=store, shared=shared)
+    assert 'shared' in first.attrs
+
+    real_replace = os.replace
+    def replace(src, dst):
+        if dst.endswith(".bin"): raise PermissionError(13, "The process cannot access the file", dst)
+        return real_replace(src, dst)
+    monkeypatch.setattr(shared_store.os, "replace", replace)
+    assert shared.publish("HPG.VN", first) is None
+    assert shared.stats()['failures'] == 1 and os.listdir(shared.root) == ["HPG.VN.1d.bin"]
+
+    shared.clock = lambda: time.time() + 10 ** 7           # Bản đã ghi hết hạn -> tính lại và xuất bản lại
+    df = load_daily("HPG.VN", cache=SharedDataCache(), store=store, shared=shared)
+    assert 'shared' not in df.attrs and shared.stats()['failures'] == 2
+    np.testing.assert_array_equal(df['Close'].to_numpy(), first['Close'].to_numpy())
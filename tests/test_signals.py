@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_ohlcv
+from engine import calculate_indicators, precalculate_signals, check_signals, process_daily
+
+# --- BẢN GỐC (VÒNG LẶP) LÀM CHUẨN ĐỐI CHIẾU ---
+def legacy_signals(df):
+    signals = np.zeros(len(df))
+    closes = df['Close'].values
+    rsis = df['RSI'].values
+    adxs = df['ADX'].values
+    lowers = df['Lower'].values
+    uppers = df['Upper'].values
+    di_plus = df['+DI'].values
+    di_minus = df['-DI'].values
+
+    for i in range(2, len(df)):
+        price = closes[i]; rsi = rsis[i]; adx = adxs[i]
+        lower_band = lowers[i]; upper_band = uppers[i]
+
+        buy_trigger = (price <= lower_band * 1.01) and (rsi < 30)
+        if buy_trigger:
+            if adx < 25:
+                if (di_minus[i] > di_plus[i]) and (di_minus[i] < di_minus[i-1]): signals[i] = 1
+            elif adx > 50:
+                if (adx < adxs[i-1] < adxs[i-2]) and (di_minus[i] < di_minus[i-1] < di_minus[i-2]): signals[i] = 1
+            else:
+                if (di_minus[i] > di_plus[i]) and (di_minus[i] < di_minus[i-1]): signals[i] = 1
+
+        sell_trigger = (price >= upper_band * 0.99) and (rsi > 70)
+        if sell_trigger:
+            if adx < 25:
+                if (di_plus[i] > di_minus[i]) and (di_plus[i] < di_plus[i-1]): signals[i] = -1
+            elif adx > 50:
+                if (adx < adxs[i-1] < adxs[i-2]) and (di_plus[i] < di_plus[i-1] < di_plus[i-2]): signals[i] = -1
+            else:
+                if (di_plus[i] > di_minus[i]) and (di_plus[i] < di_plus[i-1]): signals[i] = -1
+    return signals
+
+def row_signals(df):
+    rows = df.to_dict('records')
+    return np.array([0] * 2 + [check_signals(rows[i], rows[i - 1], rows[i - 2]) for i in range(2, len(rows))], dtype=float)
+
+def flat_stretches(n_bars, seed):
+    # Giá đứng yên nhiều phiên (StdDev = 0 -> Upper = Lower = SMA20, RSI 0/0 = NaN) xen giữa các đoạn biến động
+    df = synthetic_ohlcv(n_bars, seed=seed)
+    for start in range(100, n_bars - 60, 400):
+        price = df['Close'].iloc[start]
+        df.iloc[start:start + 40, :4] = price
+    return df
+
+FRAMES = {
+    'synthetic': lambda: synthetic_ohlcv(3000, seed=1),
+    'synthetic_long': lambda: synthetic_ohlcv(20_000, seed=7),
+    'flat_stretches': lambda: flat_stretches(3000, seed=3),
+}
+
+@pytest.mark.parametrize("name", sorted(FRAMES))
+def test_vectorized_matches_legacy_loop(name):
+    df = calculate_indicators(FRAMES[name]().copy())
+    expected = legacy_signals(df)
+    assert (expected != 0).any()
+    np.testing.assert_array_equal(precalculate_signals(df.copy())['Signal'].to_numpy(), expected)
+
+@pytest.mark.parametrize("name", sorted(FRAMES))
+def test_vectorized_matches_check_signals(name):
+    df = process_daily(FRAMES[name]().iloc[:3000].copy())
+    np.testing.assert_array_equal(df['Signal'].to_numpy(), row_signals(df))
+
+def test_band_tolerance_edges():
+    # Giá đúng bằng Lower x 1.01 / Upper x 0.99, DI bằng nhau và NaN: mọi nhánh so sánh biên
+    rng = np.random.default_rng(0)
+    n = 5000
+    lower = rng.choice([90.0, 100.0, 110.0], n)
+    upper = lower + 20
+    close = np.where(rng.random(n) < 0.5, lower * 1.01, upper * 0.99)
+    close[rng.random(n) < 0.1] = np.nan
+    df = pd.DataFrame({
+        'Close': close, 'Lower': lower, 'Upper': upper,
+        'RSI': rng.choice([10.0, 29.0, 30.0, 70.0, 71.0, 90.0, np.nan], n),
+        'ADX': rng.choice([10.0, 24.0, 25.0, 40.0, 50.0, 51.0, 60.0, 70.0, np.nan], n),
+        '+DI': rng.choice([10.0, 20.0, 30.0], n), '-DI': rng.choice([10.0, 20.0, 30.0], n),
+    })
+    expected = legacy_signals(df)
+    assert (expected == 1).any() and (expected == -1).any()
+    np.testing.assert_array_equal(precalculate_signals(df.copy())['Signal'].to_numpy(), expected)
+    np.testing.assert_array_equal(row_signals(df), expected)
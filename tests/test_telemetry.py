@@ -0,0 +1,24 @@
+import os
+from telemetry import Recorder
+
+def test_write_is_per_process_and_throttled(tmp_path):
+    recorder = Recorder()
+    with recorder.span("load_daily", cache="hit"): pass
+    now = [100.0]
+    clock = lambda: now[0]
+    assert recorder.write(str(tmp_path), min_interval=10, clock=clock)
+    pid = os.getpid()
+    assert sorted(os.listdir(tmp_path)) == [f"metrics.{pid}.json", f"metrics.{pid}.prom"]
+    assert f'stage="load_daily",pid="{pid}",result="hit"' in (tmp_path / f"metrics.{pid}.prom").read_text()
+    now[0] += 5
+    assert not recorder.write(str(tmp_path), min_interval=10, clock=clock)
+    now[0] += 6
+    assert recorder.write(str(tmp_path), min_interval=10, clock=clock)
+
+def test_files_of_dead_processes_are_removed(tmp_path):
+    dead = 2 ** 22 + 12345      # Lớn hơn pid_max mặc định -> chắc chắn không tồn tại
+    for ext in ("prom", "json"): (tmp_path / f"metrics.{dead}.{ext}").write_text("")
+    (tmp_path / "other.prom").write_text("")
+    Recorder().write(str(tmp_path), min_interval=0)
+    names = os.listdir(tmp_path)
+    assert f"metrics.{dead}.prom" not in names and "other.prom" in names and f"metrics.{os.getpid()}.prom" in names
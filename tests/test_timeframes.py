@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_ohlcv
+from timeframes import TimeframeCache, TimeframeSeries, PERIOD_FREQ, FRAME_COLUMNS
+
+def assert_same(frame, expected):
+    pd.testing.assert_index_equal(frame.index, expected.index)
+    np.testing.assert_allclose(frame[FRAME_COLUMNS].to_numpy(dtype=float), expected[FRAME_COLUMNS].to_numpy(dtype=float), rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(frame['Signal'].to_numpy(), expected['Signal'].to_numpy())
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+def test_incremental_matches_rebuild(timeframe):
+    daily = synthetic_ohlcv(900, seed=7)
+    cache = TimeframeCache()
+    for end in range(700, len(daily) + 1):
+        frame = cache.get("AAA.VN", timeframe, daily.iloc[:end])
+        if end % 25 == 0 or end == len(daily): assert_same(frame, TimeframeSeries.build(daily.iloc[:end], PERIOD_FREQ[timeframe]).frame)
+    assert cache.builds == 1 and cache.updates == len(daily) - 700
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+def test_revised_last_bar(timeframe):
+    # Nến ngày cuối đang chạy: cùng ngày nhưng giá thay đổi nhiều lần trong phiên
+    daily = synthetic_ohlcv(600, seed=8)
+    cache = TimeframeCache()
+    cache.get("AAA.VN", timeframe, daily)
+    for close in (0.95, 1.03, 1.10):
+        revised = daily.copy()
+        revised.iloc[-1, revised.columns.get_loc('Close')] *= close
+        revised.iloc[-1, revised.columns.get_loc('High')] = revised[['High', 'Close']].iloc[-1].max()
+        revised.iloc[-1, revised.columns.get_loc('Low')] = revised[['Low', 'Close']].iloc[-1].min()
+        assert_same(cache.get("AAA.VN", timeframe, revised), TimeframeSeries.build(revised, PERIOD_FREQ[timeframe]).frame)
+    assert cache.builds == 1
+
+def test_rewritten_history_triggers_rebuild():
+    daily = synthetic_ohlcv(600, seed=9)
+    cache = TimeframeCache()
+    cache.get("AAA.VN", "1wk", daily.iloc[:500])
+    # Nguồn dữ liệu bỏ mất phiên cuối của kỳ đã đóng gần nhất -> không nối tiếp được, phải dựng lại
+    last_closed = TimeframeSeries.build(daily.iloc[:500], "W-FRI").last_closed_date
+    shifted = daily[daily.index != last_closed]
+    frame = cache.get("AAA.VN", "1wk", shifted)
+    assert cache.builds == 2
+    assert_same(frame, TimeframeSeries.build(shifted, "W-FRI").frame)
+
+@pytest.mark.parametrize("timeframe", ["1wk", "1mo"])
+def test_adjusted_history_triggers_rebuild(timeframe):
+    # Chia tách cổ phiếu: kho dữ liệu tải lại cả lịch sử đã điều chỉnh (giá cũ giảm một nửa), cùng các mốc ngày
+    daily = synthetic_ohlcv(600, seed=10)
+    cache = TimeframeCache()
+    cache.get("AAA.VN", timeframe, daily.iloc[:-3])
+    adjusted = daily.copy()
+    adjusted[['Open', 'High', 'Low', 'Close']] /= 2
+    frame = cache.get("AAA.VN", timeframe, adjusted)
+    assert cache.builds == 2
+    assert_same(frame, TimeframeSeries.build(adjusted, PERIOD_FREQ[timeframe]).frame)
+    # Nến ngày cuối giữ nguyên như lần trước, chỉ lịch sử phía trước được điều chỉnh -> vẫn phải dựng lại
+    cache.get("AAA.VN", timeframe, daily)
+    same_last = adjusted.copy()
+    same_last.iloc[-1] = daily.iloc[-1]
+    assert_same(cache.get("AAA.VN", timeframe, same_last), TimeframeSeries.build(same_last, PERIOD_FREQ[timeframe]).frame)
+    assert cache.builds == 4
+
+def test_daily_passthrough():
+    daily = synthetic_ohlcv(100, seed=1)
+    assert TimeframeCache().get("AAA.VN", "1d", daily) is daily
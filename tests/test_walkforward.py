@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from benchmark import synthetic_ohlcv
+from engine import process_daily, run_backtest, FEE_RATE, EXIT_OPEN
+from walkforward import walk_forward, trade_cache, window_log_returns, windows, oos_equity
+
+LEVELS = [0.0, 3.0, 5.0, 7.0, 10.0]
+
+@pytest.fixture(scope="module", params=[0, 1])
+def daily(request):
+    return process_daily(synthetic_ohlcv(2500, seed=request.param))
+
+def brute_force(df, level, starts, ends):
+    # Từng cửa sổ: cộng log hệ số vốn của các lệnh (run_backtest) mở trong cửa sổ, lệnh vượt quá cửa sổ bán ở phiên cuối
+    closes = df['Close'].to_numpy(dtype=float)
+    trades = run_backtest(df, level)['trades']
+    out = np.zeros(len(starts))
+    for w, (start, end) in enumerate(zip(starts, ends)):
+        for t in trades[(trades['entry_idx'] >= start) & (trades['entry_idx'] < end)]:
+            exit_idx, sell_fee = t['exit_idx'], 0.0 if t['reason'] == EXIT_OPEN else FEE_RATE
+            if exit_idx >= end: exit_idx, sell_fee = end - 1, FEE_RATE
+            out[w] += np.log(closes[exit_idx] * (1 - sell_fee) / (closes[t['entry_idx']] * (1 + FEE_RATE)))
+    return out
+
+@pytest.mark.parametrize("in_sample,step", [(504, 126), (250, 60), (120, 37)])
+def test_window_returns_match_brute_force(daily, in_sample, step):
+    closes = daily['Close'].to_numpy(dtype=float)
+    _, cache = trade_cache(daily, LEVELS)
+    is_start, is_end, oos_start, oos_end = windows(len(daily), in_sample, step)
+    for starts, ends in ((is_start, is_end), (oos_start, oos_end)):
+        fast = window_log_returns(cache, closes, starts, ends)
+        slow = np.array([brute_force(daily, level, starts, ends) for level in LEVELS])
+        np.testing.assert_allclose(fast, slow, rtol=1e-9, atol=1e-12)
+
+def test_full_history_returns_match_backtest(daily):
+    full_returns, _ = trade_cache(daily, LEVELS)
+    np.testing.assert_allclose(full_returns, [run_backtest(daily, level)['metrics']['annual_return'] for level in LEVELS], rtol=1e-9)
+
+def test_equity_compounds_window_returns(daily):
+    closes = daily['Close'].to_numpy(dtype=float)
+    _, cache = trade_cache(daily, LEVELS)
+    is_start, is_end, oos_start, oos_end = windows(len(daily), 504, 126)
+    choices = np.argmax(window_log_returns(cache, closes, is_start, is_end), axis=0)
+    oos = window_log_returns(cache, closes, oos_start, oos_end)[choices, np.arange(len(choices))]
+    equity = oos_equity(cache, closes, choices, oos_start, oos_end)
+    assert len(equity) == oos_end[-1] - oos_start[0]
+    # Cuối mỗi cửa sổ ngoài mẫu, vốn = vốn đầu x tích các hệ số của những cửa sổ đã qua
+    np.testing.assert_allclose(equity[oos_end - 1 - oos_start[0]], 100_000_000 * np.exp(np.cumsum(oos)), rtol=1e-9)
+
+def test_walk_forward_picks_in_sample_best(daily):
+    result = walk_forward(daily, LEVELS, in_sample=504, step=126)
+    is_start, is_end, _, _ = windows(len(daily), 504, 126)
+    best = np.array([brute_force(daily, level, is_start, is_end) for level in LEVELS]).argmax(axis=0)
+    np.testing.assert_array_equal(result['windows']['stop_loss'].to_numpy(), np.asarray(LEVELS)[best])
+    assert result['metrics']['windows'] == len(is_start)
+    assert walk_forward(daily.iloc[:400], LEVELS, in_sample=504, step=126) is None
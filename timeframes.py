@@ -0,0 +1,133 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from engine import process_daily, compute_signals
+from indicator_state import IndicatorState
+
+# --- KHUNG THỜI GIAN TUẦN / THÁNG ---
+# Nến tuần / tháng gộp từ nến ngày, mỗi khung có bộ chỉ báo và tín hiệu riêng. Dựng đầy đủ một lần (pandas),
+# sau đó khi có nến ngày mới chỉ cập nhật gia tăng: các kỳ đã đóng được đẩy vào IndicatorState (O(1) mỗi kỳ),
+# kỳ đang chạy (tuần / tháng hiện tại) là nến tạm tính, tính lại từ các nến ngày của kỳ đó bằng preview().
+# Nhãn thời gian của mỗi nến là ngày giao dịch cuối cùng trong kỳ.
+# Giả định: lịch sử trước kỳ đang chạy chỉ bị sửa cả loạt (điều chỉnh giá sau chia tách, xem OHLCVStore._adjusted) -> so
+# OHLC của phiên ngày cuối cùng đã chốt; khác nhau, hoặc chuỗi ngày không nối tiếp được, thì dựng lại từ đầu.
+
+TIMEFRAMES = {"1d": "Ngày", "1wk": "Tuần", "1mo": "Tháng"}
+PERIOD_FREQ = {"1wk": "W-FRI", "1mo": "M"}
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close']
+INDICATOR_COLUMNS = ['SMA20', 'Upper', 'Lower', 'RSI', 'ADX', '+DI', '-DI']
+FRAME_COLUMNS = OHLC_COLUMNS + INDICATOR_COLUMNS
+
+def aggregate_ohlc(daily, freq):
+    keys = daily.index.to_period(freq)
+    grouped = daily[OHLC_COLUMNS].astype(float).groupby(keys, sort=True)
+    bars = grouped.agg({'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last'})
+    bars.index = pd.DatetimeIndex(pd.Series(daily.index, index=keys).groupby(level=0).last().values, name=daily.index.name)
+    return bars
+
+def _with_signals(frame, start):
+    # Tính lại tín hiệu cho các dòng từ vị trí start (cần 2 dòng trước đó để so sánh)
+    lo = max(start - 2, 0)
+    tail = frame.iloc[lo:]
+    arr = {col: tail[col].to_numpy(dtype=float) for col in ('Close', 'RSI', 'ADX', 'Lower', 'Upper', '+DI', '-DI')}
+    signals = compute_signals(arr['Close'], arr['RSI'], arr['ADX'], arr['Lower'], arr['Upper'], arr['+DI'], arr['-DI'])
+    if lo > 0: signals[:2] = frame['Signal'].to_numpy()[lo:lo + 2]   # Giữ nguyên tín hiệu của 2 dòng mồi
+    frame.iloc[lo:, frame.columns.get_loc('Signal')] = signals.astype(np.int8)
+    return frame
+
+def _ohlc(daily, pos):
+    return daily[OHLC_COLUMNS].iloc[pos].to_numpy(dtype=float)
+
+class TimeframeSeries:
+    def __init__(self, freq):
+        self.freq = freq
+        self.state = IndicatorState()    # Trạng thái sau kỳ đã đóng cuối cùng
+        self.closed = None               # Khung các kỳ đã đóng (OHLC + chỉ báo + Signal)
+        self.open_start = None           # Ngày giao dịch đầu tiên của kỳ đang chạy
+        self.last_closed_date = None
+        self.last_closed_ohlc = None     # OHLC của phiên ngày last_closed_date khi chốt kỳ
+        self.seen = None                 # (ngày cuối, giá đóng cửa cuối) của khung ngày đã áp dụng
+        self.frame = None
+
+    @classmethod
+    def build(cls, daily, freq):
+        series = cls(freq)
+        bars = aggregate_ohlc(daily, freq)
+        full = process_daily(bars.copy())
+        series.closed = full[FRAME_COLUMNS].iloc[:-1].assign(Signal=full['Signal'].iloc[:-1].astype(np.int8))
+        series.state = IndicatorState.from_frame(bars.iloc[:-1])
+        series.last_closed_date = bars.index[-2] if len(bars) > 1 else None
+        if series.last_closed_date is not None: series.last_closed_ohlc = _ohlc(daily, daily.index.get_loc(series.last_closed_date))
+        last_key = daily.index[-1].to_period(freq)
+        series.open_start = daily.index[daily.index.to_period(freq) == last_key][0]
+        series._set_open(daily[daily.index >= series.open_start])
+        series.seen = (daily.index[-1], float(daily['Close'].iloc[-1]))
+        return series
+
+    def _bar(self, period_daily, indicators):
+        # Một nến tuần / tháng từ các nến ngày của kỳ, kèm chỉ báo đã tính
+        row = {'Open': float(period_daily['Open'].iloc[0]), 'High': float(period_daily['High'].max()),
+               'Low': float(period_daily['Low'].min()), 'Close': float(period_daily['Close'].iloc[-1])}
+        row.update({col: indicators[col] for col in INDICATOR_COLUMNS})
+        bar = pd.DataFrame([row], index=pd.DatetimeIndex([period_daily.index[-1]], name=self.closed.index.name))
+        bar['Signal'] = np.int8(0)
+        return bar
+
+    @staticmethod
+    def _hlc(period_daily):
+        return float(period_daily['High'].max()), float(period_daily['Low'].min()), float(period_daily['Close'].iloc[-1])
+
+    def _set_open(self, period_daily):
+        bar = self._bar(period_daily, self.state.preview(*self._hlc(period_daily)))
+        self.frame = _with_signals(pd.concat([self.closed, bar]) if len(self.closed) else bar, len(self.closed))
+
+    def _close_period(self, period_daily):
+        bar = self._bar(period_daily, self.state.update(*self._hlc(period_daily), period_daily.index[-1]))
+        self.closed = _with_signals(pd.concat([self.closed, bar]) if len(self.closed) else bar, len(self.closed))
+        self.last_closed_date = period_daily.index[-1]
+        self.last_closed_ohlc = _ohlc(period_daily, -1)
+
+    def update(self, daily):
+        # Áp dụng nến ngày mới / nến ngày cuối đã sửa. Trả về False nếu không nối tiếp được (cần dựng lại)
+        pos = daily.index.searchsorted(self.open_start)
+        if pos >= len(daily) or daily.index[pos] != self.open_start: return False
+        if self.last_closed_date is not None:
+            if pos == 0 or daily.index[pos - 1] != self.last_closed_date: return False
+            if not np.array_equal(_ohlc(daily, pos - 1), self.last_closed_ohlc, equal_nan=True): return False   # Lịch sử đã bị điều chỉnh giá
+        seen = (daily.index[-1], float(daily['Close'].iloc[-1]))
+        if seen == self.seen: return True
+        tail = daily.iloc[pos:]
+        keys = tail.index.to_period(self.freq)
+        periods = keys.unique()
+        for key in periods[:-1]: self._close_period(tail[keys == key])
+        current = tail[keys == periods[-1]]
+        self.open_start = current.index[0]
+        self._set_open(current)
+        self.seen = seen
+        return True
+
+class TimeframeCache:
+    # Các khung tuần / tháng theo mã, dùng chung toàn tiến trình như DATA_CACHE. Khung trả về: KHÔNG sửa trực tiếp.
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = self.updates = 0
+
+    def get(self, symbol, timeframe, daily):
+        if timeframe == "1d": return daily
+        key = (symbol, timeframe)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None and series.update(daily):
+                self.updates += 1
+            else:
+                series = TimeframeSeries.build(daily, PERIOD_FREQ[timeframe])
+                self.builds += 1
+            self._series[key] = series
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_entries: self._series.popitem(last=False)
+            return series.frame
+
+TIMEFRAME_CACHE = TimeframeCache()
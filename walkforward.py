@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from engine import simulate_lanes, _day_ns, FEE_RATE, EXIT_OPEN, DEFAULT_SL_LEVELS
+from telemetry import timed
+
+# --- TỐI ƯU STOPLOSS KIỂU WALK-FORWARD ---
+# Chọn Stoploss trên cả lịch sử rồi chấm điểm trên chính lịch sử đó là nhìn trước tương lai. Ở đây Stoploss được
+# chọn lại trên từng cửa sổ trong mẫu (in_sample phiên) và chỉ được chấm trên cửa sổ ngoài mẫu ngay sau đó (step phiên);
+# cửa sổ trượt mỗi lần step phiên.
+# Không chạy lại mô phỏng cho từng cặp (cửa sổ, mức SL): mọi mức chạy MỘT lần trên cả lịch sử (simulate_lanes),
+# kết quả từng lệnh (log hệ số vốn) được lưu theo mức SL và cộng dồn; lợi nhuận một cửa sổ = hiệu hai tổng tích lũy
+# của các lệnh MỞ trong cửa sổ. Lệnh còn mở ở cuối cửa sổ coi như bán ở giá đóng cửa phiên cuối cửa sổ (có phí).
+# Vốn dồn toàn bộ vào mỗi lệnh (bỏ qua phần lẻ do làm tròn số cổ phiếu).
+
+WARMUP_BARS = 50
+TIE_TOL = 1e-9        # Dung sai log lợi nhuận khi so các mức SL
+
+def trade_cache(df, stop_loss_levels):
+    # Chạy mọi mức SL một lần; trả về (lợi nhuận cả lịch sử theo mức, danh sách theo mức: phiên mua, phiên bán,
+    # lệnh còn mở cuối dữ liệu, log hệ số vốn của lệnh, tổng tích lũy log hệ số).
+    # Lệnh của một mức không chồng lên nhau nên thứ tự phiên mua cũng là thứ tự phiên bán.
+    closes = df['Close'].to_numpy(dtype=float)
+    sim = simulate_lanes(closes, df['Signal'].values, _day_ns(df.index), stop_loss_levels, record_trades=True)
+    log = sim['trade_log']
+    sell_fee = np.where(log['reason'] == EXIT_OPEN, 0.0, FEE_RATE)
+    factors = np.log(closes[log['exit_idx']] * (1 - sell_fee) / (closes[log['entry_idx']] * (1 + FEE_RATE)))
+    cache = []
+    for lane in range(len(stop_loss_levels)):
+        mine = np.flatnonzero(log['lane'] == lane)
+        mine = mine[np.argsort(log['entry_idx'][mine], kind='stable')]
+        cache.append({'entry': log['entry_idx'][mine], 'exit': log['exit_idx'][mine], 'open': log['reason'][mine] == EXIT_OPEN,
+                      'log_factor': factors[mine], 'cumulative': np.concatenate([[0.0], np.cumsum(factors[mine])])})
+    return sim['annual_return'], cache
+
+def _clipped(trades, starts, ends):
+    # Các lệnh mở trong [start, end) của từng cửa sổ: (vị trí đầu, vị trí cuối, lệnh cuối có vượt qua end hay không)
+    lo = np.searchsorted(trades['entry'], starts, side='left')
+    hi = np.searchsorted(trades['entry'], ends, side='left')
+    last = np.maximum(hi - 1, 0)
+    crosses = (hi > lo) & (trades['exit'][last] >= ends) if len(trades['entry']) else np.zeros(len(starts), dtype=bool)
+    return lo, hi, last, crosses
+
+def window_log_returns(cache, closes, starts, ends):
+    # Log lợi nhuận (mức SL x cửa sổ) của các lệnh mở trong [start, end), cắt ở phiên end - 1
+    out = np.zeros((len(cache), len(starts)))
+    for k, trades in enumerate(cache):
+        if not len(trades['entry']): continue
+        lo, hi, last, crosses = _clipped(trades, starts, ends)
+        total = trades['cumulative'][hi] - trades['cumulative'][lo]
+        clip_factor = np.log(closes[ends - 1] * (1 - FEE_RATE) / (closes[trades['entry'][last]] * (1 + FEE_RATE)))
+        out[k] = np.where(crosses, total - trades['log_factor'][last] + clip_factor, total)
+    return out
+
+def windows(n_bars, in_sample, step, start=WARMUP_BARS):
+    # Cửa sổ trong mẫu [s, s + in_sample) và ngoài mẫu [s + in_sample, s + in_sample + step), cửa sổ cuối có thể ngắn hơn
+    is_start = np.arange(start, n_bars - in_sample, step)
+    is_end = is_start + in_sample
+    return is_start, is_end, is_end, np.minimum(is_end + step, n_bars)
+
+def _years(index, starts, ends):
+    day_ns = _day_ns(index)
+    days = (day_ns[ends - 1] - day_ns[starts]) // 86_400_000_000_000
+    return np.where(days > 0, days / 365.25, 1.0)
+
+def oos_equity(cache, closes, choices, starts, ends, initial_capital=100_000_000):
+    # Đường vốn theo từng phiên trên các cửa sổ ngoài mẫu: cửa sổ w dùng các lệnh của mức SL choices[w]
+    n_bars = len(closes)
+    daily = np.zeros(n_bars)
+    daily[1:] = np.log(closes[1:] / closes[:-1])
+    held = np.zeros(n_bars + 1)
+    fees = np.zeros(n_bars)
+    for k in np.unique(choices):
+        trades = cache[k]
+        if not len(trades['entry']): continue
+        sel = choices == k
+        lo, hi, _, _ = _clipped(trades, starts[sel], ends[sel])
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(lo, hi)]).astype(np.int64)
+        if not len(idx): continue
+        window_end = np.repeat(ends[sel], hi - lo) - 1
+        entry = trades['entry'][idx]
+        exit_ = np.minimum(trades['exit'][idx], window_end)
+        no_sell_fee = trades['open'][idx] & (trades['exit'][idx] <= window_end)   # Lệnh còn mở cuối dữ liệu: như run_simulation
+        np.add.at(held, entry + 1, 1)
+        np.add.at(held, exit_ + 1, -1)
+        np.add.at(fees, entry, np.log(1 / (1 + FEE_RATE)))
+        np.add.at(fees, exit_, np.where(no_sell_fee, 0.0, np.log(1 - FEE_RATE)))
+    in_position = np.cumsum(held)[:n_bars] > 0
+    log_equity = np.cumsum(np.where(in_position, daily, 0.0) + fees)
+    first = starts[0]
+    return initial_capital * np.exp(log_equity[first:ends[-1]] - (log_equity[first - 1] if first > 0 else 0.0))
+
+@timed()
+def walk_forward(df, stop_loss_levels=None, in_sample=504, step=126):
+    # df: khung đã có Signal. Trả về dict: windows (DataFrame từng cửa sổ), equity / static_equity (Series ngoài mẫu:
+    # walk-forward và mức SL tối ưu trên cả lịch sử - có nhìn trước), metrics
+    levels = np.asarray(DEFAULT_SL_LEVELS if stop_loss_levels is None else stop_loss_levels, dtype=float)
+    closes = df['Close'].to_numpy(dtype=float)
+    is_start, is_end, oos_start, oos_end = windows(len(df), in_sample, step)
+    if not len(is_start) or len(df) < WARMUP_BARS: return None
+
+    full_returns, cache = trade_cache(df, levels)
+    in_sample_log = window_log_returns(cache, closes, is_start, is_end)
+    # Mức đầu tiên đạt lợi nhuận cao nhất, như optimize_stoploss. Hiệu hai tổng tích lũy lệch vài ulp giữa các mức có
+    # cùng tập lệnh trong cửa sổ -> so với dung sai, không thì chọn mức ngẫu nhiên trong nhóm bằng nhau
+    choices = np.argmax(in_sample_log >= in_sample_log.max(axis=0) - TIE_TOL, axis=0)
+    oos_log = window_log_returns(cache, closes, oos_start, oos_end)
+    static = int(np.argmax(full_returns))
+    n_windows = len(is_start)
+    col = np.arange(n_windows)
+
+    table = pd.DataFrame({
+        'is_start': df.index[is_start], 'oos_start': df.index[oos_start], 'oos_end': df.index[oos_end - 1],
+        'stop_loss': levels[choices],
+        'is_return': np.expm1(in_sample_log[choices, col]) * 100 / _years(df.index, is_start, is_end),
+        'oos_return': np.expm1(oos_log[choices, col]) * 100 / _years(df.index, oos_start, oos_end),
+        'static_oos_return': np.expm1(oos_log[static]) * 100 / _years(df.index, oos_start, oos_end),
+    })
+    index = df.index[oos_start[0]:oos_end[-1]]
+    equity = pd.Series(oos_equity(cache, closes, choices, oos_start, oos_end), index=index)
+    static_equity = pd.Series(oos_equity(cache, closes, np.full(n_windows, static), oos_start, oos_end), index=index)
+    years = _years(df.index, oos_start[:1], oos_end[-1:])[0]
+    metrics = {
+        'windows': n_windows,
+        'oos_annual_return': float((equity.iloc[-1] / 100_000_000 - 1) * 100 / years),
+        'static_stoploss': float(levels[static]),
+        'static_oos_annual_return': float((static_equity.iloc[-1] / 100_000_000 - 1) * 100 / years),
+        'changes': int((np.diff(choices) != 0).sum()),
+        'last_stoploss': float(levels[choices[-1]]),
+    }
+    return {'windows': table, 'equity': equity, 'static_equity': static_equity, 'metrics': metrics}